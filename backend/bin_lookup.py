@@ -0,0 +1,212 @@
+import threading
+from collections import namedtuple
+from name_matching import TrigramIndex, normalize_name
+
+# The whole Item -> Bin mapping is a few hundred rows, so it is cheaper to keep
+# it in memory and answer exact matches locally than to open a Neo4j session
+# for every request.
+MAPPING_QUERY = """
+MATCH (i:Item)-[:SHOULD_GO_IN]->(b:Bin)
+RETURN i.name AS name, b.type AS bin_type
+"""
+
+# Loaders bump this stamp after every ingest so running servers know to reload.
+DATASET_VERSION_QUERY = """
+OPTIONAL MATCH (v:DatasetVersion {name: 'catalog'})
+RETURN v.version AS version
+"""
+
+BUMP_DATASET_VERSION_QUERY = """
+MERGE (v:DatasetVersion {name: 'catalog'})
+SET v.version = coalesce(v.version, 0) + 1, v.updated_at = timestamp()
+RETURN v.version AS version
+"""
+
+
+# bin_ids and normalized_ids map names to an index into bin_types
+_Table = namedtuple("_Table", ["bin_ids", "bin_types", "normalized_ids", "trigram_index"])
+
+
+def bump_dataset_version(session):
+    """
+    Mark the catalog as changed so that BinLookupTable instances reload it.
+    """
+    record = session.run(BUMP_DATASET_VERSION_QUERY).single()
+    return record["version"] if record else None
+
+
+class BinLookupTable:
+    """
+    Compact in-memory copy of the Item -> Bin mapping stored in Neo4j.
+
+    Item names map to a small integer index into a tuple of bin types, so the
+    few distinct bin strings are stored once. A normalized-name map and a
+    trigram index sit beside the exact map for near-miss names. Reloads build
+    a new table and swap it in with a single assignment, which keeps readers
+    lock-free.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.version = None
+        # False while the table is empty or seeded from a snapshot, so refreshes
+        # keep trying Neo4j even when neither side has a dataset version stamp
+        self.loaded_from_db = False
+        self._table = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self._table is not None
+
+    def __len__(self):
+        return len(self._table.bin_ids) if self._table else 0
+
+    @property
+    def bin_types(self):
+        return self._table.bin_types if self._table else ()
+
+    def get(self, object_name):
+        """
+        Return the bin type for an exact item name, or None if it is unknown.
+        """
+        table = self._table
+        if table is None:
+            return None
+        bin_id = table.bin_ids.get(object_name)
+        return table.bin_types[bin_id] if bin_id is not None else None
+
+    def match(self, object_name, threshold=0.8):
+        """
+        Resolve a free-text name to a bin type without leaving the process.
+
+        Tries the exact name, then its normalized form, then the closest
+        normalized item name by trigram similarity. Returns
+        (bin_type, matched_name, score) or None when nothing scores at least
+        `threshold`.
+        """
+        table = self._table
+        if table is None:
+            return None
+        bin_id = table.bin_ids.get(object_name)
+        if bin_id is not None:
+            return table.bin_types[bin_id], object_name, 1.0
+
+        normalized = normalize_name(object_name)
+        bin_id = table.normalized_ids.get(normalized)
+        if bin_id is not None:
+            return table.bin_types[bin_id], normalized, 1.0
+
+        best = table.trigram_index.best_match(normalized, threshold)
+        if best is None:
+            return None
+        matched_name, score = best
+        return table.bin_types[table.normalized_ids[matched_name]], matched_name, score
+
+    def fetch_version(self):
+        with self.driver.session() as session:
+            record = session.run(DATASET_VERSION_QUERY).single()
+            return record["version"] if record else None
+
+    def load(self):
+        """
+        Read the full mapping and the dataset version stamp from Neo4j.
+        """
+        with self.driver.session() as session:
+            record = session.run(DATASET_VERSION_QUERY).single()
+            version = record["version"] if record else None
+            rows = [(record["name"], record["bin_type"]) for record in session.run(MAPPING_QUERY)]
+        self.replace(rows, version)
+        self.loaded_from_db = True
+        print(f"Loaded {len(rows)} item bins (dataset version {version}).")
+
+    async def aload(self, async_driver):
+        """
+        Same as load(), through the async driver so startup does not block the event loop.
+        """
+        async with async_driver.session() as session:
+            result = await session.run(DATASET_VERSION_QUERY)
+            record = await result.single()
+            version = record["version"] if record else None
+            result = await session.run(MAPPING_QUERY)
+            rows = [(record["name"], record["bin_type"]) async for record in result]
+        self.replace(rows, version)
+        self.loaded_from_db = True
+        print(f"Loaded {len(rows)} item bins (dataset version {version}).")
+
+    def replace(self, rows, version=None, normalized_names=None):
+        """
+        Swap in a new mapping built from (item name, bin type) pairs.
+        `normalized_names`, aligned with rows, skips recomputing them (snapshots store them).
+        """
+        bin_ids = {}
+        normalized_ids = {}
+        bin_types = []
+        bin_index = {}
+        rows = list(rows)
+        if normalized_names is None:
+            normalized_names = [normalize_name(name) for name, _ in rows]
+        for (name, bin_type), normalized in zip(rows, normalized_names):
+            if bin_type not in bin_index:
+                bin_index[bin_type] = len(bin_types)
+                bin_types.append(bin_type)
+            bin_ids[name] = bin_index[bin_type]
+            # The first item wins when two names normalize to the same string
+            normalized_ids.setdefault(normalized, bin_index[bin_type])
+        self._table = _Table(bin_ids, tuple(bin_types), normalized_ids, TrigramIndex(normalized_ids))
+        self.version = version
+
+    def add(self, name, bin_type):
+        """
+        Insert a single item into the live table without a full reload.
+        """
+        table = self._table
+        if table is None:
+            return
+        if bin_type not in table.bin_types:
+            table = table._replace(bin_types=table.bin_types + (bin_type,))
+            self._table = table
+        bin_id = table.bin_types.index(bin_type)
+        table.bin_ids[name] = bin_id
+        normalized = normalize_name(name)
+        if normalized not in table.normalized_ids:
+            table.normalized_ids[normalized] = bin_id
+            table.trigram_index.add(normalized)
+
+    def refresh_if_stale(self):
+        """
+        Reload the mapping if the dataset version stamp has changed, or if it
+        has not been read from Neo4j yet. Returns True when a reload happened.
+        """
+        version = self.fetch_version()
+        if self.loaded_from_db and version == self.version:
+            return False
+        self.load()
+        return True
+
+    def start_background_refresh(self, interval=60.0):
+        """
+        Poll the dataset version stamp every `interval` seconds on a daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop, args=(interval,), name="bin-lookup-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _refresh_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh_if_stale()
+            except Exception as e:
+                # Keep serving the last good table if Neo4j is unreachable.
+                print(f"Bin lookup refresh failed: {e}")
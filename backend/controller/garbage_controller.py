@@ -1,12 +1,20 @@
-from typing import Dict
+from typing import Any, Dict, List
 from fastapi import APIRouter, HTTPException
-from model.garbage_model import classify_object
-from pydantic import BaseModel
+from model.garbage_model import classify_object, classify_objects
+from pydantic import BaseModel, ValidationError
 
 class GarbageRequest(BaseModel):
     object_name: str
     probability: float
 
+class BatchGarbageRequest(BaseModel):
+    # Items are validated one by one in the handler, so a single malformed
+    # item gets its own error instead of a 422 for the whole batch
+    items: List[Any]
+
+# Upper bound on labels per batch request, to keep the single LLM call small
+MAX_BATCH_SIZE = 100
+
 router = APIRouter()
 
 @router.post("/classify")
@@ -27,4 +35,41 @@ async def classify(garbageRequest: GarbageRequest):
     # Classify the object
     result: Dict[str, str] = await classify_object(object_name)
 
-    return result
\ No newline at end of file
+    return result
+
+@router.post("/classify/batch")
+async def classify_batch(batchRequest: BatchGarbageRequest):
+    """
+    Classify many detected objects in one request.
+    Items that fail validation or classification get a per-item error
+    instead of failing the whole batch.
+    """
+    items = batchRequest.items
+    if not items:
+        raise HTTPException(status_code=400, detail="Invalid Request")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+    results: List[Dict[str, str]] = [None] * len(items)
+    valid_names = []
+    valid_positions = []
+    for position, raw_item in enumerate(items):
+        try:
+            item = GarbageRequest.model_validate(raw_item)
+        except ValidationError:
+            object_name = raw_item.get("object_name") if isinstance(raw_item, dict) else None
+            results[position] = {"object_name": object_name, "error": "Invalid Request"}
+            continue
+        if not item.object_name:
+            results[position] = {"object_name": item.object_name, "error": "Invalid Request"}
+        elif item.probability < 0.5:
+            results[position] = {"object_name": item.object_name, "error": "Probability must be at least 0.5"}
+        else:
+            valid_names.append(item.object_name)
+            valid_positions.append(position)
+
+    if valid_names:
+        for position, result in zip(valid_positions, await classify_objects(valid_names)):
+            results[position] = result
+
+    return {"results": results}
@@ -0,0 +1,149 @@
+import os
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from neo4j.exceptions import ClientError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Neo4j connection settings, shared by the app, the loaders and the index builders
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "testpassword")
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "1000"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10"))
+
+# Uniqueness constraints back every exact-name lookup with an index, so MERGE in
+# the loaders and MATCH on the request path are index seeks instead of label scans.
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT item_name_unique IF NOT EXISTS FOR (i:Item) REQUIRE i.name IS UNIQUE",
+    "CREATE CONSTRAINT bin_type_unique IF NOT EXISTS FOR (b:Bin) REQUIRE b.type IS UNIQUE",
+    "CREATE CONSTRAINT dataset_version_name_unique IF NOT EXISTS FOR (v:DatasetVersion) REQUIRE v.name IS UNIQUE",
+]
+
+# Databases filled by the original loaders, which CREATEd a Bin node per row, hold
+# duplicate Bin (and, after a re-run, Item) nodes that the constraints above refuse.
+# Duplicates are folded into the first node of each name: their SHOULD_GO_IN edges
+# are moved over and they are deleted. Bins go first, so the Item pass sees one
+# node per bin; an Item left with edges to two bins is fixed by the next load.
+DEDUPE_BINS_QUERY = """
+MATCH (b:Bin) WHERE b.type IS NOT NULL
+WITH b.type AS type, collect(b) AS bins WHERE size(bins) > 1
+WITH head(bins) AS keep, tail(bins) AS duplicates
+UNWIND duplicates AS duplicate
+OPTIONAL MATCH (i:Item)-[:SHOULD_GO_IN]->(duplicate)
+FOREACH (_ IN CASE WHEN i IS NULL THEN [] ELSE [1] END | MERGE (i)-[:SHOULD_GO_IN]->(keep))
+WITH DISTINCT duplicate
+DETACH DELETE duplicate
+RETURN count(*) AS merged
+"""
+
+DEDUPE_ITEMS_QUERY = """
+MATCH (i:Item) WHERE i.name IS NOT NULL
+WITH i.name AS name, collect(i) AS items WHERE size(items) > 1
+WITH head(items) AS keep, tail(items) AS duplicates
+UNWIND duplicates AS duplicate
+OPTIONAL MATCH (duplicate)-[:SHOULD_GO_IN]->(b:Bin)
+FOREACH (_ IN CASE WHEN b IS NULL THEN [] ELSE [1] END | MERGE (keep)-[:SHOULD_GO_IN]->(b))
+WITH DISTINCT keep, duplicate
+SET keep.embedding = coalesce(keep.embedding, duplicate.embedding)
+DETACH DELETE duplicate
+RETURN count(*) AS merged
+"""
+
+_driver = None
+_async_driver = None
+
+
+def driver_config():
+    return {
+        "auth": (NEO4J_USER, NEO4J_PASSWORD),
+        "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+        "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+        "fetch_size": NEO4J_FETCH_SIZE,
+    }
+
+
+def get_driver():
+    """
+    Return the process-wide synchronous driver, creating it on first use.
+    Used by scripts and background threads; creating it does not connect.
+    """
+    global _driver
+    if _driver is None:
+        _driver = GraphDatabase.driver(NEO4J_URI, **driver_config())
+    return _driver
+
+
+async def open_async_driver():
+    """
+    Create the async driver used on the request path. Called from the FastAPI lifespan.
+    """
+    global _async_driver
+    if _async_driver is None:
+        _async_driver = AsyncGraphDatabase.driver(NEO4J_URI, **driver_config())
+    return _async_driver
+
+
+def get_async_driver():
+    """
+    Return the async driver, or None when the app has not opened one.
+    """
+    return _async_driver
+
+
+async def close_async_driver():
+    global _async_driver
+    if _async_driver is not None:
+        await _async_driver.close()
+        _async_driver = None
+
+
+def dedupe_catalog(session):
+    """
+    Merge duplicate Bin and Item nodes so the uniqueness constraints can be
+    created. Returns (bins merged, items merged).
+    """
+    bins = session.run(DEDUPE_BINS_QUERY).single()["merged"]
+    items = session.run(DEDUPE_ITEMS_QUERY).single()["merged"]
+    if bins or items:
+        print(f"Merged {bins} duplicate Bin and {items} duplicate Item nodes.")
+    return bins, items
+
+
+def ensure_schema(session, dedupe=False):
+    """
+    Create the catalog constraints (and their backing indexes) if they are missing.
+    Loaders call this before writing, with dedupe=True so duplicates left by the
+    original loaders are merged first; it is a no-op on an already prepared
+    database. Raises RuntimeError when existing duplicate nodes block a constraint.
+    """
+    if dedupe:
+        dedupe_catalog(session)
+    for query in SCHEMA_QUERIES:
+        try:
+            session.run(query).consume()
+        except ClientError as e:
+            if e.code != "Neo.ClientError.Schema.ConstraintCreationFailed":
+                raise
+            raise RuntimeError(
+                f"Cannot create a catalog constraint because the database holds duplicate nodes ({e.message}). "
+                "Merge them with `python db.py dedupe` and run the load again."
+            ) from e
+
+
+def close_driver():
+    global _driver
+    if _driver is not None:
+        _driver.close()
+        _driver = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["dedupe"]:
+        sys.exit("usage: python db.py dedupe")
+    with get_driver().session() as session:
+        ensure_schema(session, dedupe=True)
+    close_driver()
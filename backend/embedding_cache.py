@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text):
+    """
+    Light normalization for cache keys: case and whitespace only, so that the
+    text that gets embedded still means exactly what the caller asked for.
+    """
+    return " ".join((text or "").lower().split())
+
+
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (normalized text, model).
+
+    Lookups go to an in-process LRU first and then to a SQLite file that
+    survives restarts. Pass path=None to keep the cache in memory only.
+    Every uvicorn worker opens the same file, so it runs in WAL mode and
+    writers wait up to `timeout` seconds for each other. The a* methods
+    answer memory hits inline and do the SQLite work on a thread, for
+    callers on the event loop.
+    """
+
+    def __init__(self, path=None, capacity=4096, timeout=30.0):
+        self.path = path
+        self.capacity = capacity
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        # The LRU lock is never held across SQLite work, so event-loop callers
+        # answering from memory never wait on a disk read or a busy writer
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def get(self, text, model):
+        """
+        Return the cached embedding as a list of floats, or None on a miss.
+        """
+        return self.get_many([text], model)[0]
+
+    def get_many(self, texts, model):
+        """
+        get() for several texts, with one SQLite lookup for all memory misses.
+        """
+        return self._read_disk(*self._read_memory(texts, model))
+
+    async def aget_many(self, texts, model):
+        embeddings, missing = self._read_memory(texts, model)
+        if missing and self._db is not None:
+            return await asyncio.to_thread(self._read_disk, embeddings, missing)
+        return self._read_disk(embeddings, missing)
+
+    async def aget(self, text, model):
+        return (await self.aget_many([text], model))[0]
+
+    def put(self, text, model, embedding):
+        """
+        Store an embedding and return it as the float32 values later hits will return.
+        """
+        return self.put_many([text], model, [embedding])[0]
+
+    def put_many(self, texts, model, embeddings):
+        """
+        put() for several texts, with one SQLite commit.
+        """
+        rows = self._write_memory(texts, model, embeddings)
+        self._write_disk(rows)
+        return [vector.tolist() for _, _, _, vector in rows]
+
+    async def aput_many(self, texts, model, embeddings):
+        rows = self._write_memory(texts, model, embeddings)
+        if self._db is not None:
+            await asyncio.to_thread(self._write_disk, rows)
+        return [vector.tolist() for _, _, _, vector in rows]
+
+    async def aput(self, text, model, embedding):
+        return (await self.aput_many([text], model, [embedding]))[0]
+
+    def get_or_create(self, text, model, embed):
+        """
+        Return the cached embedding for `text`, calling `embed(normalized_text)`
+        and caching its result on a miss.
+        """
+        embedding = self.get(text, model)
+        if embedding is None:
+            embedding = self.put(text, model, embed(normalize_text(text)))
+        return embedding
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def _read_memory(self, texts, model):
+        # Returns the embeddings found in the LRU (None elsewhere) and {key: positions} of the rest
+        embeddings = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for position, text in enumerate(texts):
+                key = cache_key(text, model)
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    embeddings[position] = vector.tolist()
+                else:
+                    missing.setdefault(key, []).append(position)
+        return embeddings, missing
+
+    def _read_disk(self, embeddings, missing):
+        found = {}
+        if self._db is not None and missing:
+            keys = list(missing)
+            with self._db_lock:
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    found.update(self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall())
+        with self._lock:
+            for key, positions in missing.items():
+                if key in found:
+                    vector = np.frombuffer(found[key], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += len(positions)
+                    for position in positions:
+                        embeddings[position] = vector.tolist()
+                else:
+                    self.misses += len(positions)
+        return embeddings
+
+    def _write_memory(self, texts, model, embeddings):
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = cache_key(text, model)
+                vector = np.asarray(embedding, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model, normalize_text(text), vector))
+        return rows
+
+    def _write_disk(self, rows):
+        if self._db is None or not rows:
+            return
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, text, vector) VALUES (?, ?, ?, ?)",
+                [(key, model, text, vector.tobytes()) for key, model, text, vector in rows],
+            )
+            self._db.commit()
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
@@ -1,8 +1,15 @@
 import openai
-from neo4j import GraphDatabase
+from db import ensure_schema, get_driver
 from dotenv import load_dotenv
 import csv
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from bin_lookup import bump_dataset_version
+from embedding_cache import EmbeddingCache, normalize_text
+from name_matching import normalize_name
+from vector_store import get_vector_store
 
 # Load the .env file
 load_dotenv()
@@ -10,46 +17,193 @@ load_dotenv()
 # Get the OPENAI_API_KEY environment variable
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Neo4j connection setup
-uri = "bolt://localhost:7687"
-driver = GraphDatabase.driver(uri, auth=("neo4j", "testpassword"))
+# Shared, pooled Neo4j driver (see db.py for connection settings)
+driver = get_driver()
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Same cache file as the query path, so re-running an ingest does not re-embed known items
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH or None)
+
+# Ingestion settings: items per embeddings call / write transaction, and embeddings calls in flight
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "256"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint.json")
+
+# Curated rows are authoritative: they clear any provisional (learned) flags and
+# replace whatever bin edge the item had before. Embeddings live in the vector
+# store, so any copy left on the node from older loads is dropped.
+STORE_ITEMS_QUERY = """
+UNWIND $rows AS row
+MERGE (i:Item {name: row.name})
+SET i.source = 'catalog'
+REMOVE i.provisional, i.confidence, i.embedding
+MERGE (b:Bin {type: row.bin_type})
+WITH i, b
+OPTIONAL MATCH (i)-[old:SHOULD_GO_IN]->(other:Bin)
+WHERE other <> b
+DELETE old
+WITH DISTINCT i, b
+MERGE (i)-[:SHOULD_GO_IN]->(b)
+"""
+
+DELETE_ITEMS_QUERY = """
+UNWIND $names AS name
+MATCH (i:Item {name: name})
+DETACH DELETE i
+"""
 
 # Function to generate embedding using OpenAI
 def generate_embedding(item_name):
-    # Call the OpenAI API to create an embedding
-    response = openai.embeddings.create(
-        input=item_name,  # The text to embed (item name)
-        model="text-embedding-ada-002"  # Model to use for embedding
-    )
-    return response.data[0].embedding
+    def embed(text):
+        # Call the OpenAI API to create an embedding
+        response = openai.embeddings.create(
+            input=text,  # The text to embed (item name)
+            model=EMBEDDING_MODEL  # Model to use for embedding
+        )
+        return response.data[0].embedding
+
+    return embedding_cache.get_or_create(item_name, EMBEDDING_MODEL, embed)
+
+def generate_embeddings(item_names):
+    """
+    Embed a chunk of names, sending every cache miss to the API in one list-input call.
+    Returns a list of embeddings aligned with item_names.
+    """
+    embeddings = [embedding_cache.get(name, EMBEDDING_MODEL) for name in item_names]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        response = openai.embeddings.create(
+            input=[normalize_text(item_names[i]) for i in missing],
+            model=EMBEDDING_MODEL
+        )
+        for i, data in zip(missing, sorted(response.data, key=lambda d: d.index)):
+            embeddings[i] = embedding_cache.put(item_names[i], EMBEDDING_MODEL, data.embedding)
+    return embeddings
 
 # Function to store the item and embedding in Neo4j
 def store_in_neo4j(item_name, bin_type, embedding):
+    store_batch_in_neo4j([(item_name, bin_type, embedding)])
+
+def store_batch_in_neo4j(items):
+    """
+    Store (item_name, bin_type, embedding) rows: vectors go to the vector store,
+    then the graph is written in one UNWIND transaction. Items and bins are
+    merged, so re-running a load never duplicates nodes.
+    """
+    get_vector_store().put_many([name for name, _, _ in items],
+                                [embedding for _, _, embedding in items])
+    rows = [{"name": name, "bin_type": bin_type} for name, bin_type, _ in items]
     with driver.session() as session:
-        # Run the Cypher query to create nodes and relationships
-        session.run("""
-        CREATE (i:Item {name: $item_name, embedding: $embedding})
-        CREATE (b:Bin {type: $bin_type})
-        CREATE (i)-[:SHOULD_GO_IN]->(b)
-        """, item_name=item_name, bin_type=bin_type, embedding=embedding)
+        session.execute_write(lambda tx: tx.run(STORE_ITEMS_QUERY, rows=rows).consume())
 
-# Main function to load data from CSV and process
-def process_csv_and_store(csv_file):
+def delete_items(item_names):
+    """
+    Remove items from the catalog: their nodes go from Neo4j and their vectors
+    from the vector store, whose change feed carries the deletion to the index.
+    Returns the ids of the deleted vectors.
+    """
+    with driver.session() as session:
+        session.execute_write(lambda tx: tx.run(DELETE_ITEMS_QUERY, names=list(item_names)).consume())
+        bump_dataset_version(session)
+    return get_vector_store().delete(item_names)
+
+def read_catalog(csv_file):
+    """
+    Lazily yield (item_name, bin_type) rows from the catalog CSV, skipping
+    rows whose normalized name has already been seen.
+    """
+    seen = set()
     with open(csv_file, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            item_name = row['item_name']  # Name of the item
-            bin_type = row['bin_type']  # Bin type (recyclable, compost, etc.)
-            
-            # Generate embedding for the item name
-            embedding = generate_embedding(item_name)
-            if embedding:
-                # Store the item, bin, and embedding in Neo4j
-                store_in_neo4j(item_name, bin_type, embedding)
-                print(f"Stored item '{item_name}' with embedding in Neo4j.")
-            else:
-                print(f"Failed to generate embedding for '{item_name}'.")
-
-# Example usage:
-csv_file_path = "./neo4j/final_cleaned_dataset.csv"  # Path to your CSV file
-process_csv_and_store(csv_file_path)
\ No newline at end of file
+        for row in csv.DictReader(file):
+            item_name = (row.get('item_name') or '').strip()
+            bin_type = (row.get('bin_type') or '').strip()
+            key = normalize_name(item_name)
+            if not key or not bin_type or key in seen:
+                continue
+            seen.add(key)
+            yield item_name, bin_type
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def load_checkpoint(checkpoint_path, csv_file):
+    """
+    Return how many catalog items a previous run of this CSV already stored.
+    """
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, 'r') as file:
+        checkpoint = json.load(file)
+    if checkpoint.get("csv_file") != os.path.abspath(csv_file):
+        return 0
+    return checkpoint.get("items_done", 0)
+
+def save_checkpoint(checkpoint_path, csv_file, items_done):
+    if not checkpoint_path:
+        return
+    # Write then rename, so a crash mid-write never leaves a corrupt checkpoint
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump({"csv_file": os.path.abspath(csv_file), "items_done": items_done}, file)
+    os.replace(tmp_path, checkpoint_path)
+
+# Main function to load data from CSV and process
+def process_csv_and_store(csv_file, chunk_size=INGEST_CHUNK_SIZE, concurrency=INGEST_CONCURRENCY,
+                          checkpoint_path=INGEST_CHECKPOINT_PATH):
+    """
+    Stream the catalog into Neo4j in chunks: one embeddings call and one write
+    transaction per chunk, with up to `concurrency` embeddings calls in flight.
+    Chunks are written in order and checkpointed, so a failed run resumes after
+    the last stored chunk. Returns the number of items stored by this run.
+    """
+    # Duplicates from the original loader are merged and constraints created first,
+    # so every MERGE in the batches is an index seek
+    with driver.session() as session:
+        ensure_schema(session, dedupe=True)
+
+    items_done = load_checkpoint(checkpoint_path, csv_file)
+    if items_done:
+        print(f"Resuming ingestion of {csv_file} after {items_done} items.")
+
+    chunks = chunked(islice(read_catalog(csv_file), items_done, None), chunk_size)
+    stored = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = []
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                in_flight.append((chunk, executor.submit(generate_embeddings, [name for name, _ in chunk])))
+
+        for _ in range(concurrency):
+            submit_next()
+        while in_flight:
+            chunk, future = in_flight.pop(0)
+            embeddings = future.result()
+            submit_next()
+
+            store_batch_in_neo4j([(name, bin_type, embedding)
+                                  for (name, bin_type), embedding in zip(chunk, embeddings)])
+            stored += len(chunk)
+            items_done += len(chunk)
+            save_checkpoint(checkpoint_path, csv_file, items_done)
+            print(f"Stored {items_done} items in Neo4j.")
+
+    # Tell running servers to reload their in-memory bin table
+    with driver.session() as session:
+        bump_dataset_version(session)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return stored
+
+if __name__ == "__main__":
+    csv_file_path = "./neo4j/final_cleaned_dataset.csv"  # Path to your CSV file
+    process_csv_and_store(csv_file_path)
@@ -1,31 +1,211 @@
 import os
+import sys
+import time
 import faiss
 import numpy as np
-from neo4j import GraphDatabase
+from bin_lookup import DATASET_VERSION_QUERY
+from db import get_driver
+from index_factory import (FAISS_INDEX_TYPE, FAISS_METRIC, build_index, configure_search, create_index,
+                           metric_type, prepare_vectors, resolve_index_spec, training_size)
+from mapped_index import MappedFlatIndex
+from snapshot import SNAPSHOT_DIR, Snapshot, current_version, load_snapshot, write_snapshot
+from vector_store import get_vector_store
 
-# Neo4j connection setup
-uri = "bolt://localhost:7687"
-driver = GraphDatabase.driver(uri, auth=("neo4j", "testpassword"))
+# Shared, pooled Neo4j driver (see db.py for connection settings)
+driver = get_driver()
 
-def get_all_embeddings():
+# Recorded in every snapshot; must match the model the query path embeds with
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Items fetched per round trip when exporting embeddings
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+# How often the follower applies the vector store's change feed to the snapshot, and
+# how many changed items it applies in place before rebuilding (and re-training) instead
+INDEX_UPDATE_INTERVAL = float(os.getenv("INDEX_UPDATE_INTERVAL", "5"))
+INDEX_COMPACT_CHANGES = int(os.getenv("INDEX_COMPACT_CHANGES", "50000"))
+
+COUNT_EMBEDDINGS_QUERY = """
+MATCH (i:Item) WHERE i.embedding IS NOT NULL
+RETURN count(i) AS total
+"""
+
+# Keyset pagination on the unique Item.name index, so later pages do not rescan earlier ones
+EMBEDDINGS_PAGE_QUERY = """
+MATCH (i:Item) WHERE i.name > $after AND i.embedding IS NOT NULL
+RETURN i.name AS name, i.embedding AS embedding
+ORDER BY i.name
+LIMIT $limit
+"""
+
+# Embeddings moved to the vector store are dropped from the graph in batches
+REMOVE_EMBEDDINGS_QUERY = """
+MATCH (i:Item) WHERE i.embedding IS NOT NULL
+WITH i LIMIT $limit
+REMOVE i.embedding
+RETURN count(i) AS removed
+"""
+
+def iter_embedding_pages(page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield (item names, float32 vectors) one page at a time, so only a page of
+    Bolt records is ever held as Python lists.
+    """
+    after = ""
+    with driver.session() as session:
+        while True:
+            records = list(session.run(EMBEDDINGS_PAGE_QUERY, after=after, limit=page_size))
+            if not records:
+                return
+            names = [record['name'] for record in records]
+            yield names, np.array([record['embedding'] for record in records], dtype='float32')
+            if len(records) < page_size:
+                return
+            after = names[-1]
+
+def export_embeddings(page_size=EXPORT_PAGE_SIZE, on_page=None, keep_vectors=True):
+    """
+    Stream every item embedding out of Neo4j page by page.
+    Each page is copied into a float32 buffer preallocated from the item count
+    (unless keep_vectors is False) and passed to on_page(names, vectors), e.g.
+    to add it to an index. Returns the item names and the filled buffer (or None).
+    """
+    with driver.session() as session:
+        total = session.run(COUNT_EMBEDDINGS_QUERY).single()['total']
+
+    item_names = []
+    vectors = None
+    start = time.perf_counter()
+    for names, page in iter_embedding_pages(page_size):
+        # Items added after the count are picked up by the next rebuild
+        page_rows = min(len(names), total - len(item_names))
+        if page_rows <= 0:
+            break
+        names, page = names[:page_rows], page[:page_rows]
+        if keep_vectors:
+            if vectors is None:
+                vectors = np.empty((total, page.shape[1]), dtype='float32')
+            vectors[len(item_names):len(item_names) + page_rows] = page
+        if on_page is not None:
+            on_page(names, page)
+        item_names.extend(names)
+
+        elapsed = time.perf_counter() - start
+        print(f"Exported {len(item_names)}/{total} embeddings ({len(item_names) / elapsed:.0f}/sec)")
+
+    if keep_vectors:
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype='float32')
+        # Items deleted after the count leave unused rows at the end
+        vectors = vectors[:len(item_names)]
+    return item_names, vectors
+
+def get_all_embeddings(page_size=EXPORT_PAGE_SIZE):
+    """
+    Return (item names, float32 vectors), read from the local vector store, or
+    exported from Neo4j for a catalog whose embeddings have not been migrated.
+    """
+    store = get_vector_store()
+    if not len(store):
+        return export_embeddings(page_size)
+    item_names = []
+    vectors = np.empty((len(store), store.dimension), dtype='float32')
+    for _, names, shard in store.iter_shards():
+        rows = min(len(names), len(vectors) - len(item_names))
+        vectors[len(item_names):len(item_names) + rows] = shard[:rows]
+        item_names.extend(names[:rows])
+    return item_names, vectors[:len(item_names)]
+
+def migrate_embeddings_to_store(page_size=EXPORT_PAGE_SIZE):
+    """
+    One-off move of the embeddings stored on Item nodes into the vector store,
+    then drop them from the graph. Returns the number of items moved.
+    """
+    store = get_vector_store()
+    item_names, _ = export_embeddings(page_size, on_page=store.put_many, keep_vectors=False)
+    with driver.session() as session:
+        while session.run(REMOVE_EMBEDDINGS_QUERY, limit=page_size).single()['removed']:
+            pass
+    print(f"Moved {len(item_names)} embeddings to the vector store.")
+    return len(item_names)
+
+def get_item_bins(item_names):
+    """
+    Fetch the bin for every item name in a single round trip.
+    Returns a list aligned with item_names; unknown items map to "None".
+    """
     with driver.session() as session:
         result = session.run("""
-            MATCH (i:Item)
-            RETURN i.name AS name, i.embedding AS embedding
-        """)
-        item_names = []
-        embeddings = []
-        for record in result:
-            item_names.append(record['name'])
-            embeddings.append(record['embedding'])
-        embeddings = np.array(embeddings, dtype='float32')
-        return item_names, embeddings
-
-def build_faiss_index(embeddings):
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    return index
+            UNWIND $names AS name
+            OPTIONAL MATCH (i:Item {name: name})-[:SHOULD_GO_IN]->(b:Bin)
+            RETURN name, b.type AS bin_type
+        """, names=list(item_names))
+        bins = {record['name']: record['bin_type'] for record in result}
+    return [bins.get(name) or "None" for name in item_names]
+
+def build_faiss_index(embeddings, index_type=FAISS_INDEX_TYPE, metric=FAISS_METRIC):
+    """
+    Build an index of the configured type (see index_factory.py) over an in-memory matrix.
+    """
+    return build_index(embeddings, resolve_index_spec(index_type, len(embeddings)), metric)
+
+def build_faiss_index_from_neo4j(page_size=EXPORT_PAGE_SIZE, index_type=FAISS_INDEX_TYPE, metric=FAISS_METRIC):
+    """
+    Build an index of the configured type (see index_factory.py) from a Neo4j
+    export. Indexes that need no training take each page as it arrives instead
+    of materialising every embedding first; the others keep the pages and are
+    trained and filled by build_index at the end. Row i gets id i.
+    Returns (index, item_names).
+    """
+    with driver.session() as session:
+        total = session.run(COUNT_EMBEDDINGS_QUERY).single()['total']
+    spec = resolve_index_spec(index_type, total)
+    index = None
+    pages = []
+
+    def add_page(names, vectors):
+        nonlocal index
+        if index is None:
+            index = create_index(spec, vectors.shape[1], metric)
+        if not index.is_trained:
+            pages.append(vectors)
+            return
+        index.add_with_ids(prepare_vectors(vectors, metric), np.arange(index.ntotal, index.ntotal + len(names)))
+
+    item_names, _ = export_embeddings(page_size, on_page=add_page, keep_vectors=False)
+    if pages:
+        return build_index(np.concatenate(pages), spec, metric), item_names
+    return configure_search(index) if index is not None else None, item_names
+
+def build_faiss_index_from_store(store=None, index_type=FAISS_INDEX_TYPE, metric=FAISS_METRIC):
+    """
+    Build the index from the local vector store one shard at a time, without
+    touching Neo4j. Every vector is added under its item id, and item_names is
+    indexed by id. Indexes that need training are trained on an evenly spaced
+    sample of the store. Returns (index, item_names).
+    """
+    store = store or get_vector_store()
+    index = create_index(resolve_index_spec(index_type, len(store)), store.dimension, metric)
+    sample_size = training_size(index, len(store))
+    if sample_size:
+        index.train(prepare_vectors(store.sample(sample_size), metric))
+    start = time.perf_counter()
+    for ids, _, shard in store.iter_shards():
+        index.add_with_ids(prepare_vectors(shard, metric), ids)
+        elapsed = time.perf_counter() - start
+        print(f"Indexed {index.ntotal}/{len(store)} vectors ({index.ntotal / elapsed:.0f}/sec)")
+    # Names are append-only, so this covers every id the shards above returned
+    return configure_search(index), store.names
+
+def rebuild_faiss_index():
+    """
+    Rebuild from the vector store, falling back to a Neo4j export for a
+    catalog whose embeddings have not been migrated yet.
+    """
+    if len(get_vector_store()):
+        return build_faiss_index_from_store()
+    print("Vector store is empty. Exporting embeddings from Neo4j.")
+    return build_faiss_index_from_neo4j()
 
 def save_faiss_index(index, file_path='faiss.index'):
     faiss.write_index(index, file_path)
@@ -34,28 +214,235 @@ def load_faiss_index(file_path='faiss.index'):
     # Check if the index file exists
     if not os.path.exists(file_path):
         print(f"{file_path} does not exist. Building the FAISS index.")
-        item_names, embeddings = get_all_embeddings()
-        index = build_faiss_index(embeddings)
+        index, item_names = rebuild_faiss_index()
         save_faiss_index(index, file_path)
         np.save('item_names.npy', np.array(item_names))
+        np.save('item_bins.npy', np.array(get_item_bins(item_names)))
         return index
     else:
         print(f"Loading FAISS index from {file_path}.")
         index = faiss.read_index(file_path)
         return index
 
-def update_faiss_index():
-    item_names, embeddings = get_all_embeddings()
-    index = build_faiss_index(embeddings)
-    save_faiss_index(index)
-    # Also save item names mapping
-    np.save('item_names.npy', np.array(item_names))
+def update_faiss_index(directory=SNAPSHOT_DIR):
+    """
+    Rebuild the index and publish it, with the names and bin label of every
+    item, as a new snapshot bundle. Rebuilding from the vector store also
+    compacts its change feed, which the new snapshot has caught up with.
+    Returns (index, item_names).
+    """
+    store = get_vector_store()
+    if len(store):
+        # Changes that land during the build are after this point, so they are replayed
+        sequence = store.current_sequence()
+        spec = resolve_index_spec(FAISS_INDEX_TYPE, len(store))
+        index, item_names = build_faiss_index_from_store(store, spec)
+        ids = np.sort(faiss.vector_to_array(index.id_map))
+        _write_store_snapshot(store, index, ids, item_names, spec, directory,
+                              {"change_sequence": sequence, "changed_since_build": 0})
+        store.truncate_changes(sequence)
+        return index, item_names
+
+    print("Vector store is empty. Exporting embeddings from Neo4j.")
+    item_names, vectors = export_embeddings()
+    spec = resolve_index_spec(FAISS_INDEX_TYPE, len(item_names))
+    index = build_faiss_index(vectors, spec)
+    write_snapshot(index, [prepare_vectors(vectors)], item_names, get_item_bins(item_names), EMBEDDING_MODEL,
+                   dataset_version=fetch_dataset_version(), directory=directory, index_spec=spec)
     return index, item_names
 
+def apply_index_changes(directory=SNAPSHOT_DIR):
+    """
+    Bring the current snapshot up to date with the vector store's change feed.
+    Only the items that changed are touched: they are removed from the index by
+    id and re-added with their new vectors, and deleted items stay removed.
+
+    Falls back to a full rebuild (which compacts the index and the feed) when
+    the snapshot does not record a feed position, the feed no longer reaches
+    back to it, the configured index type or metric has changed, the index
+    type cannot remove vectors (HNSW), or more than INDEX_COMPACT_CHANGES items
+    have changed since the last full build. Returns the new snapshot version,
+    or None when there was nothing to apply.
+    """
+    store = get_vector_store()
+    if not len(store) and not store.current_sequence():
+        return None
+    snapshot = load_snapshot(directory, mmap=False)
+    sequence = snapshot.manifest.get("change_sequence") if snapshot is not None else None
+    if sequence is None:
+        return _compact_index(directory, "the snapshot has no change feed position")
+    try:
+        changes = store.changes_since(sequence)
+    except ValueError as e:
+        return _compact_index(directory, str(e))
+    if not changes:
+        return None
+
+    upserted, deleted = set(), set()
+    for _, op, ids in changes:
+        if op == "delete":
+            deleted.update(ids)
+            upserted.difference_update(ids)
+        else:
+            upserted.update(ids)
+            deleted.difference_update(ids)
+    changed_since_build = snapshot.manifest.get("changed_since_build", 0) + len(upserted) + len(deleted)
+    spec = resolve_index_spec(FAISS_INDEX_TYPE, len(store))
+    index = snapshot.index
+    if changed_since_build > INDEX_COMPACT_CHANGES:
+        return _compact_index(directory, f"{changed_since_build} items changed since the last full build")
+    if spec != snapshot.manifest.get("index_spec") or index.metric_type != metric_type(FAISS_METRIC):
+        return _compact_index(directory, f"the index type is now {spec} ({FAISS_METRIC})")
+
+    upserted = np.array(sorted(upserted), dtype='int64')
+    # New items are only added, so indexes that cannot remove vectors still take them in place
+    stale = np.intersect1d(np.array(sorted(deleted.union(upserted.tolist())), dtype='int64'),
+                           faiss.vector_to_array(index.id_map))
+    try:
+        if len(stale):
+            index.remove_ids(stale)
+    except RuntimeError:
+        return _compact_index(directory, f"{spec} indexes cannot remove vectors")
+    if len(upserted):
+        index.add_with_ids(prepare_vectors(store.get_many(upserted)), upserted)
+
+    item_names = store.names
+    item_bins = list(snapshot.item_bins) + ["None"] * (len(item_names) - len(snapshot.item_bins))
+    for item_id in deleted:
+        item_bins[item_id] = "None"
+    for item_id, bin_type in zip(upserted.tolist(), get_item_bins([item_names[i] for i in upserted])):
+        item_bins[item_id] = bin_type
+
+    ids = np.sort(faiss.vector_to_array(index.id_map))
+    version = _write_store_snapshot(store, index, ids, item_names, spec, directory,
+                                    {"change_sequence": changes[-1][0],
+                                     "changed_since_build": changed_since_build},
+                                    item_bins=item_bins)
+    print(f"Applied {len(upserted)} updated and {len(deleted)} deleted items to snapshot {version}.")
+    return version
+
+def follow_index_changes(directory=SNAPSHOT_DIR, interval=INDEX_UPDATE_INTERVAL):
+    """
+    Apply the vector store's change feed to the snapshot every `interval` seconds, forever.
+    """
+    while True:
+        try:
+            apply_index_changes(directory)
+        except Exception as e:
+            print(f"Failed to apply index changes: {e}")
+        time.sleep(interval)
+
+def _compact_index(directory, reason):
+    print(f"Rebuilding the index: {reason}.")
+    update_faiss_index(directory)
+    return current_version(directory)
+
+def _write_store_snapshot(store, index, ids, item_names, spec, directory, metadata, item_bins=None):
+    if item_bins is None:
+        item_bins = ["None"] * len(item_names)
+        for item_id, bin_type in zip(ids.tolist(), get_item_bins([item_names[i] for i in ids])):
+            item_bins[item_id] = bin_type
+    # Vectors are read back from the store by id, so vectors.npy holds exactly the indexed items
+    vector_chunks = (prepare_vectors(store.get_many(ids[start:start + store.shard_size]))
+                     for start in range(0, len(ids), store.shard_size))
+    return write_snapshot(index, vector_chunks, item_names, item_bins, EMBEDDING_MODEL,
+                          dataset_version=fetch_dataset_version(), directory=directory, index_spec=spec,
+                          ids=ids, metadata=metadata)
+
+def fetch_dataset_version():
+    with driver.session() as session:
+        record = session.run(DATASET_VERSION_QUERY).single()
+        return record["version"] if record else None
+
+def load_index_snapshot(directory=SNAPSHOT_DIR, version=None):
+    """
+    Load everything the read path needs from a snapshot bundle (the current
+    one by default), without touching Neo4j. Deployments that have not written
+    a snapshot yet fall back to the legacy faiss.index / item_names.npy /
+    item_bins.npy files.
+    """
+    snapshot = load_snapshot(directory, version)
+    if snapshot is not None:
+        print(f"Loaded snapshot {snapshot.version} with {len(snapshot.item_names)} items.")
+        configure_search(snapshot.index)
+        return snapshot
+    print(f"No snapshot in {directory}. Loading faiss.index and item_names.npy.")
+    index = load_faiss_index('faiss.index')
+    return Snapshot(None, {}, index, None, np.load('item_names.npy').tolist(),
+                    load_item_bins('item_bins.npy'), None)
+
+def load_item_bins(file_path='item_bins.npy'):
+    """
+    Load the bin label of each index row, or None if the file has not been built.
+    """
+    if not os.path.exists(file_path):
+        print(f"{file_path} does not exist. Neighbour bins will be fetched from Neo4j.")
+        return None
+    return np.load(file_path).tolist()
+
+def add_to_index(index, vectors, ids=None):
+    """
+    Add vectors to a built index, under `ids` when it maps ids, normalizing
+    them first if it searches by inner product.
+    """
+    vectors = np.atleast_2d(np.array(vectors, dtype='float32'))
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(vectors)
+    if ids is None and isinstance(index, faiss.IndexIDMap):
+        # ID maps have no add(); carry on after the highest id in use
+        start = int(faiss.vector_to_array(index.id_map).max()) + 1 if index.ntotal else 0
+        ids = np.arange(start, start + len(vectors))
+    if ids is not None and isinstance(index, (faiss.IndexIDMap, MappedFlatIndex)):
+        index.add_with_ids(vectors, np.asarray(ids, dtype='int64'))
+    else:
+        index.add(vectors)
+
 def search_similar_items(query_embedding, index, item_names, top_k=10):
     query_embedding = np.array(query_embedding, dtype='float32').reshape(1, -1)
     distances, indices = index.search(query_embedding, top_k)
     similar_items = []
     for idx in indices[0]:
         similar_items.append(item_names[idx])
-    return similar_items
\ No newline at end of file
+    return similar_items
+
+def search_similar_items_scored(query_embedding, index, item_names, item_bins, top_k=10):
+    """
+    Search for neighbours and keep what FAISS returns about them.
+    Returns (item name, bin type, distance) triples, nearest first. The bin is
+    None when no label array is available; distances are squared L2 whatever
+    the index metric.
+    """
+    return search_similar_items_scored_batch([query_embedding], index, item_names, item_bins, top_k)[0]
+
+def search_similar_items_scored_batch(query_embeddings, index, item_names, item_bins, top_k=10):
+    """
+    Run several queries in a single index.search call.
+    Returns one list of (item name, bin type, distance) triples per query.
+    """
+    queries = np.array(query_embeddings, dtype='float32').reshape(len(query_embeddings), -1)
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    if inner_product:
+        faiss.normalize_L2(queries)
+    distances, indices = index.search(queries, top_k)
+    if inner_product:
+        # For unit vectors |a - b|^2 = 2 - 2 a.b, so thresholds tuned on L2 still apply
+        distances = 2 - 2 * distances
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        similar_items = []
+        for distance, idx in zip(row_distances, row_indices):
+            if idx < 0:
+                continue
+            bin_type = item_bins[idx] if item_bins is not None else None
+            similar_items.append((item_names[idx], bin_type, float(distance)))
+        results.append(similar_items)
+    return results
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["follow"]:
+        # Keep the snapshot in step with ingestion, e.g. as a sidecar process
+        follow_index_changes()
+    else:
+        # Move embeddings still stored on Item nodes into the vector store, then rebuild from it
+        migrate_embeddings_to_store()
+        update_faiss_index()
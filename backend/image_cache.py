@@ -0,0 +1,270 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+# Side of the grayscale thumbnail dHash compares; gives a 256-bit hash
+DHASH_SIZE = 16
+# Side of the RGB thumbnail that confirms a dHash match; dHash is blind to colour
+COLOR_GRID = 8
+
+
+class ImageResultCache:
+    """
+    Classification results keyed by the sha256 of the uploaded image bytes.
+
+    Kiosks retry the same photo constantly, so a repeat upload is answered
+    without the R2 upload, the vision call or the classification chain.
+    Lookups go to an in-process LRU first and then to a SQLite file shared by
+    workers and restarts. Entries expire after `ttl` seconds in both tiers, so
+    catalog changes reach repeated photos eventually. Pass path=None to keep
+    the cache in memory only.
+    """
+
+    def __init__(self, path=None, capacity=1024, ttl=86400.0):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS image_results (
+                    key TEXT PRIMARY KEY,
+                    object_name TEXT NOT NULL,
+                    bin_type TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def get(self, key):
+        """
+        Return the cached {"object_name", "bin_type"} dict, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return dict(result)
+                del self._lru[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT object_name, bin_type, expires_at FROM image_results WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    result = {"object_name": row[0], "bin_type": row[1]}
+                    self._remember(key, result, row[2])
+                    self.disk_hits += 1
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        now = time.time()
+        expires_at = now + self.ttl
+        result = {"object_name": result["object_name"], "bin_type": result["bin_type"]}
+        with self._lock:
+            self._remember(key, result, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO image_results (key, object_name, bin_type, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, result["object_name"], result["bin_type"], expires_at),
+                )
+                self._db.execute("DELETE FROM image_results WHERE expires_at <= ?", (now,))
+                self._db.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM image_results")
+                self._db.commit()
+
+    def _remember(self, key, result, expires_at):
+        self._lru[key] = (result, expires_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+
+def image_dhash(image):
+    """
+    dHash of an already decoded PIL image.
+    """
+    pixels = image.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for column in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def image_colors(image):
+    """
+    Mean colour of each cell of a COLOR_GRID x COLOR_GRID grid, as RGB bytes.
+    """
+    return image.convert("RGB").resize((COLOR_GRID, COLOR_GRID), Image.BOX).tobytes()
+
+
+def color_difference(a, b):
+    """
+    Largest per-cell, per-channel difference between two image_colors signatures.
+    """
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance, so a
+    radius search only visits subtrees the triangle inequality allows.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self._root is None:
+            self._root = node
+            self._size = 1
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            if distance == 0:
+                current[1] = item
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                self._size += 1
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """
+        Return (distance, item) pairs for every hash within `max_distance`, closest first.
+        """
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """
+    Vision labels keyed by perceptual hash, for photos that are the same item
+    but not the same bytes (resized, re-encoded, slightly re-framed).
+
+    A lookup returns the label of the closest stored photo whose dHash is
+    within `max_distance` bits and whose colour grid is within
+    `max_color_difference` in every cell. The colour check keeps apart
+    different items on the same kiosk background, and same-shaped items in
+    different colours, which dHash alone cannot tell apart. Entries expire
+    after `ttl` seconds; when the index
+    is full the oldest quarter is dropped and the BK-tree rebuilt, since
+    BK-trees do not support removal.
+    """
+
+    def __init__(self, max_distance=16, max_color_difference=32, capacity=4096, ttl=86400.0):
+        self.max_distance = max_distance
+        self.max_color_difference = max_color_difference
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def get(self, value, colors):
+        now = time.time()
+        with self._lock:
+            for _, (label, stored_colors, expires_at) in self._tree.search(value, self.max_distance):
+                if expires_at > now and color_difference(colors, stored_colors) <= self.max_color_difference:
+                    self.hits += 1
+                    return label
+            self.misses += 1
+            return None
+
+    def put(self, value, colors, label):
+        with self._lock:
+            entry = (label, colors, time.time() + self.ttl)
+            self._entries[value] = entry
+            self._entries.move_to_end(value)
+            if len(self._entries) > self.capacity:
+                self._rebuild()
+            else:
+                self._tree.add(value, entry)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tree = BKTree()
+            self.hits = self.misses = 0
+
+    def _rebuild(self):
+        now = time.time()
+        for value in list(self._entries)[:max(len(self._entries) - self.capacity * 3 // 4, 0)]:
+            del self._entries[value]
+        tree = BKTree()
+        for value, entry in list(self._entries.items()):
+            if entry[2] > now:
+                tree.add(value, entry)
+            else:
+                del self._entries[value]
+        self._tree = tree
@@ -0,0 +1,134 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from image_cache import image_colors, image_dhash
+
+try:
+    import pillow_heif
+    # Kiosk phones send HEIC, and some browsers AVIF
+    pillow_heif.register_heif_opener()
+    pillow_heif.register_avif_opener()
+except ImportError:  # pragma: no cover - without it those uploads go to the vision model as sent
+    pillow_heif = None
+
+# Longest side of the image sent to the vision model at "high"/"auto" detail
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+# The model looks at a 512x512 version at "low" detail, so nothing larger is worth sending
+LOW_DETAIL_MAX_SIDE = 512
+# "low" (cheapest, enough to name an object), "high" or "auto" (the model decides)
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low")
+# JPEG or WEBP, and the encoder quality
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+# Processes decoding and resizing uploads
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def target_side(detail, max_side=IMAGE_MAX_SIDE):
+    return min(max_side, LOW_DETAIL_MAX_SIDE) if detail == "low" else max_side
+
+
+def preprocess_image(data, max_side=IMAGE_MAX_SIDE, output_format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Decode an upload (bytes, or the path of a file holding them), apply its
+    EXIF orientation, shrink it to fit `max_side` and re-encode it. Returns a
+    dict with the new bytes, their content type and extension, the size, and
+    the dHash and colour grid of the image, or None if the upload does not
+    decode.
+    """
+    try:
+        image = Image.open(data if isinstance(data, str) else io.BytesIO(data))
+        # JPEGs decode straight to a reduced scale that is still at least max_side
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    except Exception:
+        return None
+    if output_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=output_format, quality=quality, optimize=output_format == "JPEG")
+    return {
+        "data": buffer.getvalue(),
+        "content_type": CONTENT_TYPES[output_format],
+        "extension": EXTENSIONS[output_format],
+        "width": image.width,
+        "height": image.height,
+        "phash": image_dhash(image),
+        "colors": image_colors(image),
+    }
+
+
+class ImagePreprocessor:
+    """
+    Runs preprocess_image in a pool of worker processes, so decoding and
+    resizing multi-megabyte photos neither blocks the event loop nor holds
+    the GIL that request handlers need. Until start() is called, images are
+    processed on a worker thread instead.
+    """
+
+    def __init__(self, workers=IMAGE_WORKERS, detail=VISION_DETAIL, max_side=IMAGE_MAX_SIDE,
+                 output_format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY):
+        self.workers = workers
+        self.detail = detail
+        self.max_side = target_side(detail, max_side)
+        self.output_format = output_format
+        self.quality = quality
+        self.processed = 0
+        self.undecodable = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._pool = None
+
+    @property
+    def running(self):
+        return self._pool is not None
+
+    def start(self):
+        if self._pool is None:
+            # Not forked from the server process, which already runs FAISS/OpenMP and driver
+            # threads: workers fork from a clean server that has imported only this module
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["image_preprocess"])
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def process(self, data, size=None):
+        """
+        Preprocess one upload; see preprocess_image. Pass `size` when `data` is a path.
+        """
+        args = (data, self.max_side, self.output_format, self.quality)
+        if self._pool is not None:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, preprocess_image, *args)
+        else:
+            result = await asyncio.to_thread(preprocess_image, *args)
+        self.bytes_in += len(data) if size is None else size
+        if result is None:
+            self.undecodable += 1
+        else:
+            self.processed += 1
+            self.bytes_out += len(result["data"])
+        return result
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "undecodable": self.undecodable,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "detail": self.detail,
+            "max_side": self.max_side,
+        }
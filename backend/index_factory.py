@@ -0,0 +1,198 @@
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+# "auto" picks by catalog size; anything else is a FAISS factory string such as
+# "Flat", "HNSW32", "IVF1024,Flat", "IVF1024,SQ8" or "IVF1024,PQ64"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+# "l2" or "ip"; ada-002 embeddings are unit-normalized, so both rank neighbours the same way
+FAISS_METRIC = os.getenv("FAISS_METRIC", "l2")
+# Search-time accuracy knobs for IVF and HNSW indexes
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Catalog sizes at which auto selection moves from exact search to IVF, then to
+# IVF with 8-bit codes. Auto never picks HNSW: its graph cannot be memory-mapped
+# (every worker loads a private copy) or remove vectors (so every change to the
+# catalog forces a full rebuild). Set FAISS_INDEX_TYPE=HNSW32 to trade both for
+# lower latency at the same recall.
+FLAT_MAX_ITEMS = int(os.getenv("FLAT_MAX_ITEMS", "20000"))
+IVF_FLAT_MAX_ITEMS = int(os.getenv("IVF_FLAT_MAX_ITEMS", "1000000"))
+
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+
+# k-means wants roughly this many training points per centroid
+TRAINING_POINTS_PER_CENTROID = 39
+
+
+def metric_type(metric):
+    try:
+        return METRICS[metric.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown FAISS metric {metric!r}; expected one of {sorted(METRICS)}")
+
+
+def ivf_list_count(count):
+    """
+    Number of IVF lists for `count` vectors: about 4 * sqrt(n), capped so each
+    list still gets enough training points.
+    """
+    return max(1, min(int(4 * math.sqrt(count)), count // TRAINING_POINTS_PER_CENTROID))
+
+
+def resolve_index_spec(index_type, count):
+    """
+    Turn FAISS_INDEX_TYPE into a factory string for a catalog of `count` items.
+    """
+    if index_type != "auto":
+        return index_type
+    if count <= FLAT_MAX_ITEMS:
+        return "Flat"
+    if count <= IVF_FLAT_MAX_ITEMS:
+        return f"IVF{ivf_list_count(count)},Flat"
+    return f"IVF{ivf_list_count(count)},SQ8"
+
+
+def create_index(spec, dimension, metric=FAISS_METRIC):
+    """
+    Create an empty `spec` index wrapped in an ID map, so vectors are added,
+    replaced and removed by stable item id rather than by position.
+    """
+    return faiss.index_factory(dimension, f"IDMap2,{spec}", metric_type(metric))
+
+
+def base_index(index):
+    """
+    The index an ID map wraps, or `index` itself.
+    """
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def training_size(index, count):
+    """
+    How many vectors to train `index` on (0 when it needs no training).
+    """
+    if index.is_trained:
+        return 0
+    ivf = faiss.try_extract_index_ivf(index)
+    centroids = ivf.nlist if ivf is not None else 256
+    return min(count, max(centroids, 256) * TRAINING_POINTS_PER_CENTROID)
+
+
+def prepare_vectors(vectors, metric=FAISS_METRIC):
+    """
+    Vectors as the index stores them: float32, and unit length for inner product.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if metric_type(metric) == faiss.METRIC_INNER_PRODUCT:
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def configure_search(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """
+    Apply the search-time parameters, which are not fixed by building the index.
+    """
+    if isinstance(getattr(index, "index", None), faiss.Index) and not isinstance(index, faiss.Index):
+        # A mapped_index wrapper around a FAISS index
+        configure_search(index.index, nprobe, ef_search)
+        return index
+    ivf = faiss.try_extract_index_ivf(index) if isinstance(index, faiss.Index) else None
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(base_index(index)), "hnsw", None) if isinstance(index, faiss.Index) else None
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+
+def build_index(vectors, spec, metric=FAISS_METRIC, ids=None):
+    """
+    Build and train a `spec` index over an in-memory matrix. Row i gets id
+    ids[i], or i when no ids are given.
+    """
+    vectors = prepare_vectors(vectors, metric)
+    index = create_index(spec, vectors.shape[1], metric)
+    sample_size = training_size(index, len(vectors))
+    if sample_size:
+        rows = np.linspace(0, len(vectors) - 1, sample_size).astype('int64')
+        index.train(vectors[rows])
+    index.add_with_ids(vectors, np.arange(len(vectors)) if ids is None else np.asarray(ids, dtype='int64'))
+    return configure_search(index)
+
+
+def benchmark_index_specs(vectors, specs, metric=FAISS_METRIC, k=10, num_queries=200, seed=0):
+    """
+    Compare index types on the catalog's own vectors.
+
+    Queries are catalog vectors with a little noise, like a label that is close
+    to, but not exactly, a known item. Returns one dict per spec with recall@k
+    against exact search, build time, per-query latency and serialized size.
+    """
+    vectors = prepare_vectors(vectors, metric)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.01, size=(len(picks), vectors.shape[1])).astype('float32')
+    queries = prepare_vectors(queries, metric)
+    k = min(k, len(vectors))
+
+    exact = build_index(vectors, "Flat", metric)
+    _, expected = exact.search(queries, k)
+
+    results = []
+    for spec in specs:
+        try:
+            start = time.perf_counter()
+            index = build_index(vectors, spec, metric)
+            build_seconds = time.perf_counter() - start
+        except RuntimeError as e:
+            # e.g. too few vectors to train this many centroids
+            results.append({"spec": spec, "error": str(e).strip().splitlines()[-1]})
+            continue
+
+        latencies = []
+        found = np.empty_like(expected)
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            found[i] = index.search(query.reshape(1, -1), k)[1][0]
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        hits = sum(len(set(row_found) & set(row_expected)) for row_found, row_expected in zip(found, expected))
+        results.append({
+            "spec": spec,
+            "recall_at_k": hits / expected.size,
+            "build_seconds": build_seconds,
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "memory_bytes": int(faiss.serialize_index(index).nbytes),
+        })
+    return results
+
+
+def candidate_specs(count, dimension):
+    """
+    A spread of index types worth comparing for a catalog of this size.
+    """
+    nlist = ivf_list_count(count)
+    pq_subquantizers = next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dimension % m == 0)
+    return ["Flat", "HNSW32", f"IVF{nlist},Flat", f"IVF{nlist},SQ8", f"IVF{nlist},PQ{pq_subquantizers}"]
+
+
+if __name__ == "__main__":
+    from faiss_helper import get_all_embeddings
+
+    item_names, vectors = get_all_embeddings()
+    print(f"Benchmarking {len(item_names)} vectors with metric {FAISS_METRIC}; "
+          f"auto would pick {resolve_index_spec('auto', len(item_names))}.")
+    for result in benchmark_index_specs(vectors, candidate_specs(*vectors.shape)):
+        if "error" in result:
+            print(f"{result['spec']:<20} failed: {result['error']}")
+            continue
+        print(f"{result['spec']:<20} recall@10 {result['recall_at_k']:.3f}  "
+              f"p50 {result['latency_ms_p50']:.3f} ms  p95 {result['latency_ms_p95']:.3f} ms  "
+              f"build {result['build_seconds']:.2f} s  size {result['memory_bytes'] / 1e6:.1f} MB")
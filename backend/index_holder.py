@@ -0,0 +1,123 @@
+import threading
+import time
+
+import numpy as np
+
+from snapshot import SNAPSHOT_DIR, current_version
+
+
+class SnapshotHolder:
+    """
+    Holds the index snapshot the server is answering from and swaps in new
+    versions while it runs.
+
+    Readers take `current` once per request and use that snapshot throughout,
+    so a request that is in flight during a swap finishes on the version it
+    started with. New snapshots are loaded, checked and warmed up off the
+    request path, then published with a single assignment, which keeps
+    readers lock-free (the same scheme as BinLookupTable).
+
+    The watcher follows changes to CURRENT, not differences from it: after an
+    explicit reload(version) the holder stays on that version until CURRENT
+    names a new one. Fleet-wide rollbacks go through snapshot.publish_version
+    instead, which every holder's watcher follows.
+    """
+
+    def __init__(self, snapshot, loader, validate=None, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self.reloads = 0
+        self.last_error = None
+        self._snapshot = snapshot
+        # The CURRENT value the live snapshot was last chosen against
+        self._followed = snapshot.version
+        self._loader = loader
+        self._validate = validate
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if validate is not None:
+            validate(snapshot)
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def reload(self, version=None):
+        """
+        Load a snapshot version and swap it in. Without a version, loads the one
+        CURRENT names if CURRENT changed since the last reload. Returns True if
+        the live snapshot changed. Raises ValueError, and keeps
+        serving the old snapshot, if the new one fails its checks.
+        """
+        with self._reload_lock:
+            current = current_version(self.directory)
+            if version is None:
+                if current is None or current == self._followed:
+                    return False
+                version = current
+            if version == self.version:
+                self._followed = current
+                return False
+            start = time.perf_counter()
+            snapshot = self._loader(self.directory, version)
+            if self._validate is not None:
+                self._validate(snapshot)
+            self._warm_up(snapshot)
+            previous, self._snapshot = self._snapshot, snapshot
+            self._followed = current
+            self.reloads += 1
+            self.last_error = None
+        print(f"Swapped index snapshot {previous.version} for {snapshot.version} "
+              f"({len(snapshot.item_names)} items, loaded in {time.perf_counter() - start:.2f} s).")
+        return True
+
+    def reload_if_stale(self):
+        try:
+            return self.reload()
+        except Exception as e:
+            # Keep serving the last good snapshot
+            self.last_error = str(e)
+            print(f"Index snapshot reload failed: {e}")
+            return False
+
+    def start_watching(self, interval=30.0):
+        """
+        Check every `interval` seconds whether CURRENT names a new version, on a daemon thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch_loop, args=(interval,), name="index-snapshot-watch", daemon=True
+        )
+        self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "items": len(snapshot.item_names),
+            "created_at": snapshot.manifest.get("created_at"),
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+    def _watch_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.reload_if_stale()
+
+    def _warm_up(self, snapshot):
+        # One search touches the pages a query needs (all of them for a mapped
+        # flat index), so the first requests after the swap do not fault them in
+        if snapshot.vectors is not None and len(snapshot.vectors):
+            snapshot.index.search(np.array(snapshot.vectors[:1], dtype='float32'), 1)
@@ -0,0 +1,39 @@
+from collections import defaultdict
+
+# ada-002 embeddings are unit length, so a squared L2 distance d corresponds
+# to a cosine similarity of 1 - d / 2. 0.3 keeps neighbours above ~0.85.
+DEFAULT_MAX_DISTANCE = 0.3
+DEFAULT_MIN_CONFIDENCE = 0.8
+DEFAULT_MIN_NEIGHBOURS = 3
+
+
+def vote_on_neighbours(neighbours, max_distance=DEFAULT_MAX_DISTANCE,
+                       min_confidence=DEFAULT_MIN_CONFIDENCE,
+                       min_neighbours=DEFAULT_MIN_NEIGHBOURS):
+    """
+    Distance-weighted majority vote over labelled nearest neighbours.
+
+    `neighbours` are (item name, bin type, distance) triples as returned by
+    faiss_helper.search_similar_items_scored. Only neighbours within
+    `max_distance` with a known bin get a vote, weighted by 1 / (1 + distance).
+
+    Returns (bin_type, confidence) when at least `min_neighbours` vote and the
+    winning bin holds at least `min_confidence` of the total weight, otherwise
+    None so the caller can escalate to the LLM.
+    """
+    weights = defaultdict(float)
+    voters = 0
+    for _, bin_type, distance in neighbours:
+        if bin_type in (None, "None") or distance > max_distance:
+            continue
+        weights[bin_type] += 1.0 / (1.0 + distance)
+        voters += 1
+
+    if voters < min_neighbours:
+        return None
+
+    bin_type, weight = max(weights.items(), key=lambda item: item[1])
+    confidence = weight / sum(weights.values())
+    if confidence < min_confidence:
+        return None
+    return bin_type, confidence
@@ -2,12 +2,22 @@
 import os
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from neo4j import GraphDatabase
+from db import get_async_driver, get_driver
 import openai
-from openai import OpenAI
-from faiss_helper import load_faiss_index, search_similar_items
-import numpy as np
-import os
+from openai import AsyncOpenAI, OpenAI
+from faiss_helper import (add_to_index, load_index_snapshot, search_similar_items_scored,
+                          search_similar_items_scored_batch)
+from bin_lookup import BinLookupTable
+from knn_classifier import vote_on_neighbours
+from embedding_cache import EmbeddingCache, normalize_text
+from index_holder import SnapshotHolder
+from search_batcher import SearchBatcher
+from semantic_cache import SemanticCache
+from name_matching import normalize_name
+from vector_store import get_vector_store
+from write_back import WriteBehindQueue
+import asyncio
+import json
 from dotenv import load_dotenv
 
 # Load the .env file
@@ -17,33 +27,145 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 client = OpenAI(api_key=OPENAI_API_KEY)
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Shared with embeddings.py through the same SQLite file; set the path to "" for memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH or None, EMBEDDING_CACHE_SIZE)
+
+def check_snapshot(snapshot):
+    if snapshot.manifest.get("embedding_model", EMBEDDING_MODEL) != EMBEDDING_MODEL:
+        raise ValueError(f"Snapshot {snapshot.version} was built with {snapshot.manifest['embedding_model']}, "
+                         f"but queries are embedded with {EMBEDDING_MODEL}")
+
+# Index, item names and the bin of each item, all from one snapshot bundle. The
+# holder swaps in newer snapshots while the server runs, so read it once per request.
+# Memory-mapped columns are shared with the other workers; learned rows are appended privately.
+index_holder = SnapshotHolder(load_index_snapshot(), load_index_snapshot, check_snapshot)
+
+# Concurrent requests' neighbour searches share batched index.search calls once the app starts this
+search_batcher = SearchBatcher(search_similar_items_scored_batch, add_to_index)
 
-index = load_faiss_index('faiss.index')
-item_names = np.load('item_names.npy').tolist()
+# Shared, pooled Neo4j driver (see db.py for connection settings)
+driver = get_driver()
 
-# Neo4j connection settings
-uri = "bolt://localhost:7687"
-driver = GraphDatabase.driver(uri, auth=("neo4j", "testpassword"))
+# Minimum trigram similarity for a fuzzy name match to count as a hit
+NAME_MATCH_THRESHOLD = float(os.getenv("NAME_MATCH_THRESHOLD", "0.8"))
+
+# Neighbours must agree this strongly, and be this close, to skip the LLM
+KNN_MAX_DISTANCE = float(os.getenv("KNN_MAX_DISTANCE", "0.3"))
+KNN_MIN_CONFIDENCE = float(os.getenv("KNN_MIN_CONFIDENCE", "0.8"))
+KNN_MIN_NEIGHBOURS = int(os.getenv("KNN_MIN_NEIGHBOURS", "3"))
+
+# Previous LLM guesses, reused for queries whose embeddings land this close
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.08"))
+semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_MAX_DISTANCE)
+
+# In-memory Item -> Bin table, loaded and refreshed by the FastAPI app on startup
+bin_table = BinLookupTable(driver)
+
+def seed_bin_table_from_snapshot():
+    """
+    Fill the bin table from the snapshot so lookups work before (or without)
+    Neo4j. Returns False when the snapshot has no bin labels.
+    """
+    snapshot = index_holder.current
+    if snapshot.item_bins is None:
+        return False
+    normalized_names = snapshot.normalized_names
+    if normalized_names is None:
+        normalized_names = [normalize_name(name) for name in snapshot.item_names]
+    # Rows of deleted (or unbinned) items are labelled "None" and left out
+    rows = [(name, bin_type, normalized) for name, bin_type, normalized
+            in zip(snapshot.item_names, snapshot.item_bins, normalized_names) if bin_type != "None"]
+    # Not loaded from Neo4j, so every refresh replaces it until a full Neo4j load succeeds
+    bin_table.replace([(name, bin_type) for name, bin_type, _ in rows],
+                      normalized_names=[normalized for _, _, normalized in rows])
+    return True
+
+# Guesses are written back as provisional items once the app starts this queue.
+# kNN votes must reach this confidence; LLM guesses must name a known bin.
+WRITE_BACK_MIN_CONFIDENCE = float(os.getenv("WRITE_BACK_MIN_CONFIDENCE", "0.9"))
+write_back = WriteBehindQueue(
+    driver,
+    # Looked up per batch, not bound to whatever store was open at import
+    vector_store=get_vector_store,
+    batch_size=int(os.getenv("WRITE_BACK_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("WRITE_BACK_FLUSH_SECONDS", "2")),
+)
 
 def generate_embedding_for_query(object_name):
-    # Call the OpenAI API to create an embedding
-    response = openai.embeddings.create(
-        input=object_name,  # The text to embed (item name)
-        model="text-embedding-ada-002"  # Model to use for embedding
+    def embed(text):
+        # Call the OpenAI API to create an embedding
+        response = openai.embeddings.create(
+            input=text,  # The text to embed (item name)
+            model=EMBEDDING_MODEL  # Model to use for embedding
+        )
+        return response.data[0].embedding
+
+    # The vision model repeats the same few names constantly, so most calls are cache hits
+    return embedding_cache.get_or_create(object_name, EMBEDDING_MODEL, embed)
+
+BIN_FOR_OBJECT_QUERY = """
+        MATCH (g:Item {name: $object_name})-[:SHOULD_GO_IN]->(b:Bin)
+        RETURN b.type AS bin_type
+        """
+
+BINS_FOR_OBJECTS_QUERY = """
+        UNWIND $object_names AS object_name
+        OPTIONAL MATCH (g:Item {name: object_name})-[:SHOULD_GO_IN]->(b:Bin)
+        RETURN object_name, b.type AS bin_type
+        """
+
+async def agenerate_embedding_for_query(object_name):
+    """
+    Async version of generate_embedding_for_query. Cache hits return without awaiting the API.
+    """
+    embedding = await embedding_cache.aget(object_name, EMBEDDING_MODEL)
+    if embedding is not None:
+        return embedding
+    response = await async_client.embeddings.create(
+        input=normalize_text(object_name),
+        model=EMBEDDING_MODEL
     )
-    return response.data[0].embedding
+    return await embedding_cache.aput(object_name, EMBEDDING_MODEL, response.data[0].embedding)
+
+async def agenerate_embeddings_for_queries(object_names):
+    """
+    Embed several names, sending every cache miss to the API in one list-input call.
+    Returns a list of embeddings aligned with object_names.
+    """
+    embeddings = await embedding_cache.aget_many(object_names, EMBEDDING_MODEL)
+    missing = [name for name, embedding in zip(object_names, embeddings) if embedding is None]
+    if missing:
+        response = await async_client.embeddings.create(
+            input=[normalize_text(name) for name in missing],
+            model=EMBEDDING_MODEL
+        )
+        stored = await embedding_cache.aput_many(
+            missing, EMBEDDING_MODEL, [data.embedding for data in sorted(response.data, key=lambda d: d.index)])
+        created = dict(zip(missing, stored))
+        embeddings = [embedding if embedding is not None else created[name]
+                      for name, embedding in zip(object_names, embeddings)]
+    return embeddings
 
 # Function to retrieve bin classification using Neo4j
 def retrieve_bin_for_object(object_name):
     """
     Retrieves the bin type for an object from Neo4j if it exists.
+    Answers from the in-memory table when it has been loaded, which also
+    resolves normalized and near-exact names.
     """
+    if bin_table.loaded:
+        match = bin_table.match(object_name, NAME_MATCH_THRESHOLD)
+        return match[0] if match else "None"
+
     with driver.session() as session:
-        query = """
-        MATCH (g:Item {name: $object_name})-[:SHOULD_GO_IN]->(b:Bin)
-        RETURN b.type AS bin_type
-        """
-        result = session.run(query, object_name=object_name)
+        result = session.run(BIN_FOR_OBJECT_QUERY, object_name=object_name)
         # record.single() returns a single record or None if no records are found
         # eg: record = {"bin_type": "recyclable"}
         record = result.single()
@@ -51,6 +173,79 @@ def retrieve_bin_for_object(object_name):
             return record["bin_type"]
         return "None"
 
+def retrieve_bins_for_objects(object_names):
+    """
+    Retrieves the bin types for several objects in one batched lookup.
+    Returns a dict of object name -> bin type ("None" when unknown).
+    """
+    if bin_table.loaded:
+        return {name: retrieve_bin_for_object(name) for name in object_names}
+
+    with driver.session() as session:
+        result = session.run(BINS_FOR_OBJECTS_QUERY, object_names=list(object_names))
+        bins = {record["object_name"]: record["bin_type"] for record in result}
+    return {name: bins.get(name) or "None" for name in object_names}
+
+async def aretrieve_bin_for_object(object_name):
+    """
+    Async version of retrieve_bin_for_object for request handlers.
+    Uses the app's async driver so a database round trip never blocks the event loop.
+    """
+    if bin_table.loaded:
+        match = bin_table.match(object_name, NAME_MATCH_THRESHOLD)
+        return match[0] if match else "None"
+
+    async_driver = get_async_driver()
+    if async_driver is None:
+        return await asyncio.to_thread(retrieve_bin_for_object, object_name)
+    async with async_driver.session() as session:
+        result = await session.run(BIN_FOR_OBJECT_QUERY, object_name=object_name)
+        record = await result.single()
+        return record["bin_type"] if record else "None"
+
+async def aretrieve_bins_for_objects(object_names):
+    """
+    Async version of retrieve_bins_for_objects.
+    """
+    if bin_table.loaded:
+        return {name: retrieve_bin_for_object(name) for name in object_names}
+
+    async_driver = get_async_driver()
+    if async_driver is None:
+        return await asyncio.to_thread(retrieve_bins_for_objects, object_names)
+    async with async_driver.session() as session:
+        result = await session.run(BINS_FOR_OBJECTS_QUERY, object_names=list(object_names))
+        bins = {record["object_name"]: record["bin_type"] async for record in result}
+    return {name: bins.get(name) or "None" for name in object_names}
+
+def learn_guess(object_name, query_embedding, bin_type, source, confidence=None):
+    """
+    Make a guessed bin an exact hit for the next request: add it to the
+    in-memory table and FAISS index now, and persist it as a provisional
+    Item through the write-behind queue.
+    """
+    if not write_back.running:
+        return
+    snapshot = index_holder.current
+    known_bins = bin_table.bin_types or set(snapshot.item_bins or ())
+    if bin_type not in known_bins:
+        return
+    if confidence is not None and confidence < WRITE_BACK_MIN_CONFIDENCE:
+        return
+    name = normalize_name(object_name)
+    if not name:
+        return
+
+    bin_table.add(name, bin_type)
+    # Item ids are positions in item_names, so the new row's id is its length. The
+    # row is named before the vector is added, so no search can return an unnamed id.
+    item_id = len(snapshot.item_names)
+    snapshot.item_names.append(name)
+    if snapshot.item_bins is not None:
+        snapshot.item_bins.append(bin_type)
+    search_batcher.add(snapshot.index, query_embedding, ids=[item_id])
+    write_back.enqueue(name, bin_type, query_embedding, source=source, confidence=confidence)
+
 # Function to generate a plausible bin classification using context from Neo4j and LangChain
 def generate_guess(object_name):
     """
@@ -81,27 +276,178 @@ def generate_guess(object_name):
 
     query_embedding = generate_embedding_for_query(object_name)
 
-    # Find similar items using Faiss (the Facebook Algorithm)
-    similar_items = search_similar_items(query_embedding, index, item_names, top_k=5)
+    # A paraphrase of an earlier query gets the earlier answer
+    cached = semantic_cache.lookup(query_embedding, bin_table.version)
+    if cached:
+        return cached[0]
+
+    # Find similar items using Faiss (the Facebook Algorithm), with their bins and distances
+    snapshot = index_holder.current
+    similar_items = search_similar_items_scored(query_embedding, snapshot.index, snapshot.item_names,
+                                                snapshot.item_bins, top_k=5)
+
+    # Only fall back to the database when the label array is unavailable
+    missing = [item for item, bin_type, _ in similar_items if bin_type is None]
+    if missing:
+        similar_items = fill_missing_bins(similar_items, retrieve_bins_for_objects(missing))
+
+    # If the close neighbours agree on a bin there is nothing for the LLM to decide
+    voted_bin = vote_for_bin(object_name, query_embedding, similar_items)
+    if voted_bin:
+        return voted_bin
+
+     # Call the LLM to generate a guess
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=build_guess_messages(object_name, similar_items),
+        max_tokens=50
+    )
+
+    return remember_guess(object_name, query_embedding, response.choices[0].message.content)
+
+async def agenerate_guess(object_name, query_embedding=None):
+    """
+    Async version of generate_guess. Pass `query_embedding` when the caller
+    already started embedding the query.
+    """
+    if query_embedding is None:
+        query_embedding = await agenerate_embedding_for_query(object_name)
+
+    cached = semantic_cache.lookup(query_embedding, bin_table.version)
+    if cached:
+        return cached[0]
+
+    # Batched with the searches of other in-flight requests, off the event loop
+    similar_items = (await search_batcher.asearch(index_holder.current, [query_embedding], top_k=5))[0]
+
+    missing = [item for item, bin_type, _ in similar_items if bin_type is None]
+    if missing:
+        similar_items = fill_missing_bins(similar_items, await aretrieve_bins_for_objects(missing))
+
+    voted_bin = vote_for_bin(object_name, query_embedding, similar_items)
+    if voted_bin:
+        return voted_bin
+
+    response = await async_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=build_guess_messages(object_name, similar_items),
+        max_tokens=50
+    )
+
+    return remember_guess(object_name, query_embedding, response.choices[0].message.content)
 
+def fill_missing_bins(similar_items, bins):
+    return [(item, bin_type or bins[item], distance) for item, bin_type, distance in similar_items]
+
+def vote_for_bin(object_name, query_embedding, similar_items):
+    """
+    Return the bin the neighbours agree on, or None when the LLM should decide.
+    """
+    vote = vote_on_neighbours(similar_items, KNN_MAX_DISTANCE, KNN_MIN_CONFIDENCE, KNN_MIN_NEIGHBOURS)
+    if not vote:
+        return None
+    bin_type, confidence = vote
+    learn_guess(object_name, query_embedding, bin_type, "knn", confidence)
+    return bin_type
+
+def build_guess_messages(object_name, similar_items):
     # Prepare context from similar items
     context_lines = []
-    for item in similar_items:
-        bin_type = retrieve_bin_for_object(item)
+    for item, bin_type, _ in similar_items:
         context_lines.append(f"{item} goes into {bin_type}")
     context = "\n".join(context_lines)
 
     # Generate a prompt using the context 
     prompt = f"Based on the following context:\n{context}\nWhere should '{object_name}' go?"
 
-     # Call the LLM to generate a guess
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are an AI assistant that classifies waste items into bins. Your task is to respond only with the bin type, such as 'garbage bin', 'yellow bin', 'blue bin', or 'green bin'. Provide no explanation, no extra text, and no formatting."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=50
-    )
+    return [
+        {"role": "system", "content": "You are an AI assistant that classifies waste items into bins. Your task is to respond only with the bin type, such as 'garbage bin', 'yellow bin', 'blue bin', or 'green bin'. Provide no explanation, no extra text, and no formatting."},
+        {"role": "user", "content": prompt}
+    ]
+
+def remember_guess(object_name, query_embedding, guess):
+    semantic_cache.add(query_embedding, guess, object_name, bin_table.version)
+    learn_guess(object_name, query_embedding, guess, "llm")
+    return guess
+
+async def agenerate_guesses(object_names):
+    """
+    Batch version of agenerate_guess for a list of distinct names.
+
+    Makes one embeddings call, one FAISS search and at most one LLM call
+    for all the names, asking the model for a JSON object of name -> bin.
+    Returns (guesses, errors): dicts of name -> bin type and name -> message.
+    """
+    guesses = {}
+    errors = {}
+    if not object_names:
+        return guesses, errors
+
+    try:
+        embeddings = await agenerate_embeddings_for_queries(object_names)
+    except Exception as e:
+        return guesses, {name: f"Error generating embedding: {e}" for name in object_names}
+
+    pending = []
+    for name, embedding in zip(object_names, embeddings):
+        cached = semantic_cache.lookup(embedding, bin_table.version)
+        if cached:
+            guesses[name] = cached[0]
+        else:
+            pending.append((name, embedding))
+    if not pending:
+        return guesses, errors
+
+    try:
+        neighbours = await search_batcher.asearch(
+            index_holder.current, [embedding for _, embedding in pending], top_k=5)
+
+        missing = {item for similar_items in neighbours for item, bin_type, _ in similar_items if bin_type is None}
+        if missing:
+            missing_bins = await aretrieve_bins_for_objects(sorted(missing))
+            neighbours = [fill_missing_bins(similar_items, missing_bins) for similar_items in neighbours]
+    except Exception as e:
+        errors.update({name: f"Error searching similar items: {e}" for name, _ in pending})
+        return guesses, errors
+
+    undecided = []
+    for (name, embedding), similar_items in zip(pending, neighbours):
+        voted_bin = vote_for_bin(name, embedding, similar_items)
+        if voted_bin:
+            guesses[name] = voted_bin
+        else:
+            undecided.append((name, embedding, similar_items))
+    if not undecided:
+        return guesses, errors
+
+    try:
+        response = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=build_batch_guess_messages([(name, similar_items) for name, _, similar_items in undecided]),
+            response_format={"type": "json_object"},
+            max_tokens=50 + 20 * len(undecided)
+        )
+        answers = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        errors.update({name: f"Error generating guess: {e}" for name, _, _ in undecided})
+        return guesses, errors
+
+    for name, embedding, _ in undecided:
+        guess = answers.get(name) if isinstance(answers, dict) else None
+        if isinstance(guess, str) and guess:
+            guesses[name] = remember_guess(name, embedding, guess)
+        else:
+            errors[name] = "No guess returned for this item"
+    return guesses, errors
+
+def build_batch_guess_messages(items):
+    sections = []
+    for object_name, similar_items in items:
+        context = "\n".join(f"{item} goes into {bin_type}" for item, bin_type, _ in similar_items)
+        sections.append(f"Item: {object_name}\nContext:\n{context}")
+    prompt = "Where should each of the following items go?\n\n" + "\n\n".join(sections)
 
-    return (response.choices[0].message.content)
\ No newline at end of file
+    return [
+        {"role": "system", "content": "You are an AI assistant that classifies waste items into bins. Respond with a JSON object that maps every item name, exactly as given, to its bin type, such as 'garbage bin', 'yellow bin', 'blue bin', or 'green bin'. Provide no explanation and no other keys."},
+        {"role": "user", "content": prompt}
+    ]
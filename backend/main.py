@@ -1,20 +1,113 @@
+import asyncio
+import base64
+import hmac
+import io
 import os
 from fastapi import FastAPI, HTTPException, requests
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from model.garbage_model import classify_object  # Reusing your existing function
+from controller.garbage_controller import router as garbage_router
 from typing import Dict
-import openai
 import boto3
 from botocore.exceptions import NoCredentialsError
-from openai import OpenAI
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from langchain_helper import (async_client, bin_table, embedding_cache, index_holder, search_batcher,
+                              seed_bin_table_from_snapshot, semantic_cache, write_back)
+from db import close_async_driver, close_driver, open_async_driver
+from image_cache import ImageResultCache, NearDuplicateIndex
+from image_preprocess import ImagePreprocessor
+from upload_queue import UploadQueue
+from snapshot import current_version, publish_version
+from upload_stream import UploadTooLarge, read_request_upload
 
-# Initialize the FastAPI app
-app = FastAPI()
 load_dotenv()
 
+# How often to check Neo4j for a new dataset version stamp
+BIN_TABLE_REFRESH_SECONDS = float(os.getenv("BIN_TABLE_REFRESH_SECONDS", "60"))
+# How often to check the snapshot directory for a newer index snapshot
+INDEX_RELOAD_SECONDS = float(os.getenv("INDEX_RELOAD_SECONDS", "30"))
+# Required in the X-Admin-Token header of admin endpoints, which are off without it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Results for repeat uploads of the same image; set the path to "" for memory only
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", "image_cache.sqlite3")
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "86400"))
+image_cache = ImageResultCache(IMAGE_CACHE_PATH or None, IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL_SECONDS)
+# Photos whose perceptual hashes differ in at most this many of 256 bits, and
+# whose 8x8 colour grids differ by at most the colour tolerance (0-255) in
+# every cell, reuse the earlier vision result; -1 turns near-duplicate matching off
+IMAGE_PHASH_MAX_DISTANCE = int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "16"))
+IMAGE_PHASH_MAX_COLOR_DIFFERENCE = int(os.getenv("IMAGE_PHASH_MAX_COLOR_DIFFERENCE", "32"))
+IMAGE_PHASH_CAPACITY = int(os.getenv("IMAGE_PHASH_CAPACITY", "4096"))
+near_duplicates = NearDuplicateIndex(IMAGE_PHASH_MAX_DISTANCE, IMAGE_PHASH_MAX_COLOR_DIFFERENCE,
+                                     IMAGE_PHASH_CAPACITY, IMAGE_CACHE_TTL_SECONDS)
+# Decodes, orients, downsizes and re-encodes uploads before they are stored or looked at
+image_preprocessor = ImagePreprocessor()
+# "inline" sends the image to the vision model as a data URL and archives it to
+# R2 in the background; "url" uploads first and has the model fetch it from R2
+VISION_IMAGE_MODE = os.getenv("VISION_IMAGE_MODE", "inline")
+# Archival uploads that have not reached R2 yet; set the path to "" for memory only
+UPLOAD_QUEUE_PATH = os.getenv("UPLOAD_QUEUE_PATH", "upload_queue.sqlite3")
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "8"))
+# Allowance for multipart framing when refusing uploads by Content-Length
+UPLOAD_FRAMING_BYTES = 1 << 16
+# Larger uploads are refused with 413 while they stream in
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+# Uploads are held in memory up to this size and in a temporary file beyond it
+UPLOAD_SPILL_BYTES = int(os.getenv("UPLOAD_SPILL_BYTES", str(8 * 1024 * 1024)))
+
+
+async def load_bin_table(async_driver):
+    try:
+        await bin_table.aload(async_driver)
+    except Exception as e:
+        # Lookups fall back to the snapshot table or to querying Neo4j directly until a refresh succeeds
+        print(f"Could not load bin lookup table: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the shared async Neo4j driver, load the Item -> Bin table (from the
+    index snapshot when it has bin labels, otherwise from Neo4j before serving)
+    and keep it fresh in the background. Also runs the write-behind
+    queue that persists learned guesses, the batched search dispatcher, the
+    image preprocessing pool, the R2 archival queue and the watcher that swaps
+    in new index snapshots.
+    """
+    async_driver = await open_async_driver()
+    if seed_bin_table_from_snapshot():
+        # Serve from the snapshot right away; the full Neo4j mapping replaces it when it arrives
+        neo4j_load = asyncio.create_task(load_bin_table(async_driver))
+    else:
+        neo4j_load = None
+        await load_bin_table(async_driver)
+    bin_table.start_background_refresh(BIN_TABLE_REFRESH_SECONDS)
+    index_holder.start_watching(INDEX_RELOAD_SECONDS)
+    search_batcher.start()
+    image_preprocessor.start()
+    upload_queue.start()
+    write_back.start()
+    yield
+    if neo4j_load is not None:
+        neo4j_load.cancel()
+    write_back.stop()
+    upload_queue.stop()
+    image_preprocessor.stop()
+    search_batcher.stop()
+    index_holder.stop_watching()
+    bin_table.stop_background_refresh()
+    await close_async_driver()
+    close_driver()
+
+
+# Initialize the FastAPI app
+app = FastAPI(lifespan=lifespan)
+
 origins = [
     "http://localhost:3000",
     "http://localhost:3001",
@@ -30,6 +123,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Text entry points: /classify and /classify/batch
+app.include_router(garbage_router)
+
 
 R2_ENDPOINT_URL = "https://22cd0c0ab575858f5c908a2265cf8fd6.r2.cloudflarestorage.com/image-pipeline"
 R2_PUBLIC_URL = "https://pub-9521fd3eff274d20a3f9da1ab742e301.r2.dev"
@@ -40,8 +136,6 @@ R2_REGION = "wnam"
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-openai = OpenAI(api_key=OPENAI_API_KEY)
-
 s3_client = boto3.client(
     "s3",
     endpoint_url=R2_ENDPOINT_URL,
@@ -51,29 +145,117 @@ s3_client = boto3.client(
 )
 
 
-@app.post("/upload/")
-async def upload_and_detect_and_run_model_and_response(file: UploadFile = File(...)):
+def archive_to_r2(data, key):
+    # upload_fileobj switches to a multipart upload for large objects
+    s3_client.upload_fileobj(io.BytesIO(data), R2_BUCKET_NAME, key)
+
+
+upload_queue = UploadQueue(archive_to_r2, UPLOAD_QUEUE_PATH or None, UPLOAD_MAX_ATTEMPTS)
+
+
+# The upload route reads its body itself, so describe the form for the API docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+@app.post("/upload/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_and_detect_and_run_model_and_response(request: Request):
     """
     Upload an image to the R2 endpoint.
+    A photo that was classified before is answered from the image cache,
+    without saving, uploading or looking at it again. A near-duplicate of an
+    earlier photo reuses that photo's vision result. Everything else is
+    downsized and re-encoded before it is uploaded and sent to the vision model.
+    The "file" form field (or a raw image/* body) is hashed and size-checked
+    as it streams in, and nothing is written to local disk unless the image is
+    past UPLOAD_SPILL_BYTES.
     """
-    print(f"File uploaded: {file.filename}")    
-    if not os.path.exists("images"):
-        os.makedirs("images")
-    
-    file_path = f"images/{file.filename}"
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
-    
-    # print(f"File saved: {file_path}")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES + UPLOAD_FRAMING_BYTES:
+        # Refuse before reading; the allowance covers multipart framing
+        raise HTTPException(status_code=413, detail=f"Image is larger than {UPLOAD_MAX_BYTES} bytes")
+    try:
+        upload, filename, content_type = await read_request_upload(
+            request, "file", UPLOAD_MAX_BYTES, UPLOAD_SPILL_BYTES
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    print(f"File uploaded: {filename}")
+    try:
+        return await classify_upload(upload, filename, content_type or "image/jpeg")
+    finally:
+        upload.close()
+
+
+async def classify_upload(upload, filename, content_type):
+    """
+    Answer from the image cache, a near-duplicate or the vision model.
+    """
+    content_hash = upload.hexdigest
+    # Objects are keyed by content, so users uploading "photo.jpg" at the same time never collide
+    extension = os.path.splitext(filename)[1].lower()
+    cached = image_cache.get(content_hash)
+    if cached is not None:
+        return cached
+
+    phash = None
+    # The worker process reads a spilled upload from its file instead of a pickled copy
+    prepared = await image_preprocessor.process(upload.source(), upload.size)
+    if prepared is None:
+        # Formats Pillow cannot decode go to the vision model as sent
+        data = upload.read()
+    else:
+        data = prepared["data"]
+        extension = prepared["extension"]
+        content_type = prepared["content_type"]
+        if IMAGE_PHASH_MAX_DISTANCE >= 0:
+            phash = prepared["phash"]
+    result = near_duplicates.get(phash, prepared["colors"]) if phash is not None else None
+    if result is None:
+        result = await detect_object(content_hash + extension, data, content_type)
+        if phash is not None:
+            near_duplicates.put(phash, prepared["colors"], result)
+    else:
+        # New bytes, so archive them like a miss; the vision call is what a near-duplicate saves
+        await asyncio.to_thread(upload_queue.put, data, content_hash + extension)
 
-    s3_client.upload_file(file_path, R2_BUCKET_NAME, file.filename)
-    # print(f"File uploaded to R2: {file.filename}")
-    # Save the image to the R2 endpoint
-    image_url = f"{R2_PUBLIC_URL}/{R2_BUCKET_NAME}/{file.filename}"
-    # print(f"File uploaded Successfully: {image_url}")
+    classification = await classify_object(result)
+    if classification.get("bin_type") not in (None, "None"):
+        image_cache.put(content_hash, classification)
+    return classification
+
+
+async def detect_object(key, data, content_type="image/jpeg"):
+    """
+    Archive the image to R2 as `key` and ask the vision model what it shows.
+    """
+    if VISION_IMAGE_MODE == "url":
+        # The model fetches the image from R2, so it has to be there first
+        await asyncio.to_thread(archive_to_r2, data, key)
+        # print(f"File uploaded to R2: {key}")
+        image_url = f"{R2_PUBLIC_URL}/{R2_BUCKET_NAME}/{key}"
+        # print(f"File uploaded Successfully: {image_url}")
+    else:
+        # The insert (and the upload itself before the worker starts) stays off the event loop
+        await asyncio.to_thread(upload_queue.put, data, key)
+        image_url = f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
  
     try:
-        response = openai.chat.completions.create(
+        response = await async_client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {
@@ -84,6 +266,7 @@ async def upload_and_detect_and_run_model_and_response(file: UploadFile = File(.
                     "type": "image_url",
                     "image_url": {
                         "url": image_url,
+                        "detail": image_preprocessor.detail,
                     },
                     },
                 ],
@@ -94,13 +277,62 @@ async def upload_and_detect_and_run_model_and_response(file: UploadFile = File(.
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in GPT-4 Vision call: {str(e)}")
 
-    result = response.choices[0].message.content
-
-    return classify_object(result)
+    return response.choices[0].message.content
     
 
 
+@app.get("/stats/")
+async def cache_stats():
+    """
+    Report hit and miss counters for the in-process caches.
+    """
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "image_cache": image_cache.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "image_preprocessing": image_preprocessor.stats(),
+        "uploads": upload_queue.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "write_back": write_back.stats(),
+        "index": index_holder.stats(),
+        "search": search_batcher.stats(),
+    }
+
+
+@app.post("/admin/reload-index")
+async def reload_index(version: str = None, x_admin_token: str = Header(None)):
+    """
+    Swap in the current index snapshot now instead of waiting for the watcher.
+    With `version` (e.g. to roll back), CURRENT is pointed at that version
+    first, so every worker's watcher follows it. Requests keep being served
+    from the old snapshot while the new one loads.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if version is not None and not version.isdigit():
+        # Versions are snapshot directory names; anything else could leave the directory
+        raise HTTPException(status_code=422, detail="Snapshot versions are numeric")
+    previous = current_version(index_holder.directory)
+    try:
+        if version is not None:
+            await asyncio.to_thread(publish_version, version, index_holder.directory)
+        reloaded = await asyncio.to_thread(index_holder.reload)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No index snapshot {version}")
+    except ValueError as e:
+        if version is not None and previous is not None:
+            # Put CURRENT back, so no other worker tries the rejected snapshot
+            await asyncio.to_thread(publish_version, previous, index_holder.directory)
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"published": current_version(index_holder.directory), "reloaded": reloaded, **index_holder.stats()}
+
+
 # Run the FastAPI app with Uvicorn if this script is executed as the main program
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import sys
+    # Serve through the uvicorn CLI rather than from this process: workers in the image
+    # preprocessing pool re-import a script __main__ module, and this one loads the index
+    # snapshot, caches and clients at import time
+    os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"])
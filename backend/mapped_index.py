@@ -0,0 +1,131 @@
+import faiss
+import numpy as np
+
+
+class MappedFlatIndex:
+    """
+    Exact (flat) index over a read-only, memory-mapped vector matrix.
+
+    faiss.read_index copies a flat index into private memory in every worker,
+    even with IO_FLAG_MMAP. Searching the snapshot's vectors.npy through a
+    memory map instead lets every worker on a host share one copy in the page
+    cache, and opening it costs the same whatever the catalog size. Vectors
+    added at runtime (learned items) go to a small private overflow matrix
+    that is searched alongside the mapped rows.
+
+    Searches return item ids: `ids[row]` when the snapshot stores row ids,
+    otherwise the row itself.
+    """
+
+    def __init__(self, vectors, metric=faiss.METRIC_L2, ids=None):
+        self.vectors = vectors
+        self.ids = ids
+        self.metric_type = metric
+        self.d = vectors.shape[1]
+        self._extra = np.empty((0, self.d), dtype='float32')
+        self._extra_ids = np.empty(0, dtype='int64')
+        self._next_id = int(ids[-1]) + 1 if ids is not None and len(ids) else len(vectors)
+
+    @property
+    def ntotal(self):
+        return len(self.vectors) + len(self._extra)
+
+    def add(self, x):
+        x = np.ascontiguousarray(x, dtype='float32').reshape(-1, self.d)
+        self.add_with_ids(x, np.arange(self._next_id, self._next_id + len(x)))
+
+    def add_with_ids(self, x, ids):
+        x = np.ascontiguousarray(x, dtype='float32').reshape(-1, self.d)
+        ids = np.asarray(ids, dtype='int64')
+        self._extra = np.concatenate([self._extra, x])
+        self._extra_ids = np.concatenate([self._extra_ids, ids])
+        if len(ids):
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype='float32').reshape(-1, self.d)
+        distances, indices = self._search_mapped(x, k)
+        if not len(self._extra):
+            return distances, indices
+
+        extra_distances, extra_indices = self._knn(x, self._extra, k)
+        extra_indices = _to_ids(extra_indices, self._extra_ids)
+        distances = np.concatenate([distances, extra_distances], axis=1)
+        indices = np.concatenate([indices, extra_indices], axis=1)
+        order = np.argsort(-distances if self.metric_type == faiss.METRIC_INNER_PRODUCT else distances,
+                           axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _search_mapped(self, x, k):
+        distances, indices = self._knn(x, self.vectors, k)
+        if self.ids is not None:
+            indices = _to_ids(indices, self.ids)
+        return distances, indices
+
+    def _knn(self, x, vectors, k):
+        if not len(vectors):
+            empty = -np.inf if self.metric_type == faiss.METRIC_INNER_PRODUCT else np.inf
+            return (np.full((len(x), k), empty, dtype='float32'),
+                    np.full((len(x), k), -1, dtype='int64'))
+        return faiss.knn(x, vectors, k, metric=self.metric_type)
+
+
+class MappedIVFIndex(MappedFlatIndex):
+    """
+    IVF index read from index.faiss with IO_FLAG_MMAP, so its inverted lists
+    are shared through the page cache like a flat snapshot's vectors.npy. The
+    mapped lists are read-only (adding to them aborts the process), so vectors
+    added at runtime go to the same private overflow matrix as MappedFlatIndex.
+    `index` is the ID-mapped index, and its searches already return item ids.
+    """
+
+    def __init__(self, index, vectors, ids=None):
+        super().__init__(vectors, index.metric_type, ids)
+        self.index = index
+
+    def _search_mapped(self, x, k):
+        return self.index.search(x, k)
+
+
+def _to_ids(rows, ids):
+    # -1 marks "no neighbour" and stays -1
+    if not len(ids):
+        return np.full_like(rows, -1)
+    return np.where(rows >= 0, np.asarray(ids)[np.maximum(rows, 0)], -1)
+
+
+class MappedColumn:
+    """
+    Read-only, memory-mapped string column (item names, bin labels) with a
+    private append-only tail for rows added at runtime.
+    """
+
+    def __init__(self, array):
+        self._array = array
+        self._tail = []
+
+    def __len__(self):
+        return len(self._array) + len(self._tail)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return list(self)[position]
+        if position < 0:
+            position += len(self)
+        if position < len(self._array):
+            return str(self._array[position])
+        return self._tail[position - len(self._array)]
+
+    def __iter__(self):
+        for value in self._array:
+            yield str(value)
+        yield from self._tail
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def append(self, value):
+        self._tail.append(value)
+
+    def tolist(self):
+        return list(self)
@@ -1,22 +1,76 @@
-from langchain_helper import retrieve_bin_for_object, generate_guess
-from typing import Dict
+import asyncio
+import contextlib
+from langchain_helper import (aretrieve_bin_for_object, aretrieve_bins_for_objects,
+                              agenerate_embedding_for_query, agenerate_guess, agenerate_guesses)
+from typing import Dict, List
 
-def classify_object(object_name: str) -> Dict[str, str]:
+async def discard_task(task):
+    """
+    Cancel a task whose result is no longer needed and wait for it, so an error
+    it already raised is retrieved instead of logged as never retrieved.
+    """
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError, Exception):
+        await task
+
+async def classify_object(object_name: str) -> Dict[str, str]:
     """
     Classify an object into a bin type.
     Uses a combination of Neo4j and LangChain to classify the object.
 
+    The query embedding is requested speculatively while the exact lookup
+    runs, so a miss does not pay for the two round trips in series. It is
+    cancelled when the lookup hits.
+
     Returns:
         dict: {
             "object_name": str,
             "bin_type": str
         }
     """
+    embedding_task = asyncio.create_task(agenerate_embedding_for_query(object_name))
+
     # Try to retrieve the bin type from Neo4j
-    bin_type = retrieve_bin_for_object(object_name)
+    try:
+        bin_type = await aretrieve_bin_for_object(object_name)
+    except BaseException:
+        await discard_task(embedding_task)
+        raise
     if bin_type and bin_type != "None":
+        await discard_task(embedding_task)
         return {"object_name": object_name, "bin_type": bin_type}
 
-    guesstimate_bin = generate_guess(object_name)
+    query_embedding = await embedding_task
+    guesstimate_bin = await agenerate_guess(object_name, query_embedding)
     
-    return {"object_name": object_name, "bin_type": guesstimate_bin}
\ No newline at end of file
+    return {"object_name": object_name, "bin_type": guesstimate_bin}
+
+async def classify_objects(object_names: List[str]) -> List[Dict[str, str]]:
+    """
+    Classify many objects at once.
+    Names are deduplicated, exact hits are resolved in one bulk lookup and
+    all misses share one embeddings call, one FAISS search and one LLM call.
+
+    Returns a list aligned with object_names of either
+    {"object_name": str, "bin_type": str} or {"object_name": str, "error": str}.
+    """
+    unique_names = list(dict.fromkeys(object_names))
+
+    try:
+        bins = await aretrieve_bins_for_objects(unique_names)
+    except Exception as e:
+        # Without the exact stage every name is still worth guessing
+        print(f"Bulk bin lookup failed: {e}")
+        bins = {}
+
+    misses = [name for name in unique_names if not bins.get(name) or bins[name] == "None"]
+    guesses, errors = await agenerate_guesses(misses)
+
+    results = []
+    for name in object_names:
+        if name in errors:
+            results.append({"object_name": name, "error": errors[name]})
+        else:
+            bin_type = guesses.get(name) or bins.get(name)
+            results.append({"object_name": name, "bin_type": bin_type})
+    return results
\ No newline at end of file
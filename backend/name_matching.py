@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Words ending in these are usually singular already ("glass", "asbestos", "cactus")
+_SINGULAR_SUFFIXES = ("ss", "us", "is", "os")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _singularize(word):
+    if len(word) <= 3 or word.endswith(_SINGULAR_SUFFIXES):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name):
+    """
+    Canonical form of an item name used for matching.
+
+    Folds case and accents, drops punctuation, collapses whitespace and
+    singularizes each word, so "Plastic bottles." and "plastic bottle"
+    normalize to the same string.
+    """
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = _PUNCTUATION.sub(" ", name.lower()).replace("_", " ")
+    words = _WHITESPACE.sub(" ", name).strip().split(" ")
+    return " ".join(_singularize(word) for word in words if word)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to normalized item names.
+
+    Candidates are scored with the Dice coefficient of their trigram sets, which
+    tolerates typos and small wording differences without an edit-distance scan
+    over the whole catalog.
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._grams = []
+        self._postings = defaultdict(list)
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        grams = trigrams(name)
+        name_id = len(self._names)
+        self._names.append(name)
+        self._grams.append(len(grams))
+        for gram in grams:
+            self._postings[gram].append(name_id)
+
+    def best_match(self, query, threshold=0.0):
+        """
+        Return (name, score) for the closest indexed name, or None if nothing
+        scores at least `threshold`.
+        """
+        query_grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for name_id in self._postings.get(gram, ()):
+                shared[name_id] += 1
+
+        best = None
+        for name_id, count in shared.items():
+            score = 2.0 * count / (len(query_grams) + self._grams[name_id])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (self._names[name_id], score)
+        return best
@@ -1,25 +1,68 @@
 import csv
-from neo4j import GraphDatabase
+import os
+import sys
+import time
+from itertools import islice
 
-# Neo4j connection settings
-uri = "bolt://localhost:7687"
-driver = GraphDatabase.driver(uri, auth=("neo4j", "testpassword"))
+# Reuse the backend's shared driver settings when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bin_lookup import bump_dataset_version
+from db import ensure_schema, get_driver
 
-def load_csv_to_neo4j(csv_file_path):
+driver = get_driver()
+
+# Rows per UNWIND transaction
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "5000"))
+
+# Curated rows clear provisional (learned) flags and replace any earlier bin edge
+LOAD_BATCH_QUERY = """
+UNWIND $rows AS row
+MERGE (i:Item {name: row.item})
+SET i.source = 'catalog'
+REMOVE i.provisional, i.confidence
+MERGE (b:Bin {type: row.bin})
+WITH i, b
+OPTIONAL MATCH (i)-[old:SHOULD_GO_IN]->(other:Bin)
+WHERE other <> b
+DELETE old
+WITH DISTINCT i, b
+MERGE (i)-[:SHOULD_GO_IN]->(b)
+"""
+
+def read_rows(csv_file_path, batch_size):
+    """
+    Lazily yield lists of up to batch_size {item, bin} rows.
+    """
+    with open(csv_file_path, 'r') as csvfile:
+        reader = ({"item": row['item'], "bin": row['bin']} for row in csv.DictReader(csvfile))
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                return
+            yield batch
+
+def load_csv_to_neo4j(csv_file_path, batch_size=LOAD_BATCH_SIZE):
     """
     Load data from CSV to Neo4j.
+    Duplicate nodes left by earlier loads are merged and constraints created
+    first so every MERGE is an index seek, then rows
+    are written in UNWIND batches, one explicit transaction per batch.
     """
+    start = time.perf_counter()
+    loaded = 0
     with driver.session() as session:
-        with open(csv_file_path, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                item = row['item']
-                bin = row['bin']
-                session.run("""
-                    MERGE (i:Item {name: $item})
-                    MERGE (b:Bin {type: $bin})
-                    MERGE (i)-[:SHOULD_GO_IN]->(b)
-                """, item=item, bin=bin)
-
-# Example usage:
-load_csv_to_neo4j("dataset.csv")
\ No newline at end of file
+        ensure_schema(session, dedupe=True)
+        for batch in read_rows(csv_file_path, batch_size):
+            session.execute_write(lambda tx: tx.run(LOAD_BATCH_QUERY, rows=batch).consume())
+            loaded += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"Loaded {loaded} rows ({loaded / elapsed:.0f} rows/sec)")
+        # Running servers poll the dataset version and reload their bin table when it changes
+        bump_dataset_version(session)
+
+    elapsed = time.perf_counter() - start
+    print(f"Finished loading {loaded} rows in {elapsed:.1f}s ({loaded / elapsed if elapsed else 0:.0f} rows/sec)")
+    return loaded
+
+if __name__ == "__main__":
+    load_csv_to_neo4j("dataset.csv")
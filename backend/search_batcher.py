@@ -0,0 +1,190 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import faiss
+import numpy as np
+
+# Queries gathered into one index.search call, and how long the first one waits for company
+SEARCH_MAX_BATCH = int(os.getenv("SEARCH_MAX_BATCH", "64"))
+SEARCH_BATCH_WAIT_MS = float(os.getenv("SEARCH_BATCH_WAIT_MS", "1"))
+# OpenMP threads FAISS may use per batch; with several uvicorn workers, give each cores / workers
+FAISS_SEARCH_THREADS = int(os.getenv("FAISS_SEARCH_THREADS", str(os.cpu_count() or 1)))
+
+
+class _Search:
+    def __init__(self, snapshot, queries, top_k):
+        self.snapshot = snapshot
+        self.queries = queries
+        self.top_k = top_k
+        self.future = Future()
+
+
+class _Add:
+    def __init__(self, index, vectors, ids):
+        self.index = index
+        self.vectors = vectors
+        self.ids = ids
+        self.future = Future()
+
+
+class SearchBatcher:
+    """
+    Runs every index search in the process on one dispatcher thread.
+
+    Requests queue their query vectors and get a future back. The dispatcher
+    takes whatever has queued up (waiting up to `max_wait_ms` for more once
+    the first query arrives), runs one index.search per snapshot for the whole
+    batch with FAISS limited to `threads` OpenMP threads, and resolves each
+    future with its own rows. Under load the per-call overhead is paid once per
+    batch and searches no longer compete for OpenMP threads; a lone query only
+    waits for the short window.
+
+    Rows learned at runtime are added to the index on the same thread, so
+    adds never race with searches. When the dispatcher is not running,
+    everything runs inline on the caller's thread.
+    """
+
+    def __init__(self, search, add, max_batch_size=SEARCH_MAX_BATCH, max_wait_ms=SEARCH_BATCH_WAIT_MS,
+                 threads=FAISS_SEARCH_THREADS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.threads = threads
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._search = search
+        self._add = add
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, snapshot, query_embeddings, top_k=10):
+        """
+        Queue a search of `snapshot` for one or more queries. Returns a future
+        for one list of (item name, bin type, distance) triples per query.
+        """
+        request = _Search(snapshot, np.array(query_embeddings, dtype='float32').reshape(len(query_embeddings), -1),
+                          top_k)
+        if self.running:
+            self._queue.put(request)
+        else:
+            self._run_searches([request])
+        return request.future
+
+    def search(self, snapshot, query_embeddings, top_k=10):
+        return self.submit(snapshot, query_embeddings, top_k).result()
+
+    async def asearch(self, snapshot, query_embeddings, top_k=10):
+        return await asyncio.wrap_future(self.submit(snapshot, query_embeddings, top_k))
+
+    def add(self, index, vectors, ids=None):
+        """
+        Add learned vectors to `index` between searches. Does not wait for the add.
+        """
+        request = _Add(index, vectors, ids)
+        if self.running:
+            self._queue.put(request)
+        else:
+            self._run_add(request)
+        return request.future
+
+    def start(self):
+        if self.running:
+            return
+        faiss.omp_set_num_threads(self.threads)
+        self._thread = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the dispatcher after answering whatever is still queued.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            batch, stopping = self._gather()
+            self._process(batch)
+            if stopping:
+                return
+
+    def _gather(self):
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        size = len(first.queries) if isinstance(first, _Search) else 0
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                # Take what is already queued, then wait out the rest of the window
+                request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            if isinstance(request, _Search):
+                size += len(request.queries)
+        return batch, False
+
+    def _process(self, batch):
+        # Adds apply in arrival order, so a search queued after an add sees the new row
+        searches = []
+        for request in batch:
+            if isinstance(request, _Add):
+                self._run_searches(searches)
+                searches = []
+                self._run_add(request)
+            else:
+                searches.append(request)
+        self._run_searches(searches)
+
+    def _run_searches(self, requests):
+        groups = {}
+        for request in requests:
+            # Requests that started before a snapshot swap still search the old snapshot
+            groups.setdefault(id(request.snapshot), []).append(request)
+        for group in groups.values():
+            snapshot = group[0].snapshot
+            queries = np.concatenate([request.queries for request in group])
+            top_k = max(request.top_k for request in group)
+            try:
+                results = self._search(queries, snapshot.index, snapshot.item_names, snapshot.item_bins, top_k)
+            except Exception as e:
+                for request in group:
+                    request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(queries)
+            self.largest_batch = max(self.largest_batch, len(queries))
+            start = 0
+            for request in group:
+                rows = results[start:start + len(request.queries)]
+                request.future.set_result([row[:request.top_k] for row in rows])
+                start += len(request.queries)
+
+    def _run_add(self, request):
+        try:
+            request.future.set_result(self._add(request.index, request.vectors, request.ids))
+        except Exception as e:
+            request.future.set_exception(e)
@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded cache of previous bin guesses keyed by their query embeddings.
+
+    A lookup returns the cached bin of the nearest stored query when it lies
+    within `max_distance` (squared L2, like the FAISS index), so paraphrases
+    such as "water bottle" and "bottle of water" share one LLM answer.
+    Entries live in a preallocated matrix; when it is full the least recently
+    used entry is overwritten. Entries are tagged with the dataset version they
+    were produced under and dropped when it changes.
+    """
+
+    def __init__(self, max_entries=1024, max_distance=0.08):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._bins = [None] * max_entries
+        self._names = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+
+    def __len__(self):
+        return self._size
+
+    def lookup(self, embedding, version=None):
+        """
+        Return (bin_type, cached query name, distance) for the nearest cached
+        query within max_distance, or None.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._check_version(version)
+            if self._size == 0 or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            diffs = self._vectors[:self._size] - query
+            distances = np.einsum("ij,ij->i", diffs, diffs)
+            row = int(np.argmin(distances))
+            distance = float(distances[row])
+            if distance > self.max_distance:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[row] = self._clock
+            self.hits += 1
+            return self._bins[row], self._names[row], distance
+
+    def add(self, embedding, bin_type, object_name=None, version=None):
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used))
+            self._clock += 1
+            self._vectors[row] = vector
+            self._bins[row] = bin_type
+            self._names[row] = object_name
+            self._last_used[row] = self._clock
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._size,
+            "version": self.version,
+        }
+
+    def _check_version(self, version):
+        # Cached guesses were made against the old catalog; start over
+        if version != self.version:
+            self._clear()
+            self.version = version
+
+    def _clear(self):
+        self._size = 0
+        self._bins = [None] * self.max_entries
+        self._names = [None] * self.max_entries
+        self._last_used[:] = 0
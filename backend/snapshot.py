@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+import faiss
+import numpy as np
+
+from index_factory import base_index
+from mapped_index import MappedColumn, MappedFlatIndex, MappedIVFIndex
+from name_matching import normalize_name
+
+# Versioned index bundles live under this directory; CURRENT names the live one
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# Older bundles kept around for rollback
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+
+# Memory-map snapshots so uvicorn workers on one host share a single copy
+SNAPSHOT_MMAP = os.getenv("SNAPSHOT_MMAP", "true").lower() in ("1", "true", "yes")
+
+# Format 2 adds ids.npy and indexes the name/bin columns by item id; format 1 bundles still load
+SNAPSHOT_FORMAT = 2
+SUPPORTED_FORMATS = (1, 2)
+SNAPSHOT_FILES = ("index.faiss", "vectors.npy", "ids.npy", "names.npy", "bins.npy", "normalized_names.npy")
+
+VERIFIED_STAMP = ".verified"
+# Flat indexes are searched straight from the mapped vectors instead of index.faiss
+MAPPABLE_INDEX_TYPES = ("IndexFlat", "IndexFlatL2", "IndexFlatIP")
+# IVF indexes are read with their inverted lists memory-mapped from index.faiss
+MAPPABLE_IVF_INDEX_TYPES = ("IndexIVFFlat", "IndexIVFScalarQuantizer", "IndexIVFPQ")
+
+Snapshot = namedtuple("Snapshot", ["version", "manifest", "index", "vectors", "item_names",
+                                   "item_bins", "normalized_names"])
+
+
+def write_snapshot(index, vector_chunks, item_names, item_bins, embedding_model,
+                   dataset_version=None, directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP, index_spec=None,
+                   ids=None, metadata=None):
+    """
+    Write a self-describing bundle and make it the current snapshot.
+
+    `item_names` and `item_bins` are indexed by item id. `ids` lists the ids
+    in the index in ascending order (every id when omitted), and
+    `vector_chunks` is an iterable of float32 arrays whose rows are their
+    vectors, streamed into vectors.npy so the full matrix never has to be in
+    memory. `metadata` is merged into the manifest. Everything is written to a
+    staging directory, checksummed, renamed into place and only then
+    published through CURRENT, so readers never see a partial bundle.
+    Returns the new version.
+    """
+    count = index.ntotal
+    ids = np.arange(len(item_names)) if ids is None else np.asarray(ids, dtype='int64')
+    if (len(item_bins) != len(item_names) or len(ids) != count
+            or (count and (ids[0] < 0 or ids[-1] >= len(item_names)))):
+        raise ValueError(f"Snapshot rows do not line up: {count} vectors in the index, {len(ids)} ids, "
+                         f"{len(item_names)} names, {len(item_bins)} bins")
+
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, f".staging-{os.getpid()}-{time.time_ns()}")
+    os.makedirs(staging)
+    try:
+        faiss.write_index(index, os.path.join(staging, "index.faiss"))
+        _write_vectors(os.path.join(staging, "vectors.npy"), vector_chunks, count, index.d)
+        _save_array(os.path.join(staging, "ids.npy"), ids)
+        _save_array(os.path.join(staging, "names.npy"), np.array(item_names, dtype=str))
+        _save_array(os.path.join(staging, "bins.npy"), np.array(item_bins, dtype=str))
+        _save_array(os.path.join(staging, "normalized_names.npy"),
+                    np.array([normalize_name(name) for name in item_names], dtype=str))
+
+        files = {name: _sha256(os.path.join(staging, name)) for name in SNAPSHOT_FILES}
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "embedding_model": embedding_model,
+            "dimension": index.d,
+            "count": count,
+            "items": len(item_names),
+            "index_type": type(index).__name__,
+            "base_index_type": type(base_index(index)).__name__,
+            "index_spec": index_spec,
+            "metric_type": int(index.metric_type),
+            "dataset_version": dataset_version,
+            "created_at": time.time(),
+            "files": files,
+            "checksum": _bundle_checksum(files),
+            **(metadata or {}),
+        }
+        with open(os.path.join(staging, "manifest.json"), 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+        version = _publish(directory, staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _prune(directory, keep)
+    print(f"Wrote snapshot {version} with {count} items to {directory}.")
+    return version
+
+
+def current_version(directory=SNAPSHOT_DIR):
+    """
+    Return the version CURRENT points at, or None when no snapshot has been written.
+    """
+    try:
+        with open(os.path.join(directory, "CURRENT"), 'r') as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot(directory=SNAPSHOT_DIR, version=None, verify=True, mmap=SNAPSHOT_MMAP):
+    """
+    Load a bundle (the current one by default), or return None if there is none.
+    Raises ValueError when a file is missing or does not match its checksum.
+
+    With mmap, vectors and the name/bin columns are memory-mapped and flat
+    indexes search the mapped vectors directly, so every worker on a host
+    shares one copy and loading does not read the catalog. Checksums are
+    verified once per bundle; later loads trust the stamp that check leaves.
+    """
+    version = version or current_version(directory)
+    if version is None:
+        return None
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, "manifest.json"), 'r') as file:
+        manifest = json.load(file)
+    if manifest.get("format") not in SUPPORTED_FORMATS:
+        raise ValueError(f"Snapshot {version} has unsupported format {manifest.get('format')}")
+    if verify and not _is_verified(path, manifest):
+        verify_snapshot(path, manifest)
+        _mark_verified(path, manifest)
+
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r') if "ids.npy" in manifest["files"] else None
+    if mmap:
+        item_names = MappedColumn(np.load(os.path.join(path, "names.npy"), mmap_mode='r'))
+        item_bins = MappedColumn(np.load(os.path.join(path, "bins.npy"), mmap_mode='r'))
+        normalized_names = MappedColumn(np.load(os.path.join(path, "normalized_names.npy"), mmap_mode='r'))
+    else:
+        item_names = np.load(os.path.join(path, "names.npy")).tolist()
+        item_bins = np.load(os.path.join(path, "bins.npy")).tolist()
+        normalized_names = np.load(os.path.join(path, "normalized_names.npy")).tolist()
+
+    base_index_type = manifest.get("base_index_type", manifest["index_type"])
+    if mmap and base_index_type in MAPPABLE_INDEX_TYPES:
+        index = MappedFlatIndex(vectors, manifest.get("metric_type", faiss.METRIC_L2), ids)
+    elif mmap and base_index_type in MAPPABLE_IVF_INDEX_TYPES:
+        index = MappedIVFIndex(faiss.read_index(os.path.join(path, "index.faiss"), faiss.IO_FLAG_MMAP), vectors, ids)
+    else:
+        index = faiss.read_index(os.path.join(path, "index.faiss"))
+    if not (index.ntotal == len(vectors) == manifest["count"]
+            and len(item_names) == len(item_bins) == manifest.get("items", manifest["count"])):
+        raise ValueError(f"Snapshot {version} rows do not line up")
+    return Snapshot(version, manifest, index, vectors, item_names, item_bins, normalized_names)
+
+
+def verify_snapshot(path, manifest):
+    files = manifest["files"]
+    if _bundle_checksum(files) != manifest["checksum"]:
+        raise ValueError(f"Snapshot {path} manifest checksum mismatch")
+    for name, expected in files.items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise ValueError(f"Snapshot {path} is missing {name}")
+        if _sha256(file_path) != expected:
+            raise ValueError(f"Snapshot {path} file {name} is corrupt")
+
+
+def publish_version(version, directory=SNAPSHOT_DIR):
+    """
+    Point CURRENT at an existing version, e.g. to roll back. Every server's
+    SnapshotHolder watcher then swaps to it. Raises FileNotFoundError for a
+    version that is not in `directory`.
+    """
+    if version not in list_versions(directory):
+        raise FileNotFoundError(f"No snapshot {version} in {directory}")
+    _write_current(directory, version)
+    print(f"Published snapshot {version} as CURRENT.")
+    return version
+
+
+def list_versions(directory=SNAPSHOT_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if name.isdigit() and os.path.isdir(os.path.join(directory, name)))
+
+
+def _is_verified(path, manifest):
+    try:
+        with open(os.path.join(path, VERIFIED_STAMP), 'r') as file:
+            return file.read().strip() == manifest["checksum"]
+    except FileNotFoundError:
+        return False
+
+
+def _mark_verified(path, manifest):
+    try:
+        with open(os.path.join(path, VERIFIED_STAMP), 'w') as file:
+            file.write(manifest["checksum"])
+    except OSError:
+        # A read-only bundle is simply verified again by the next process
+        pass
+
+
+def _publish(directory, staging):
+    # Renaming onto an existing version fails, so concurrent writers each get their own
+    while True:
+        versions = list_versions(directory)
+        version = f"{int(versions[-1]) + 1 if versions else 1:06d}"
+        try:
+            os.rename(staging, os.path.join(directory, version))
+            break
+        except OSError:
+            if not os.path.exists(os.path.join(directory, version)):
+                raise
+    _write_current(directory, version)
+    return version
+
+
+def _write_current(directory, version):
+    tmp_path = os.path.join(directory, f"CURRENT.tmp-{os.getpid()}-{threading.get_ident()}")
+    with open(tmp_path, 'w') as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, os.path.join(directory, "CURRENT"))
+
+
+def _prune(directory, keep):
+    current = current_version(directory)
+    for version in list_versions(directory)[:-keep or None]:
+        if version != current:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def _write_vectors(path, vector_chunks, count, dimension):
+    vectors = np.lib.format.open_memmap(path, mode='w+', dtype='float32', shape=(count, dimension))
+    written = 0
+    for chunk in vector_chunks:
+        rows = min(len(chunk), count - written)
+        vectors[written:written + rows] = chunk[:rows]
+        written += rows
+        if written == count:
+            break
+    if written != count:
+        raise ValueError(f"Expected {count} vectors, got {written}")
+    vectors.flush()
+    del vectors
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as file:
+        np.save(file, array)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _bundle_checksum(files):
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
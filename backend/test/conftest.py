@@ -3,10 +3,19 @@ Pytest configuration and shared fixtures for all tests.
 """
 import pytest
 import os
+import sys
 import numpy as np
 from unittest.mock import Mock, MagicMock, patch
 from io import BytesIO
 
+# Keep embedding and image result caches in memory so tests never read or write a cache file
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["IMAGE_CACHE_PATH"] = ""
+# Keep queued R2 uploads in memory, so /upload/ tests leave no rows behind
+os.environ["UPLOAD_QUEUE_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 @pytest.fixture(autouse=True)
 def setup_env_vars(monkeypatch):
@@ -16,6 +25,27 @@ def setup_env_vars(monkeypatch):
     monkeypatch.setenv("R2_SECRET_KEY", "test-r2-secret-key")
 
 
+@pytest.fixture(autouse=True)
+def clear_module_caches():
+    """Start every test with empty embedding and semantic caches."""
+    for module_name in ("langchain_helper", "embeddings"):
+        module = sys.modules.get(module_name)
+        for cache_name in ("embedding_cache", "semantic_cache"):
+            if module is not None and hasattr(module, cache_name):
+                getattr(module, cache_name).clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_vector_store(tmp_path, monkeypatch):
+    """Give every test its own empty vector store instead of the working directory's."""
+    import vector_store
+
+    store = vector_store.VectorStore(str(tmp_path / "vector_store"))
+    monkeypatch.setattr(vector_store, "_store", store)
+    return store
+
+
 @pytest.fixture
 def mock_openai_client():
     """Mock OpenAI client."""
@@ -0,0 +1,224 @@
+"""
+Unit tests for bin_lookup.py.
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_driver(rows, version):
+    """Build a mock driver whose session answers the version and mapping queries."""
+    mock_driver = MagicMock()
+    mock_session = MagicMock()
+    mock_driver.session.return_value.__enter__.return_value = mock_session
+
+    def run(query, **kwargs):
+        result = MagicMock()
+        if "DatasetVersion" in query:
+            result.single.return_value = {"version": version()}
+        else:
+            result.__iter__.return_value = iter(
+                [{"name": name, "bin_type": bin_type} for name, bin_type in rows]
+            )
+        return result
+
+    mock_session.run.side_effect = run
+    return mock_driver, mock_session
+
+
+@pytest.mark.unit
+def test_get_before_load_returns_none():
+    """An unloaded table reports itself as not loaded and answers nothing."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+
+    assert not table.loaded
+    assert table.get("plastic bottle") is None
+    assert len(table) == 0
+
+
+@pytest.mark.unit
+def test_load_builds_compact_table():
+    """Loading reads the mapping once and shares bin strings between items."""
+    from bin_lookup import BinLookupTable
+
+    rows = [("plastic bottle", "blue bin"), ("glass jar", "blue bin"), ("banana peel", "green bin")]
+    driver, _ = make_driver(rows, lambda: 3)
+    table = BinLookupTable(driver)
+
+    table.load()
+
+    assert table.loaded
+    assert table.version == 3
+    assert len(table) == 3
+    assert table.get("plastic bottle") == "blue bin"
+    assert table.get("banana peel") == "green bin"
+    assert table.get("unknown") is None
+    assert table._table.bin_types == ("blue bin", "green bin")
+
+
+@pytest.mark.unit
+def test_refresh_if_stale_only_reloads_on_version_change():
+    """The mapping is only re-read when the dataset version stamp moves."""
+    from bin_lookup import BinLookupTable
+
+    versions = iter([1, 1, 2, 2])
+    rows = [("plastic bottle", "blue bin")]
+    driver, session = make_driver(rows, lambda: next(versions))
+    table = BinLookupTable(driver)
+    table.load()
+
+    assert table.refresh_if_stale() is False
+    assert table.refresh_if_stale() is True
+    assert table.version == 2
+
+
+@pytest.mark.unit
+def test_seeded_table_reloads_until_neo4j_load_succeeds():
+    """A snapshot-seeded table is replaced by the first Neo4j read, even with no version stamp anywhere."""
+    from bin_lookup import BinLookupTable
+
+    driver, session = make_driver([("glass jar", "blue bin")], lambda: None)
+    table = BinLookupTable(driver)
+    table.replace([("stale item", "green bin")])
+
+    assert table.loaded and not table.loaded_from_db
+    assert table.refresh_if_stale() is True
+    assert table.get("glass jar") == "blue bin"
+    assert table.loaded_from_db
+    assert table.refresh_if_stale() is False
+
+
+@pytest.mark.unit
+def test_replace_swaps_table():
+    """replace() installs a new mapping and version."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    table.replace([("cardboard", "blue bin")], version=7)
+
+    assert table.get("cardboard") == "blue bin"
+    assert table.version == 7
+
+
+@pytest.mark.unit
+def test_bump_dataset_version():
+    """bump_dataset_version increments the stamp and returns the new value."""
+    from bin_lookup import bump_dataset_version
+
+    session = MagicMock()
+    session.run.return_value.single.return_value = {"version": 5}
+
+    assert bump_dataset_version(session) == 5
+    assert "DatasetVersion" in session.run.call_args[0][0]
+
+
+@pytest.mark.unit
+def test_background_refresh_survives_errors():
+    """A failing refresh keeps the last good table and the thread stops cleanly."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    table.replace([("cardboard", "blue bin")], version=1)
+
+    with patch.object(table, "refresh_if_stale", side_effect=Exception("neo4j down")) as mock_refresh:
+        table.start_background_refresh(interval=0.01)
+        table._stop.wait(0.05)
+        table.stop_background_refresh()
+
+    assert mock_refresh.called
+    assert table.get("cardboard") == "blue bin"
+    assert table._thread is None
+
+
+@pytest.mark.unit
+def test_match_exact_normalized_and_fuzzy():
+    """match() falls back from exact to normalized to trigram matches."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    table.replace([("plastic bottle", "blue bin"), ("banana peel", "green bin")])
+
+    assert table.match("plastic bottle") == ("blue bin", "plastic bottle", 1.0)
+    assert table.match("Banana peels.") == ("green bin", "banana peel", 1.0)
+
+    bin_type, matched_name, score = table.match("plastik bottle", threshold=0.6)
+    assert bin_type == "blue bin"
+    assert matched_name == "plastic bottle"
+    assert score < 1.0
+
+    assert table.match("plastik bottle", threshold=0.99) is None
+    assert BinLookupTable(MagicMock()).match("plastic bottle") is None
+
+
+@pytest.mark.unit
+def test_add_inserts_into_live_table():
+    """add() makes a single item an exact and normalized hit without reloading."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    table.add("ignored", "blue bin")
+    assert not table.loaded
+
+    table.replace([("plastic bottle", "blue bin")])
+    table.add("coffee pods", "garbage bin")
+
+    assert table.get("coffee pods") == "garbage bin"
+    assert table.match("Coffee pod")[0] == "garbage bin"
+    assert table.bin_types == ("blue bin", "garbage bin")
+
+
+class AsyncRecords:
+    """Async iterable over a list of records, like a neo4j AsyncResult."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def __aiter__(self):
+        self._iter = iter(self.records)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.mark.unit
+async def test_aload_uses_async_driver():
+    """aload() reads the mapping through the async driver."""
+    from unittest.mock import AsyncMock
+    from bin_lookup import BinLookupTable
+
+    version_result = MagicMock()
+    version_result.single = AsyncMock(return_value={"version": 4})
+    mapping_result = AsyncRecords([{"name": "glass jar", "bin_type": "blue bin"}])
+    session = MagicMock()
+    session.run = AsyncMock(side_effect=[version_result, mapping_result])
+    async_driver = MagicMock()
+    async_driver.session.return_value.__aenter__ = AsyncMock(return_value=session)
+    async_driver.session.return_value.__aexit__ = AsyncMock(return_value=None)
+
+    table = BinLookupTable(MagicMock())
+    await table.aload(async_driver)
+
+    assert table.version == 4
+    assert table.get("glass jar") == "blue bin"
+
+
+@pytest.mark.unit
+def test_replace_uses_precomputed_normalized_names():
+    """Test that normalized names stored in a snapshot are used as given."""
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    table.replace([("Glass Jars", "blue bin")], normalized_names=["glass jar"])
+
+    assert table.match("glass jar") == ("blue bin", "glass jar", 1.0)
+    assert table.version is None
@@ -0,0 +1,126 @@
+"""
+Unit tests for db.py.
+"""
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.unit
+def test_driver_config_includes_pool_and_fetch_size():
+    """Test that the pool and fetch size settings are passed to the driver."""
+    import db
+
+    config = db.driver_config()
+
+    assert config["max_connection_pool_size"] == db.NEO4J_MAX_POOL_SIZE
+    assert config["fetch_size"] == db.NEO4J_FETCH_SIZE
+    assert config["auth"] == (db.NEO4J_USER, db.NEO4J_PASSWORD)
+
+
+@pytest.mark.unit
+@patch('db.GraphDatabase.driver')
+def test_get_driver_is_shared(mock_driver_factory, monkeypatch):
+    """Test that every caller gets the same synchronous driver."""
+    import db
+
+    monkeypatch.setattr(db, "_driver", None)
+
+    first = db.get_driver()
+    second = db.get_driver()
+
+    assert first is second
+    mock_driver_factory.assert_called_once()
+    db.close_driver()
+    first.close.assert_called_once()
+    assert db._driver is None
+
+
+@pytest.mark.unit
+@patch('db.AsyncGraphDatabase.driver')
+async def test_async_driver_lifecycle(mock_driver_factory, monkeypatch):
+    """Test opening, sharing and closing the async driver."""
+    import db
+
+    monkeypatch.setattr(db, "_async_driver", None)
+    mock_driver_factory.return_value = MagicMock(close=AsyncMock())
+
+    assert db.get_async_driver() is None
+    driver = await db.open_async_driver()
+    assert await db.open_async_driver() is driver
+    assert db.get_async_driver() is driver
+
+    await db.close_async_driver()
+
+    driver.close.assert_awaited_once()
+    assert db.get_async_driver() is None
+    mock_driver_factory.assert_called_once()
+
+
+@pytest.mark.unit
+def test_ensure_schema_creates_constraints():
+    """Test that the Item.name and Bin.type uniqueness constraints are created idempotently."""
+    from db import ensure_schema
+
+    mock_session = MagicMock()
+
+    ensure_schema(mock_session)
+
+    queries = [call[0][0] for call in mock_session.run.call_args_list]
+    assert any("(i:Item) REQUIRE i.name IS UNIQUE" in query for query in queries)
+    assert any("(b:Bin) REQUIRE b.type IS UNIQUE" in query for query in queries)
+    assert all("IF NOT EXISTS" in query for query in queries)
+
+
+@pytest.mark.unit
+def test_ensure_schema_explains_duplicate_nodes():
+    """Test that a constraint blocked by duplicate nodes fails with the command that fixes it."""
+    from neo4j.exceptions import Neo4jError
+    from db import ensure_schema
+
+    mock_session = MagicMock()
+    mock_session.run.side_effect = Neo4jError.hydrate(
+        code="Neo.ClientError.Schema.ConstraintCreationFailed", message="Both node 1 and node 2 have name 'cup'")
+
+    with pytest.raises(RuntimeError, match="python db.py dedupe"):
+        ensure_schema(mock_session)
+
+    mock_session.run.side_effect = Neo4jError.hydrate(code="Neo.ClientError.Security.Unauthorized", message="no")
+    with pytest.raises(Neo4jError):
+        ensure_schema(mock_session)
+
+
+@pytest.mark.unit
+def test_dedupe_catalog_merges_bins_before_items():
+    """Test that duplicate Bins are merged before duplicate Items, moving their edges to the kept node."""
+    from db import dedupe_catalog
+
+    mock_session = MagicMock()
+    mock_session.run.return_value.single.side_effect = [{"merged": 3}, {"merged": 1}]
+
+    assert dedupe_catalog(mock_session) == (3, 1)
+
+    bins_query, items_query = [call[0][0] for call in mock_session.run.call_args_list]
+    assert "MATCH (b:Bin)" in bins_query and "MERGE (i)-[:SHOULD_GO_IN]->(keep)" in bins_query
+    assert "MATCH (i:Item)" in items_query and "MERGE (keep)-[:SHOULD_GO_IN]->(b)" in items_query
+    assert all("DETACH DELETE duplicate" in query for query in (bins_query, items_query))
+
+
+@pytest.mark.unit
+def test_ensure_schema_dedupes_before_creating_constraints():
+    """Test that loaders can merge duplicate nodes before the constraints are created."""
+    from db import ensure_schema
+
+    mock_session = MagicMock()
+    mock_session.run.return_value.single.return_value = {"merged": 0}
+
+    ensure_schema(mock_session, dedupe=True)
+
+    queries = [call[0][0] for call in mock_session.run.call_args_list]
+    assert "MATCH (b:Bin)" in queries[0]
+    assert "MATCH (i:Item)" in queries[1]
+    assert all("CREATE CONSTRAINT" in query for query in queries[2:])
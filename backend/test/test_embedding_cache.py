@@ -0,0 +1,128 @@
+"""
+Unit tests for embedding_cache.py.
+"""
+import pytest
+from unittest.mock import MagicMock
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODEL = "text-embedding-ada-002"
+
+
+@pytest.mark.unit
+def test_cache_key_normalizes_case_and_whitespace():
+    """Test that keys ignore case and whitespace but not the model."""
+    from embedding_cache import cache_key
+
+    assert cache_key("Plastic  Bottle ", MODEL) == cache_key("plastic bottle", MODEL)
+    assert cache_key("plastic bottle", MODEL) != cache_key("plastic bottle", "other-model")
+    assert cache_key("plastic bottle", MODEL) != cache_key("glass jar", MODEL)
+
+
+@pytest.mark.unit
+def test_get_or_create_memory_tier():
+    """Test that a repeated lookup is served from the LRU without embedding again."""
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache()
+    embed = MagicMock(return_value=[0.5, 0.25])
+
+    first = cache.get_or_create("Plastic Bottle", MODEL, embed)
+    second = cache.get_or_create("plastic bottle", MODEL, embed)
+
+    assert first == second == [0.5, 0.25]
+    embed.assert_called_once_with("plastic bottle")
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hit_rate"] == pytest.approx(0.5)
+
+
+@pytest.mark.unit
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that embeddings persist in SQLite across cache instances."""
+    from embedding_cache import EmbeddingCache
+
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path).put("glass jar", MODEL, [0.1, 0.2, 0.3])
+
+    cache = EmbeddingCache(path)
+    embedding = cache.get("Glass Jar", MODEL)
+
+    assert embedding == pytest.approx([0.1, 0.2, 0.3])
+    assert cache.stats()["disk_hits"] == 1
+    # Promoted into memory on the way out
+    cache.get("glass jar", MODEL)
+    assert cache.stats()["memory_hits"] == 1
+
+
+@pytest.mark.unit
+def test_lru_evicts_oldest():
+    """Test that the memory tier is bounded by capacity."""
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(capacity=2)
+    cache.put("a", MODEL, [1.0])
+    cache.put("b", MODEL, [2.0])
+    cache.get("a", MODEL)
+    cache.put("c", MODEL, [3.0])
+
+    assert cache.get("b", MODEL) is None
+    assert cache.get("a", MODEL) == [1.0]
+    assert cache.stats()["memory_entries"] == 2
+
+
+@pytest.mark.unit
+def test_clear(tmp_path):
+    """Test that clear empties both tiers and resets counters."""
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("a", MODEL, [1.0])
+    cache.get("a", MODEL)
+
+    cache.clear()
+
+    assert cache.stats()["memory_hits"] == 0
+    assert cache.get("a", MODEL) is None
+
+
+@pytest.mark.unit
+async def test_async_lookups_use_sqlite_off_the_event_loop(tmp_path):
+    """Test that disk reads and writes run on a worker thread while memory hits stay inline."""
+    import threading
+    from unittest.mock import patch
+    from embedding_cache import EmbeddingCache
+
+    path = str(tmp_path / "embeddings.sqlite3")
+    assert await EmbeddingCache(path).aput_many(["a", "b"], MODEL, [[1.0], [2.0]]) == [[1.0], [2.0]]
+
+    cache = EmbeddingCache(path)
+    loop_thread = threading.current_thread()
+    disk_threads = []
+    read_disk = cache._read_disk
+
+    def record(*args):
+        disk_threads.append(threading.current_thread())
+        return read_disk(*args)
+
+    with patch.object(cache, "_read_disk", side_effect=record):
+        assert await cache.aget_many(["A", "b", "c"], MODEL) == [[1.0], [2.0], None]
+    assert disk_threads and loop_thread not in disk_threads
+    assert await cache.aget("a", MODEL) == [1.0]
+    assert cache.stats()["disk_hits"] == 2
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.unit
+def test_shared_file_uses_wal(tmp_path):
+    """Test that the cache file is opened in WAL mode so workers can write concurrently."""
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+
+    assert cache._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
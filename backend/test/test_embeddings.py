@@ -2,7 +2,7 @@
 Comprehensive unit tests for embeddings.py to achieve 100% code coverage.
 """
 import pytest
-from unittest.mock import Mock, MagicMock, patch, mock_open, call
+from unittest.mock import MagicMock, patch
 import os
 import sys
 
@@ -69,346 +69,210 @@ def test_generate_embedding_various_items(mock_create):
 
 
 @pytest.mark.unit
-@patch('embeddings.driver')
-def test_store_in_neo4j_success(mock_driver):
-    """Test successful storage in Neo4j."""
-    from embeddings import store_in_neo4j
+@patch('embeddings.openai.embeddings.create')
+def test_generate_embedding_special_characters(mock_create):
+    """Test embedding generation with special characters."""
+    from embeddings import generate_embedding
     
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
+    mock_response = MagicMock()
+    mock_response.data = [MagicMock(embedding=[0.1] * 1536)]
+    mock_create.return_value = mock_response
     
-    embedding = [0.1] * 1536
-    store_in_neo4j("plastic bottle", "recyclable", embedding)
+    special_items = [
+        "plastic bottle (16 oz.)",
+        "item-with-dashes",
+        "item_with_underscores",
+        "café napkin"
+    ]
     
-    # Verify session.run was called
-    mock_session.run.assert_called_once()
+    for item in special_items:
+        embedding = generate_embedding(item)
+        assert len(embedding) == 1536
 
 
-@pytest.mark.unit
-@patch('embeddings.driver')
-def test_store_in_neo4j_query_structure(mock_driver):
-    """Test that correct Cypher query is used in store_in_neo4j."""
-    from embeddings import store_in_neo4j
-    
+
+
+def run_query_in_mock_tx(mock_driver):
+    """Make session.execute_write run its callback against a mock transaction."""
     mock_session = MagicMock()
+    mock_tx = MagicMock()
     mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    embedding = [0.1] * 1536
-    store_in_neo4j("test item", "garbage", embedding)
-    
-    call_args = mock_session.run.call_args
-    query = call_args[0][0]
-    
-    assert "CREATE (i:Item {name: $item_name, embedding: $embedding})" in query
-    assert "CREATE (b:Bin {type: $bin_type})" in query
-    assert "CREATE (i)-[:SHOULD_GO_IN]->(b)" in query
+    mock_session.execute_write.side_effect = lambda work: work(mock_tx)
+    return mock_tx
+
+
+def batch_embedding_response(inputs):
+    """Build a list-input embeddings response whose first value encodes the input position."""
+    data = [MagicMock(index=i, embedding=[float(i)] * 1536) for i in range(len(inputs))]
+    return MagicMock(data=list(reversed(data)))
+
+
+def write_csv(tmp_path, rows):
+    csv_file = tmp_path / "catalog.csv"
+    csv_file.write_text("item_name,bin_type\n" + "".join(f"{name},{bin_type}\n" for name, bin_type in rows))
+    return str(csv_file)
 
 
 @pytest.mark.unit
 @patch('embeddings.driver')
-def test_store_in_neo4j_parameters(mock_driver):
-    """Test that correct parameters are passed to Neo4j."""
+def test_store_in_neo4j_success(mock_driver):
+    """Test successful storage in Neo4j."""
     from embeddings import store_in_neo4j
-    
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
+
+    from vector_store import get_vector_store
+
+    mock_tx = run_query_in_mock_tx(mock_driver)
+
     embedding = [0.5] * 1536
     store_in_neo4j("glass jar", "recyclable", embedding)
-    
-    call_args = mock_session.run.call_args
-    params = call_args[1]
-    
-    assert params['item_name'] == "glass jar"
-    assert params['bin_type'] == "recyclable"
-    assert params['embedding'] == embedding
+
+    mock_tx.run.assert_called_once()
+    assert mock_tx.run.call_args[1]['rows'] == [{"name": "glass jar", "bin_type": "recyclable"}]
+    # The vector goes to the vector store, not onto the node
+    assert "SET i.embedding" not in mock_tx.run.call_args[0][0]
+    assert get_vector_store().get("glass jar").tolist() == embedding
 
 
 @pytest.mark.unit
 @patch('embeddings.driver')
-def test_store_in_neo4j_various_bin_types(mock_driver):
-    """Test storing items with various bin types."""
-    from embeddings import store_in_neo4j
-    
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    bin_types = ["recyclable", "compostable", "garbage", "mixed-paper"]
-    embedding = [0.1] * 1536
-    
-    for bin_type in bin_types:
-        store_in_neo4j(f"item_{bin_type}", bin_type, embedding)
-        
-        call_args = mock_session.run.call_args
-        params = call_args[1]
-        assert params['bin_type'] == bin_type
+def test_store_batch_in_neo4j_merges_in_one_transaction(mock_driver):
+    """Test that a batch is written with one UNWIND MERGE query and never creates duplicate bins."""
+    from embeddings import store_batch_in_neo4j
+    from vector_store import get_vector_store
 
+    mock_tx = run_query_in_mock_tx(mock_driver)
 
-@pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open, read_data='item_name,bin_type\nplastic bottle,recyclable\nbanana peel,compostable\n')
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_success(mock_csv_reader, mock_file, mock_store, mock_generate):
-    """Test processing CSV and storing data."""
-    from embeddings import process_csv_and_store
-    
-    # Mock CSV rows
-    mock_csv_reader.return_value = [
-        {'item_name': 'plastic bottle', 'bin_type': 'recyclable'},
-        {'item_name': 'banana peel', 'bin_type': 'compostable'},
-    ]
-    
-    # Mock embedding generation
-    mock_generate.return_value = [0.1] * 1536
-    
-    process_csv_and_store("test.csv")
-    
-    # Verify embeddings were generated
-    assert mock_generate.call_count == 2
-    
-    # Verify data was stored
-    assert mock_store.call_count == 2
+    store_batch_in_neo4j([("a", "blue bin", [0.1]), ("b", "blue bin", [0.2]), ("c", "green bin", [0.3])])
+
+    assert get_vector_store().names == ["a", "b", "c"]
+    mock_tx.run.assert_called_once()
+    query = mock_tx.run.call_args[0][0]
+    assert "UNWIND $rows AS row" in query
+    assert "MERGE (i:Item {name: row.name})" in query
+    assert "MERGE (b:Bin {type: row.bin_type})" in query
+    assert "CREATE" not in query
+    assert len(mock_tx.run.call_args[1]['rows']) == 3
 
 
 @pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_correct_calls(mock_csv_reader, mock_file, mock_store, mock_generate):
-    """Test that process_csv_and_store makes correct function calls."""
-    from embeddings import process_csv_and_store
-    
-    mock_csv_reader.return_value = [
-        {'item_name': 'glass jar', 'bin_type': 'recyclable'},
-    ]
-    
-    embedding = [0.2] * 1536
-    mock_generate.return_value = embedding
-    
-    process_csv_and_store("test.csv")
-    
-    mock_generate.assert_called_once_with('glass jar')
-    mock_store.assert_called_once_with('glass jar', 'recyclable', embedding)
+@patch('embeddings.bump_dataset_version')
+@patch('embeddings.driver')
+def test_delete_items(mock_driver, mock_bump):
+    """Test that deleted items leave Neo4j and the vector store, and the deletion reaches the change feed."""
+    from embeddings import delete_items, DELETE_ITEMS_QUERY
+    from vector_store import get_vector_store
 
+    store = get_vector_store()
+    store.put_many(["a", "b"], [[0.1], [0.2]])
+    mock_tx = run_query_in_mock_tx(mock_driver)
 
-@pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_handles_empty_csv(mock_csv_reader, mock_file, mock_store, mock_generate):
-    """Test processing empty CSV file."""
-    from embeddings import process_csv_and_store
-    
-    mock_csv_reader.return_value = []
-    
-    process_csv_and_store("empty.csv")
-    
-    # No embeddings should be generated or stored
-    mock_generate.assert_not_called()
-    mock_store.assert_not_called()
+    assert delete_items(["b"]) == [1]
+
+    mock_tx.run.assert_called_once_with(DELETE_ITEMS_QUERY, names=["b"])
+    mock_bump.assert_called_once()
+    assert store.ids_for(["a", "b"]) == [0, None]
+    assert store.changes_since(1) == [(2, "delete", [1])]
 
 
 @pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_multiple_items(mock_csv_reader, mock_file, mock_store, mock_generate):
-    """Test processing CSV with multiple items."""
-    from embeddings import process_csv_and_store
-    
-    test_data = [
-        {'item_name': 'plastic bottle', 'bin_type': 'recyclable'},
-        {'item_name': 'banana peel', 'bin_type': 'compostable'},
-        {'item_name': 'styrofoam', 'bin_type': 'garbage'},
-        {'item_name': 'newspaper', 'bin_type': 'mixed-paper'},
-    ]
-    mock_csv_reader.return_value = test_data
-    mock_generate.return_value = [0.1] * 1536
-    
-    process_csv_and_store("multi.csv")
-    
-    assert mock_generate.call_count == 4
-    assert mock_store.call_count == 4
+def test_read_catalog_dedupes_normalized_names(tmp_path):
+    """Test that rows are read lazily and duplicate normalized names are skipped."""
+    from embeddings import read_catalog
 
+    csv_file = write_csv(tmp_path, [
+        ("Glass Jar", "blue bin"),
+        ("glass jars", "blue bin"),
+        ("banana peel", "green bin"),
+        ("", "garbage bin"),
+    ])
 
-@pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-@patch('builtins.print')
-def test_process_csv_and_store_prints_success(mock_print, mock_csv_reader, mock_file, 
-                                              mock_store, mock_generate):
-    """Test that success messages are printed."""
-    from embeddings import process_csv_and_store
-    
-    mock_csv_reader.return_value = [
-        {'item_name': 'test item', 'bin_type': 'recyclable'},
-    ]
-    mock_generate.return_value = [0.1] * 1536
-    
-    process_csv_and_store("test.csv")
-    
-    # Check that success message was printed
-    print_calls = [str(call) for call in mock_print.call_args_list]
-    assert any("Stored item 'test item'" in str(call) for call in print_calls)
+    rows = read_catalog(csv_file)
+
+    assert next(rows) == ("Glass Jar", "blue bin")
+    assert list(rows) == [("banana peel", "green bin")]
 
 
 @pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-@patch('builtins.print')
-def test_process_csv_and_store_handles_none_embedding(mock_print, mock_csv_reader, 
-                                                       mock_file, mock_store, mock_generate):
-    """Test handling when embedding generation returns None."""
+@patch('embeddings.ensure_schema')
+@patch('embeddings.bump_dataset_version')
+@patch('embeddings.store_batch_in_neo4j')
+@patch('embeddings.openai.embeddings.create')
+def test_process_csv_and_store_batches_calls(mock_create, mock_store, mock_bump, mock_schema, tmp_path):
+    """Test that each chunk uses one embeddings call and one write, in CSV order."""
     from embeddings import process_csv_and_store
-    
-    mock_csv_reader.return_value = [
-        {'item_name': 'failed item', 'bin_type': 'recyclable'},
+
+    mock_create.side_effect = lambda input, model: batch_embedding_response(input)
+    csv_file = write_csv(tmp_path, [(f"item{i}", "blue bin") for i in range(5)])
+
+    stored = process_csv_and_store(csv_file, chunk_size=2, concurrency=2,
+                                   checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert stored == 5
+    assert mock_create.call_count == 3
+    assert [call[1]['input'] for call in mock_create.call_args_list] == [
+        ["item0", "item1"], ["item2", "item3"], ["item4"]
     ]
-    mock_generate.return_value = None
-    
-    process_csv_and_store("test.csv")
-    
-    # store_in_neo4j should not be called
-    mock_store.assert_not_called()
-    
-    # Error message should be printed
-    print_calls = [str(call) for call in mock_print.call_args_list]
-    assert any("Failed to generate embedding" in str(call) for call in print_calls)
+    written = [row for call in mock_store.call_args_list for row in call[0][0]]
+    assert [name for name, _, _ in written] == [f"item{i}" for i in range(5)]
+    assert written[1][2][0] == 1.0
+    mock_bump.assert_called_once()
+    assert mock_schema.call_args[1] == {"dedupe": True}
+    assert not os.path.exists(tmp_path / "checkpoint.json")
 
 
 @pytest.mark.unit
+@patch('embeddings.ensure_schema', MagicMock())
+@patch('embeddings.bump_dataset_version')
+@patch('embeddings.store_batch_in_neo4j')
 @patch('embeddings.openai.embeddings.create')
-def test_generate_embedding_special_characters(mock_create):
-    """Test embedding generation with special characters."""
-    from embeddings import generate_embedding
-    
-    mock_response = MagicMock()
-    mock_response.data = [MagicMock(embedding=[0.1] * 1536)]
-    mock_create.return_value = mock_response
-    
-    special_items = [
-        "plastic bottle (16 oz.)",
-        "item-with-dashes",
-        "item_with_underscores",
-        "café napkin"
-    ]
-    
-    for item in special_items:
-        embedding = generate_embedding(item)
-        assert len(embedding) == 1536
+def test_process_csv_and_store_resumes_from_checkpoint(mock_create, mock_store, mock_bump, tmp_path):
+    """Test that a failed run resumes after the last stored chunk."""
+    from embeddings import process_csv_and_store, embedding_cache
 
+    csv_file = write_csv(tmp_path, [(f"item{i}", "blue bin") for i in range(4)])
+    checkpoint_path = str(tmp_path / "checkpoint.json")
 
-@pytest.mark.unit
-@patch('embeddings.driver')
-def test_store_in_neo4j_special_characters(mock_driver):
-    """Test storing items with special characters."""
-    from embeddings import store_in_neo4j
-    
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    embedding = [0.1] * 1536
-    special_name = "plastic bottle (16 oz.)"
-    
-    store_in_neo4j(special_name, "recyclable", embedding)
-    
-    call_args = mock_session.run.call_args
-    params = call_args[1]
-    assert params['item_name'] == special_name
+    mock_create.side_effect = [batch_embedding_response(["item0", "item1"]), Exception("rate limited")]
+    with pytest.raises(Exception, match="rate limited"):
+        process_csv_and_store(csv_file, chunk_size=2, concurrency=1, checkpoint_path=checkpoint_path)
+    assert mock_store.call_count == 1
+    mock_bump.assert_not_called()
 
+    embedding_cache.clear()
+    mock_create.side_effect = lambda input, model: batch_embedding_response(input)
+    stored = process_csv_and_store(csv_file, chunk_size=2, concurrency=1, checkpoint_path=checkpoint_path)
 
-@pytest.mark.unit
-def test_module_imports():
-    """Test that embeddings module can be imported successfully."""
-    import embeddings
-    
-    # Check that all required functions are available
-    assert hasattr(embeddings, 'generate_embedding')
-    assert hasattr(embeddings, 'store_in_neo4j')
-    assert hasattr(embeddings, 'process_csv_and_store')
+    assert stored == 2
+    assert mock_create.call_args[1]['input'] == ["item2", "item3"]
+    mock_bump.assert_called_once()
 
 
 @pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_preserves_order(mock_csv_reader, mock_file, 
-                                               mock_store, mock_generate):
-    """Test that CSV rows are processed in order."""
-    from embeddings import process_csv_and_store
-    
-    test_data = [
-        {'item_name': 'item1', 'bin_type': 'bin1'},
-        {'item_name': 'item2', 'bin_type': 'bin2'},
-        {'item_name': 'item3', 'bin_type': 'bin3'},
-    ]
-    mock_csv_reader.return_value = test_data
-    mock_generate.return_value = [0.1] * 1536
-    
-    process_csv_and_store("test.csv")
-    
-    # Verify calls were made in order
-    generate_calls = mock_generate.call_args_list
-    assert generate_calls[0][0][0] == 'item1'
-    assert generate_calls[1][0][0] == 'item2'
-    assert generate_calls[2][0][0] == 'item3'
+@patch('embeddings.ensure_schema', MagicMock())
+@patch('embeddings.bump_dataset_version')
+@patch('embeddings.store_batch_in_neo4j')
+@patch('embeddings.openai.embeddings.create')
+def test_process_csv_and_store_skips_cached_embeddings(mock_create, mock_store, mock_bump, tmp_path):
+    """Test that items already in the embedding cache are not re-embedded."""
+    from embeddings import process_csv_and_store, embedding_cache, EMBEDDING_MODEL
 
+    embedding_cache.put("item0", EMBEDDING_MODEL, [9.0] * 1536)
+    mock_create.side_effect = lambda input, model: batch_embedding_response(input)
+    csv_file = write_csv(tmp_path, [("item0", "blue bin"), ("item1", "green bin")])
 
-@pytest.mark.unit
-@patch('embeddings.driver')
-def test_store_in_neo4j_embedding_format(mock_driver):
-    """Test that embedding is stored in correct format."""
-    from embeddings import store_in_neo4j
-    
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    embedding = list(range(1536))  # Use distinct values
-    store_in_neo4j("test", "recyclable", embedding)
-    
-    call_args = mock_session.run.call_args
-    params = call_args[1]
-    stored_embedding = params['embedding']
-    
-    # Verify embedding is stored as is
-    assert stored_embedding == embedding
-    assert len(stored_embedding) == 1536
+    process_csv_and_store(csv_file, chunk_size=10, checkpoint_path=None)
+
+    mock_create.assert_called_once()
+    assert mock_create.call_args[1]['input'] == ["item1"]
+    written = mock_store.call_args[0][0]
+    assert written[0][2][0] == 9.0
 
 
 @pytest.mark.unit
-@patch('embeddings.generate_embedding')
-@patch('embeddings.store_in_neo4j')
-@patch('builtins.open', new_callable=mock_open)
-@patch('embeddings.csv.DictReader')
-def test_process_csv_and_store_handles_mixed_success(mock_csv_reader, mock_file,
-                                                     mock_store, mock_generate):
-    """Test processing CSV where some embeddings succeed and some fail."""
-    from embeddings import process_csv_and_store
-    
-    mock_csv_reader.return_value = [
-        {'item_name': 'success1', 'bin_type': 'recyclable'},
-        {'item_name': 'fail1', 'bin_type': 'garbage'},
-        {'item_name': 'success2', 'bin_type': 'compostable'},
-    ]
-    
-    # First and third calls succeed, second fails
-    mock_generate.side_effect = [[0.1] * 1536, None, [0.2] * 1536]
-    
-    process_csv_and_store("test.csv")
-    
-    # Only successful embeddings should be stored
-    assert mock_store.call_count == 2
-    
-    # Verify correct items were stored
-    store_calls = mock_store.call_args_list
-    assert store_calls[0][0][0] == 'success1'
-    assert store_calls[1][0][0] == 'success2'
+def test_module_imports():
+    """Test that embeddings module can be imported without running an ingest."""
+    import embeddings
+
+    assert hasattr(embeddings, 'generate_embedding')
+    assert hasattr(embeddings, 'store_in_neo4j')
+    assert hasattr(embeddings, 'process_csv_and_store')
@@ -11,24 +11,31 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+def mock_paged_export(mock_driver, item_names, embeddings):
+    """Serve the count and keyset-paged export queries from in-memory rows."""
+    mock_session = MagicMock()
+    mock_driver.session.return_value.__enter__.return_value = mock_session
+    rows = sorted(zip(item_names, [list(e) for e in embeddings]))
+
+    def run(query, **params):
+        if "count(i)" in query:
+            result = MagicMock()
+            result.single.return_value = {'total': len(rows)}
+            return result
+        page = [row for row in rows if row[0] > params['after']][:params['limit']]
+        return [{'name': name, 'embedding': embedding} for name, embedding in page]
+
+    mock_session.run.side_effect = run
+    return mock_session
+
+
 @pytest.mark.unit
 @patch('faiss_helper.driver')
 def test_get_all_embeddings(mock_driver, sample_embeddings, sample_item_names):
     """Test getting all embeddings from Neo4j."""
     from faiss_helper import get_all_embeddings
     
-    # Mock Neo4j session and results
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    # Create mock records
-    mock_records = []
-    for name, embedding in zip(sample_item_names[:3], sample_embeddings[:3]):
-        mock_record = MagicMock()
-        mock_record.__getitem__ = lambda self, key, n=name, e=embedding.tolist(): n if key == 'name' else e
-        mock_records.append(mock_record)
-    
-    mock_session.run.return_value = mock_records
+    mock_paged_export(mock_driver, sample_item_names[:3], sample_embeddings[:3])
     
     item_names, embeddings = get_all_embeddings()
     
@@ -89,51 +96,53 @@ def test_load_faiss_index_file_exists(mock_exists, mock_read_index, mock_np_save
 
 
 @pytest.mark.unit
+@patch('faiss_helper.get_item_bins')
 @patch('faiss_helper.save_faiss_index')
-@patch('faiss_helper.build_faiss_index')
-@patch('faiss_helper.get_all_embeddings')
+@patch('faiss_helper.rebuild_faiss_index')
 @patch('faiss_helper.np.save')
 @patch('faiss_helper.os.path.exists')
-def test_load_faiss_index_file_not_exists(mock_exists, mock_np_save, mock_get_embeddings, 
-                                          mock_build_index, mock_save_index,
-                                          sample_embeddings, sample_item_names, mock_faiss_index):
+def test_load_faiss_index_file_not_exists(mock_exists, mock_np_save, mock_build_index,
+                                          mock_save_index, mock_get_bins,
+                                          sample_item_names, mock_faiss_index):
     """Test loading FAISS index when file doesn't exist - builds new index."""
     from faiss_helper import load_faiss_index
     
     mock_exists.return_value = False
-    mock_get_embeddings.return_value = (sample_item_names[:5], sample_embeddings[:5])
-    mock_build_index.return_value = mock_faiss_index
+    mock_build_index.return_value = (mock_faiss_index, sample_item_names[:5])
     
     index = load_faiss_index('nonexistent.index')
     
     assert index == mock_faiss_index
-    mock_get_embeddings.assert_called_once()
     mock_build_index.assert_called_once()
     mock_save_index.assert_called_once_with(mock_faiss_index, 'nonexistent.index')
-    mock_np_save.assert_called_once()
+    # Item names and their bin labels are saved side by side
+    assert mock_np_save.call_count == 2
+    mock_get_bins.assert_called_once_with(sample_item_names[:5])
 
 
 @pytest.mark.unit
-@patch('faiss_helper.save_faiss_index')
-@patch('faiss_helper.build_faiss_index')
-@patch('faiss_helper.get_all_embeddings')
-@patch('faiss_helper.np.save')
-def test_update_faiss_index(mock_np_save, mock_get_embeddings, mock_build_index, 
-                           mock_save_index, sample_embeddings, sample_item_names, mock_faiss_index):
-    """Test updating FAISS index."""
+@patch('faiss_helper.fetch_dataset_version', return_value=7)
+@patch('faiss_helper.get_item_bins')
+def test_update_faiss_index(mock_get_bins, mock_fetch_version, isolated_vector_store, tmp_path,
+                            sample_embeddings, sample_item_names):
+    """Test that updating the index publishes a snapshot built from the vector store."""
     from faiss_helper import update_faiss_index
+    from snapshot import load_snapshot
     
-    mock_get_embeddings.return_value = (sample_item_names, sample_embeddings)
-    mock_build_index.return_value = mock_faiss_index
+    isolated_vector_store.put_many(sample_item_names, sample_embeddings)
+    mock_get_bins.return_value = ["blue bin"] * len(sample_item_names)
     
-    index, item_names = update_faiss_index()
+    index, item_names = update_faiss_index(directory=str(tmp_path / "snapshots"))
     
-    assert index == mock_faiss_index
+    assert index.ntotal == len(sample_item_names)
     assert item_names == sample_item_names
-    mock_get_embeddings.assert_called_once()
-    mock_build_index.assert_called_once()
-    mock_save_index.assert_called_once()
-    mock_np_save.assert_called_once()
+    mock_get_bins.assert_called_once_with(sample_item_names)
+    snapshot = load_snapshot(str(tmp_path / "snapshots"))
+    assert snapshot.item_names == sample_item_names
+    assert snapshot.item_bins == ["blue bin"] * len(sample_item_names)
+    assert snapshot.manifest["dataset_version"] == 7
+    assert snapshot.manifest["embedding_model"] == "text-embedding-ada-002"
+    np.testing.assert_array_equal(snapshot.vectors, sample_embeddings)
 
 
 @pytest.mark.unit
@@ -192,9 +201,7 @@ def test_get_all_embeddings_empty_result(mock_driver):
     """Test get_all_embeddings with no data."""
     from faiss_helper import get_all_embeddings
     
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    mock_session.run.return_value = []
+    mock_paged_export(mock_driver, [], [])
     
     item_names, embeddings = get_all_embeddings()
     
@@ -230,12 +237,10 @@ def test_build_faiss_index_large_dataset():
 @pytest.mark.unit
 @patch('faiss_helper.driver')
 def test_get_all_embeddings_query_format(mock_driver):
-    """Test that get_all_embeddings uses correct Cypher query."""
+    """Test that get_all_embeddings pages through items by name."""
     from faiss_helper import get_all_embeddings
     
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    mock_session.run.return_value = []
+    mock_session = mock_paged_export(mock_driver, [], [])
     
     get_all_embeddings()
     
@@ -245,6 +250,8 @@ def test_get_all_embeddings_query_format(mock_driver):
     assert "MATCH (i:Item)" in query
     assert "i.name" in query
     assert "i.embedding" in query
+    assert "ORDER BY i.name" in query
+    assert "LIMIT $limit" in query
 
 
 @pytest.mark.unit
@@ -269,43 +276,62 @@ def test_search_similar_items_returns_correct_items(sample_item_names):
 
 
 @pytest.mark.unit
-@patch('faiss_helper.np.save')
-@patch('faiss_helper.save_faiss_index')
-@patch('faiss_helper.build_faiss_index')
-@patch('faiss_helper.get_all_embeddings')
-def test_update_faiss_index_saves_item_names(mock_get_embeddings, mock_build_index,
-                                             mock_save_index, mock_np_save,
-                                             sample_embeddings, sample_item_names, mock_faiss_index):
-    """Test that update_faiss_index saves item names."""
+@patch('faiss_helper.fetch_dataset_version', return_value=None)
+@patch('faiss_helper.get_item_bins')
+@patch('faiss_helper.driver')
+def test_update_faiss_index_without_vector_store(mock_driver, mock_get_bins, mock_fetch_version,
+                                                 tmp_path, sample_embeddings, sample_item_names):
+    """Test that a catalog not yet migrated is exported from Neo4j into the snapshot."""
     from faiss_helper import update_faiss_index
+    from snapshot import load_snapshot
+    
+    mock_paged_export(mock_driver, sample_item_names, sample_embeddings)
+    mock_get_bins.side_effect = lambda names: [f"bin for {name}" for name in names]
     
-    mock_get_embeddings.return_value = (sample_item_names, sample_embeddings)
-    mock_build_index.return_value = mock_faiss_index
+    update_faiss_index(directory=str(tmp_path))
     
-    update_faiss_index()
+    snapshot = load_snapshot(str(tmp_path))
+    assert snapshot.item_names == sorted(sample_item_names)
+    assert snapshot.item_bins == [f"bin for {name}" for name in sorted(sample_item_names)]
+    position = list(snapshot.item_names).index('glass jar')
+    np.testing.assert_array_equal(snapshot.vectors[position], sample_embeddings[1])
+
+
+@pytest.mark.unit
+def test_load_index_snapshot_falls_back_to_legacy_files(tmp_path, monkeypatch):
+    """Test that without a snapshot the legacy index, names and bins files are used."""
+    import faiss
+    from faiss_helper import load_index_snapshot
+    
+    vectors = np.random.rand(3, 8).astype('float32')
+    index = faiss.IndexFlatL2(8)
+    index.add(vectors)
+    faiss.write_index(index, str(tmp_path / 'faiss.index'))
+    np.save(tmp_path / 'item_names.npy', np.array(['a', 'b', 'c']))
+    monkeypatch.chdir(tmp_path)
     
-    # Verify item names are saved
-    mock_np_save.assert_called_once()
-    call_args = mock_np_save.call_args
-    assert call_args[0][0] == 'item_names.npy'
-    np.testing.assert_array_equal(call_args[0][1], np.array(sample_item_names))
+    snapshot = load_index_snapshot(str(tmp_path / 'snapshots'))
+    
+    assert snapshot.version is None
+    assert snapshot.index.ntotal == 3
+    assert snapshot.item_names == ['a', 'b', 'c']
+    assert snapshot.item_bins is None
 
 
 @pytest.mark.unit
+@patch('faiss_helper.get_item_bins')
 @patch('faiss_helper.np.save')
 @patch('faiss_helper.save_faiss_index')
-@patch('faiss_helper.build_faiss_index')
-@patch('faiss_helper.get_all_embeddings')
+@patch('faiss_helper.rebuild_faiss_index')
 @patch('faiss_helper.os.path.exists')
-def test_load_faiss_index_default_path(mock_exists, mock_get_embeddings, mock_build_index,
-                                       mock_save_index, mock_np_save,
-                                       sample_embeddings, sample_item_names, mock_faiss_index):
+def test_load_faiss_index_default_path(mock_exists, mock_build_index, mock_save_index,
+                                       mock_np_save, mock_get_bins,
+                                       sample_item_names, mock_faiss_index):
     """Test load_faiss_index with default file path."""
     from faiss_helper import load_faiss_index
     
     mock_exists.return_value = False
-    mock_get_embeddings.return_value = (sample_item_names, sample_embeddings)
-    mock_build_index.return_value = mock_faiss_index
+    mock_build_index.return_value = (mock_faiss_index, sample_item_names)
     
     index = load_faiss_index()
     
@@ -339,15 +365,286 @@ def test_get_all_embeddings_converts_to_numpy(mock_driver):
     """Test that get_all_embeddings converts embeddings to numpy array."""
     from faiss_helper import get_all_embeddings
     
-    mock_session = MagicMock()
-    mock_driver.session.return_value.__enter__.return_value = mock_session
-    
-    # Create mock records with list embeddings
-    mock_record = MagicMock()
-    mock_record.__getitem__ = lambda self, key: 'item1' if key == 'name' else [0.1] * 1536
-    mock_session.run.return_value = [mock_record]
+    mock_paged_export(mock_driver, ['item1'], [[0.1] * 1536])
     
     item_names, embeddings = get_all_embeddings()
     
     assert isinstance(embeddings, np.ndarray)
     assert embeddings.dtype == np.float32
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_get_item_bins_single_query(mock_driver):
+    """Test that bins for all items are fetched in one UNWIND query."""
+    from faiss_helper import get_item_bins
+
+    mock_session = MagicMock()
+    mock_driver.session.return_value.__enter__.return_value = mock_session
+    mock_session.run.return_value = [
+        {'name': 'glass jar', 'bin_type': 'blue bin'},
+        {'name': 'plastic bottle', 'bin_type': None},
+    ]
+
+    bins = get_item_bins(['plastic bottle', 'glass jar'])
+
+    assert bins == ['None', 'blue bin']
+    mock_session.run.assert_called_once()
+    assert "UNWIND $names" in mock_session.run.call_args[0][0]
+
+
+@pytest.mark.unit
+def test_load_item_bins(tmp_path):
+    """Test loading the bin label array, and its absence."""
+    from faiss_helper import load_item_bins
+
+    path = tmp_path / 'item_bins.npy'
+    assert load_item_bins(str(path)) is None
+
+    np.save(path, np.array(['blue bin', 'green bin']))
+    assert load_item_bins(str(path)) == ['blue bin', 'green bin']
+
+
+@pytest.mark.unit
+def test_search_similar_items_scored(mock_faiss_index, sample_item_names):
+    """Test that neighbours come back with their bin labels and distances."""
+    from faiss_helper import search_similar_items_scored
+
+    item_bins = [f"bin {i}" for i in range(len(sample_item_names))]
+
+    results = search_similar_items_scored([0.1] * 1536, mock_faiss_index, sample_item_names,
+                                          item_bins, top_k=5)
+
+    expected_distances = [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert [(name, bin_type) for name, bin_type, _ in results] == \
+        [(sample_item_names[i], f"bin {i}") for i in range(5)]
+    assert [distance for _, _, distance in results] == pytest.approx(expected_distances)
+    assert all(isinstance(distance, float) for _, _, distance in results)
+
+
+@pytest.mark.unit
+def test_search_similar_items_scored_without_labels(sample_item_names):
+    """Test that bins are None without a label array and padding ids are skipped."""
+    from faiss_helper import search_similar_items_scored
+
+    mock_index = MagicMock()
+    mock_index.search.return_value = (np.array([[0.1, 0.2, 3.4e38]]), np.array([[0, 1, -1]]))
+
+    results = search_similar_items_scored([0.1] * 1536, mock_index, sample_item_names, None, top_k=3)
+
+    assert results == [(sample_item_names[0], None, pytest.approx(0.1)),
+                       (sample_item_names[1], None, pytest.approx(0.2))]
+
+
+@pytest.mark.unit
+def test_search_similar_items_scored_batch(sample_embeddings, sample_item_names):
+    """Test that several queries are answered by a single index.search call."""
+    from faiss_helper import build_faiss_index, search_similar_items_scored_batch
+
+    index = MagicMock(wraps=build_faiss_index(sample_embeddings))
+    item_bins = [f"bin {i}" for i in range(len(sample_item_names))]
+
+    results = search_similar_items_scored_batch(sample_embeddings[:3], index, sample_item_names,
+                                                item_bins, top_k=2)
+
+    index.search.assert_called_once()
+    assert len(results) == 3
+    for i, similar_items in enumerate(results):
+        name, bin_type, distance = similar_items[0]
+        assert name == sample_item_names[i]
+        assert bin_type == f"bin {i}"
+        assert distance == pytest.approx(0.0, abs=1e-4)
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_get_all_embeddings_pages_in_order(mock_driver, sample_embeddings, sample_item_names):
+    """Test that every page lands in the preallocated buffer aligned with its name."""
+    from faiss_helper import get_all_embeddings
+
+    mock_session = mock_paged_export(mock_driver, sample_item_names, sample_embeddings)
+
+    item_names, embeddings = get_all_embeddings(page_size=3)
+
+    # One count query plus four pages of at most three items
+    assert mock_session.run.call_count == 5
+    assert item_names == sorted(sample_item_names)
+    expected = dict(zip(sample_item_names, sample_embeddings))
+    for name, embedding in zip(item_names, embeddings):
+        np.testing.assert_array_equal(embedding, expected[name])
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_build_faiss_index_from_neo4j_adds_each_page(mock_driver, sample_embeddings, sample_item_names):
+    """Test that the index is built incrementally without keeping a second copy of the vectors."""
+    from faiss_helper import build_faiss_index_from_neo4j, export_embeddings
+
+    mock_paged_export(mock_driver, sample_item_names, sample_embeddings)
+
+    with patch('faiss_helper.export_embeddings', wraps=export_embeddings) as mock_export:
+        index, item_names = build_faiss_index_from_neo4j(page_size=4)
+
+    assert index.ntotal == len(sample_item_names)
+    assert mock_export.call_args[1]['keep_vectors'] is False
+    position = item_names.index('glass jar')
+    distances, indices = index.search(sample_embeddings[1:2], 1)
+    assert indices[0][0] == position
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_build_faiss_index_from_neo4j_honours_index_type_and_metric(mock_driver, sample_embeddings,
+                                                                    sample_item_names):
+    """Test that the Neo4j export builds the configured index type and metric, training it when needed."""
+    import faiss
+    from faiss_helper import build_faiss_index_from_neo4j
+    from index_factory import base_index
+
+    mock_paged_export(mock_driver, sample_item_names, sample_embeddings)
+
+    flat, item_names = build_faiss_index_from_neo4j(page_size=4, index_type="Flat", metric="ip")
+    ivf, _ = build_faiss_index_from_neo4j(page_size=4, index_type="IVF1,Flat")
+
+    assert flat.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert isinstance(base_index(ivf), faiss.IndexIVFFlat)
+    assert ivf.is_trained and ivf.ntotal == len(sample_item_names)
+    position = item_names.index('glass jar')
+    assert ivf.search(sample_embeddings[1:2], 1)[1][0][0] == position
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_build_faiss_index_from_store_skips_neo4j(mock_driver, isolated_vector_store,
+                                                  sample_embeddings, sample_item_names):
+    """Test that a populated vector store rebuilds the index without touching Neo4j."""
+    from faiss_helper import get_all_embeddings, rebuild_faiss_index
+
+    isolated_vector_store.shard_size = 4
+    isolated_vector_store.put_many(sample_item_names, sample_embeddings)
+
+    index, item_names = rebuild_faiss_index()
+    names, vectors = get_all_embeddings()
+
+    mock_driver.session.assert_not_called()
+    assert item_names == names == sample_item_names
+    assert index.ntotal == len(sample_item_names)
+    np.testing.assert_array_equal(vectors, sample_embeddings)
+    distances, indices = index.search(sample_embeddings[7:8], 1)
+    assert indices[0][0] == 7
+
+
+@pytest.mark.unit
+@patch('faiss_helper.driver')
+def test_migrate_embeddings_to_store(mock_driver, isolated_vector_store,
+                                     sample_embeddings, sample_item_names):
+    """Test that node embeddings are copied into the store and then removed from the graph."""
+    from faiss_helper import migrate_embeddings_to_store, REMOVE_EMBEDDINGS_QUERY
+
+    mock_session = mock_paged_export(mock_driver, sample_item_names, sample_embeddings)
+    export_run = mock_session.run.side_effect
+    removed = iter([len(sample_item_names), 0])
+
+    def run(query, **params):
+        if query == REMOVE_EMBEDDINGS_QUERY:
+            result = MagicMock()
+            result.single.return_value = {'removed': next(removed)}
+            return result
+        return export_run(query, **params)
+
+    mock_session.run.side_effect = run
+
+    moved = migrate_embeddings_to_store(page_size=4)
+
+    assert moved == len(sample_item_names)
+    assert sorted(isolated_vector_store.names) == sorted(sample_item_names)
+    np.testing.assert_array_equal(isolated_vector_store.get('glass jar'), sample_embeddings[1])
+
+
+@pytest.mark.unit
+def test_inner_product_distances_are_reported_as_squared_l2(sample_embeddings, sample_item_names):
+    """Test that an inner-product index returns the same neighbours and distances as L2."""
+    from faiss_helper import add_to_index, build_faiss_index, search_similar_items_scored
+
+    vectors = sample_embeddings / np.linalg.norm(sample_embeddings, axis=1, keepdims=True)
+    l2_index = build_faiss_index(vectors, "Flat", "l2")
+    ip_index = build_faiss_index(vectors, "Flat", "ip")
+    query = vectors[3] * 5
+
+    l2_results = search_similar_items_scored(query / 5, l2_index, sample_item_names, None, top_k=3)
+    ip_results = search_similar_items_scored(query, ip_index, sample_item_names, None, top_k=3)
+
+    assert [name for name, _, _ in ip_results] == [name for name, _, _ in l2_results]
+    np.testing.assert_allclose([d for _, _, d in ip_results], [d for _, _, d in l2_results], atol=1e-4)
+
+    add_to_index(ip_index, query)
+    assert ip_index.search(vectors[3:4], 2)[0][0][1] == pytest.approx(1.0, abs=1e-4)
+
+
+@pytest.mark.unit
+@patch('faiss_helper.fetch_dataset_version', return_value=None)
+@patch('faiss_helper.get_item_bins')
+def test_apply_index_changes_updates_in_place(mock_get_bins, mock_fetch_version, isolated_vector_store,
+                                              tmp_path, sample_embeddings, sample_item_names):
+    """Test that added, updated and deleted items reach the snapshot without a rebuild."""
+    from faiss_helper import apply_index_changes, search_similar_items_scored, update_faiss_index
+    from snapshot import load_snapshot
+
+    directory = str(tmp_path / "snapshots")
+    mock_get_bins.side_effect = lambda names: [f"bin for {name}" for name in names]
+    isolated_vector_store.put_many(sample_item_names, sample_embeddings)
+    update_faiss_index(directory)
+    assert apply_index_changes(directory) is None
+
+    new_vector, moved_vector = np.random.rand(2, sample_embeddings.shape[1]).astype('float32')
+    isolated_vector_store.put_many(["new item", sample_item_names[2]], [new_vector, moved_vector])
+    isolated_vector_store.delete([sample_item_names[5]])
+    mock_get_bins.reset_mock()
+
+    with patch('faiss_helper.update_faiss_index') as mock_rebuild:
+        version = apply_index_changes(directory)
+    mock_rebuild.assert_not_called()
+    mock_get_bins.assert_called_once_with([sample_item_names[2], "new item"])
+
+    snapshot = load_snapshot(directory)
+    assert snapshot.version == version
+    assert snapshot.index.ntotal == len(sample_item_names)
+    assert snapshot.item_names[10] == "new item"
+    assert snapshot.item_bins[5] == "None"
+    assert snapshot.manifest["changed_since_build"] == 3
+
+    def nearest(vector):
+        return search_similar_items_scored(vector, snapshot.index, snapshot.item_names, snapshot.item_bins, 1)[0]
+
+    assert nearest(new_vector)[:2] == ("new item", "bin for new item")
+    assert nearest(moved_vector)[0] == sample_item_names[2]
+    assert nearest(sample_embeddings[5])[0] != sample_item_names[5]
+    assert apply_index_changes(directory) is None
+
+
+@pytest.mark.unit
+@patch('faiss_helper.INDEX_COMPACT_CHANGES', 0)
+@patch('faiss_helper.fetch_dataset_version', return_value=None)
+@patch('faiss_helper.get_item_bins')
+def test_apply_index_changes_compacts(mock_get_bins, mock_fetch_version, isolated_vector_store,
+                                      tmp_path, sample_embeddings, sample_item_names):
+    """Test that too many pending changes trigger a full rebuild that truncates the change feed."""
+    from faiss_helper import apply_index_changes
+    from snapshot import load_snapshot
+
+    directory = str(tmp_path / "snapshots")
+    mock_get_bins.side_effect = lambda names: ["blue bin"] * len(names)
+    isolated_vector_store.put_many(sample_item_names, sample_embeddings)
+
+    # A snapshot without a feed position is rebuilt from the store
+    assert apply_index_changes(directory) == "000001"
+    isolated_vector_store.delete([sample_item_names[0]])
+
+    assert apply_index_changes(directory) == "000002"
+    snapshot = load_snapshot(directory)
+    assert snapshot.manifest["changed_since_build"] == 0
+    assert snapshot.manifest["change_sequence"] == 2
+    assert snapshot.index.ntotal == len(sample_item_names) - 1
+    assert isolated_vector_store.changes_since(2) == []
+    with pytest.raises(ValueError):
+        isolated_vector_store.changes_since(1)
@@ -15,7 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 @pytest.fixture
 def test_client_controller():
     """Create a test client for the garbage controller router."""
-    with patch('controller.garbage_controller.classify_object') as mock_classify:
+    with patch('controller.garbage_controller.classify_object', new_callable=AsyncMock) as mock_classify:
         mock_classify.return_value = {"object_name": "plastic bottle", "bin_type": "recyclable"}
         
         from fastapi import FastAPI
@@ -315,3 +315,91 @@ def test_classify_endpoint_exact_probability_boundary(test_client_controller):
     # Test 0.5000001 (should pass)
     response = client.post("/classify", json={"object_name": "item", "probability": 0.5000001})
     assert response.status_code == 200
+
+
+@pytest.fixture
+def batch_client():
+    """Create a test client with classify_objects mocked."""
+    with patch('controller.garbage_controller.classify_objects', new_callable=AsyncMock) as mock_classify_objects:
+        mock_classify_objects.side_effect = lambda names: [
+            {"object_name": name, "bin_type": "blue bin"} for name in names
+        ]
+
+        from fastapi import FastAPI
+        from controller.garbage_controller import router
+
+        app = FastAPI()
+        app.include_router(router)
+
+        yield TestClient(app), mock_classify_objects
+
+
+@pytest.mark.unit
+def test_classify_batch_success(batch_client):
+    """Test that every item gets a result in request order."""
+    client, mock_classify_objects = batch_client
+
+    response = client.post("/classify/batch", json={"items": [
+        {"object_name": "plastic bottle", "probability": 0.9},
+        {"object_name": "glass jar", "probability": 0.8},
+    ]})
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"object_name": "plastic bottle", "bin_type": "blue bin"},
+        {"object_name": "glass jar", "bin_type": "blue bin"},
+    ]
+    mock_classify_objects.assert_called_once_with(["plastic bottle", "glass jar"])
+
+
+@pytest.mark.unit
+def test_classify_batch_per_item_validation(batch_client):
+    """Test that invalid items get an error without failing the batch."""
+    client, mock_classify_objects = batch_client
+
+    response = client.post("/classify/batch", json={"items": [
+        {"object_name": "mystery", "probability": 0.1},
+        {"object_name": "glass jar", "probability": 0.8},
+        {"object_name": "", "probability": 0.9},
+    ]})
+
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert results[0] == {"object_name": "mystery", "error": "Probability must be at least 0.5"}
+    assert results[1] == {"object_name": "glass jar", "bin_type": "blue bin"}
+    assert results[2] == {"object_name": "", "error": "Invalid Request"}
+    mock_classify_objects.assert_called_once_with(["glass jar"])
+
+
+@pytest.mark.unit
+def test_classify_batch_malformed_item_does_not_fail_batch(batch_client):
+    """Test that an item with missing or mistyped fields gets its own error instead of a 422."""
+    client, mock_classify_objects = batch_client
+
+    response = client.post("/classify/batch", json={"items": [
+        {"object_name": "glass jar"},
+        {"object_name": "tin can", "probability": "high"},
+        "plastic bottle",
+        {"object_name": "paper cup", "probability": 0.9},
+    ]})
+
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert results[0] == {"object_name": "glass jar", "error": "Invalid Request"}
+    assert results[1] == {"object_name": "tin can", "error": "Invalid Request"}
+    assert results[2] == {"object_name": None, "error": "Invalid Request"}
+    assert results[3] == {"object_name": "paper cup", "bin_type": "blue bin"}
+    mock_classify_objects.assert_called_once_with(["paper cup"])
+
+
+@pytest.mark.unit
+def test_classify_batch_empty_and_oversized(batch_client):
+    """Test that empty and oversized batches are rejected."""
+    from controller.garbage_controller import MAX_BATCH_SIZE
+
+    client, mock_classify_objects = batch_client
+
+    assert client.post("/classify/batch", json={"items": []}).status_code == 400
+    too_many = [{"object_name": f"item{i}", "probability": 0.9} for i in range(MAX_BATCH_SIZE + 1)]
+    assert client.post("/classify/batch", json={"items": too_many}).status_code == 400
+    mock_classify_objects.assert_not_called()
@@ -2,18 +2,21 @@
 Comprehensive unit tests for model/garbage_model.py to achieve 100% code coverage.
 """
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
 import os
 import sys
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+EMBEDDING = [0.1] * 1536
+
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_neo4j_hit(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_neo4j_hit(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object when Neo4j has the object."""
     from model.garbage_model import classify_object
     
@@ -21,7 +24,7 @@ def test_classify_object_neo4j_hit(mock_retrieve, mock_generate):
     mock_retrieve.return_value = "recyclable"
     mock_generate.return_value = "should not be called"
     
-    result = classify_object("plastic bottle")
+    result = await classify_object("plastic bottle")
     
     assert result == {"object_name": "plastic bottle", "bin_type": "recyclable"}
     mock_retrieve.assert_called_once_with("plastic bottle")
@@ -30,9 +33,10 @@ def test_classify_object_neo4j_hit(mock_retrieve, mock_generate):
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_neo4j_miss_uses_llm(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_neo4j_miss_uses_llm(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object falls back to LLM when Neo4j doesn't have the object."""
     from model.garbage_model import classify_object
     
@@ -40,17 +44,18 @@ def test_classify_object_neo4j_miss_uses_llm(mock_retrieve, mock_generate):
     mock_retrieve.return_value = None
     mock_generate.return_value = "compostable"
     
-    result = classify_object("banana peel")
+    result = await classify_object("banana peel")
     
     assert result == {"object_name": "banana peel", "bin_type": "compostable"}
     mock_retrieve.assert_called_once_with("banana peel")
-    mock_generate.assert_called_once_with("banana peel")
+    mock_generate.assert_called_once_with("banana peel", EMBEDDING)
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_neo4j_returns_none_string(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_neo4j_returns_none_string(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object falls back to LLM when Neo4j returns 'None' as string."""
     from model.garbage_model import classify_object
     
@@ -58,17 +63,18 @@ def test_classify_object_neo4j_returns_none_string(mock_retrieve, mock_generate)
     mock_retrieve.return_value = "None"
     mock_generate.return_value = "garbage"
     
-    result = classify_object("styrofoam cup")
+    result = await classify_object("styrofoam cup")
     
     assert result == {"object_name": "styrofoam cup", "bin_type": "garbage"}
     mock_retrieve.assert_called_once_with("styrofoam cup")
-    mock_generate.assert_called_once_with("styrofoam cup")
+    mock_generate.assert_called_once_with("styrofoam cup", EMBEDDING)
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_neo4j_returns_empty_string(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_neo4j_returns_empty_string(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object falls back to LLM when Neo4j returns empty string."""
     from model.garbage_model import classify_object
     
@@ -76,17 +82,18 @@ def test_classify_object_neo4j_returns_empty_string(mock_retrieve, mock_generate
     mock_retrieve.return_value = ""
     mock_generate.return_value = "mixed-paper"
     
-    result = classify_object("newspaper")
+    result = await classify_object("newspaper")
     
     assert result == {"object_name": "newspaper", "bin_type": "mixed-paper"}
     mock_retrieve.assert_called_once_with("newspaper")
-    mock_generate.assert_called_once_with("newspaper")
+    mock_generate.assert_called_once_with("newspaper", EMBEDDING)
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_various_bin_types(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_various_bin_types(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with various bin types from Neo4j."""
     from model.garbage_model import classify_object
     
@@ -102,7 +109,7 @@ def test_classify_object_various_bin_types(mock_retrieve, mock_generate):
         mock_retrieve.return_value = bin_type
         mock_generate.reset_mock()
         
-        result = classify_object(object_name)
+        result = await classify_object(object_name)
         
         assert result["object_name"] == object_name
         assert result["bin_type"] == bin_type
@@ -110,9 +117,10 @@ def test_classify_object_various_bin_types(mock_retrieve, mock_generate):
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_llm_fallback_various_items(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_llm_fallback_various_items(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object LLM fallback with various items."""
     from model.garbage_model import classify_object
     
@@ -126,17 +134,18 @@ def test_classify_object_llm_fallback_various_items(mock_retrieve, mock_generate
         mock_retrieve.return_value = None
         mock_generate.return_value = expected_bin
         
-        result = classify_object(object_name)
+        result = await classify_object(object_name)
         
         assert result["object_name"] == object_name
         assert result["bin_type"] == expected_bin
-        mock_generate.assert_called_with(object_name)
+        mock_generate.assert_called_with(object_name, EMBEDDING)
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_special_characters(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_special_characters(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with special characters in object name."""
     from model.garbage_model import classify_object
     
@@ -150,16 +159,17 @@ def test_classify_object_special_characters(mock_retrieve, mock_generate):
     for name in special_names:
         mock_retrieve.return_value = "recyclable"
         
-        result = classify_object(name)
+        result = await classify_object(name)
         
         assert result["object_name"] == name
         assert result["bin_type"] == "recyclable"
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_case_sensitive(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_case_sensitive(mock_retrieve, mock_generate, mock_embed):
     """Test that classify_object handles case-sensitive names."""
     from model.garbage_model import classify_object
     
@@ -168,68 +178,72 @@ def test_classify_object_case_sensitive(mock_retrieve, mock_generate):
     for name in cases:
         mock_retrieve.return_value = "recyclable"
         
-        result = classify_object(name)
+        result = await classify_object(name)
         
         assert result["object_name"] == name
         mock_retrieve.assert_called_with(name)
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_whitespace(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_whitespace(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with leading/trailing whitespace."""
     from model.garbage_model import classify_object
     
     mock_retrieve.return_value = "recyclable"
     
-    result = classify_object("  plastic bottle  ")
+    result = await classify_object("  plastic bottle  ")
     
     assert result["object_name"] == "  plastic bottle  "
     mock_retrieve.assert_called_once_with("  plastic bottle  ")
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_unicode_characters(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_unicode_characters(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with unicode characters."""
     from model.garbage_model import classify_object
     
     mock_retrieve.return_value = "compostable"
     
-    result = classify_object("café napkin")
+    result = await classify_object("café napkin")
     
     assert result["object_name"] == "café napkin"
     assert result["bin_type"] == "compostable"
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_long_name(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_long_name(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with very long object name."""
     from model.garbage_model import classify_object
     
     long_name = "very long object name " * 50
     mock_retrieve.return_value = "garbage"
     
-    result = classify_object(long_name)
+    result = await classify_object(long_name)
     
     assert result["object_name"] == long_name
     assert result["bin_type"] == "garbage"
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_return_type(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_return_type(mock_retrieve, mock_generate, mock_embed):
     """Test that classify_object always returns correct dictionary structure."""
     from model.garbage_model import classify_object
     
     mock_retrieve.return_value = "recyclable"
     
-    result = classify_object("test item")
+    result = await classify_object("test item")
     
     # Check return type and structure
     assert isinstance(result, dict)
@@ -239,40 +253,207 @@ def test_classify_object_return_type(mock_retrieve, mock_generate):
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_both_branches_covered(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_both_branches_covered(mock_retrieve, mock_generate, mock_embed):
     """Test that both Neo4j hit and miss branches are covered."""
     from model.garbage_model import classify_object
     
     # Test Neo4j hit branch
     mock_retrieve.return_value = "recyclable"
-    result1 = classify_object("item1")
+    result1 = await classify_object("item1")
     assert result1["bin_type"] == "recyclable"
     
     # Test Neo4j miss branch (None)
     mock_retrieve.return_value = None
     mock_generate.return_value = "garbage"
-    result2 = classify_object("item2")
+    result2 = await classify_object("item2")
     assert result2["bin_type"] == "garbage"
     
     # Test Neo4j miss branch ("None" string)
     mock_retrieve.return_value = "None"
     mock_generate.return_value = "compostable"
-    result3 = classify_object("item3")
+    result3 = await classify_object("item3")
     assert result3["bin_type"] == "compostable"
 
 
 @pytest.mark.unit
-@patch('model.garbage_model.generate_guess')
-@patch('model.garbage_model.retrieve_bin_for_object')
-def test_classify_object_empty_string_name(mock_retrieve, mock_generate):
+@patch('model.garbage_model.agenerate_embedding_for_query', new_callable=lambda: AsyncMock(return_value=EMBEDDING))
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_empty_string_name(mock_retrieve, mock_generate, mock_embed):
     """Test classify_object with empty string as name."""
     from model.garbage_model import classify_object
     
     mock_retrieve.return_value = "garbage"
     
-    result = classify_object("")
+    result = await classify_object("")
     
     assert result["object_name"] == ""
     assert result["bin_type"] == "garbage"
+
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_cancels_speculative_embedding_on_hit(mock_retrieve, mock_generate):
+    """Test that the speculative embedding request is cancelled when the lookup hits."""
+    import asyncio
+    from model.garbage_model import classify_object
+
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow_embedding(object_name):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def slow_lookup(object_name):
+        await started.wait()
+        return "blue bin"
+
+    mock_retrieve.side_effect = slow_lookup
+    with patch('model.garbage_model.agenerate_embedding_for_query', side_effect=slow_embedding):
+        result = await classify_object("glass jar")
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    assert result == {"object_name": "glass jar", "bin_type": "blue bin"}
+    mock_generate.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_embeds_in_parallel_with_lookup(mock_retrieve, mock_generate):
+    """Test that the embedding runs while the lookup is still in flight."""
+    import asyncio
+    from model.garbage_model import classify_object
+
+    lookup_started = asyncio.Event()
+
+    async def embedding(object_name):
+        # Only finishes if the lookup is running at the same time
+        await asyncio.wait_for(lookup_started.wait(), timeout=1)
+        return EMBEDDING
+
+    async def lookup(object_name):
+        lookup_started.set()
+        await asyncio.sleep(0)
+        return "None"
+
+    mock_retrieve.side_effect = lookup
+    mock_generate.return_value = "green bin"
+    with patch('model.garbage_model.agenerate_embedding_for_query', side_effect=embedding):
+        result = await classify_object("banana peel")
+
+    assert result == {"object_name": "banana peel", "bin_type": "green bin"}
+    mock_generate.assert_awaited_once_with("banana peel", EMBEDDING)
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_lookup_error_cancels_embedding(mock_retrieve, mock_generate):
+    """Test that a failing lookup does not leave the speculative request running."""
+    import asyncio
+    from model.garbage_model import classify_object
+
+    cancelled = asyncio.Event()
+
+    async def slow_embedding(object_name):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def failing_lookup(object_name):
+        await asyncio.sleep(0)
+        raise RuntimeError("neo4j down")
+
+    mock_retrieve.side_effect = failing_lookup
+    with patch('model.garbage_model.agenerate_embedding_for_query', side_effect=slow_embedding):
+        with pytest.raises(RuntimeError):
+            await classify_object("glass jar")
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guess', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bin_for_object', new_callable=AsyncMock)
+async def test_classify_object_retrieves_failed_speculative_embedding(mock_retrieve, mock_generate):
+    """Test that an embedding failing as it is cancelled is awaited on a hit, so its error is not logged as lost."""
+    import asyncio
+    from model.garbage_model import classify_object
+
+    async def failing_embedding(object_name):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            # e.g. an HTTP client turning the cancellation into its own error
+            raise RuntimeError("connection closed")
+
+    async def lookup(object_name):
+        await asyncio.sleep(0)
+        return "blue bin"
+
+    loop = asyncio.get_running_loop()
+    unretrieved = []
+    loop.set_exception_handler(lambda loop, context: unretrieved.append(context))
+    mock_retrieve.side_effect = lookup
+    try:
+        with patch('model.garbage_model.agenerate_embedding_for_query', side_effect=failing_embedding):
+            result = await classify_object("glass jar")
+        # Give a cancelled task a turn to finish, then drop it
+        await asyncio.sleep(0)
+        import gc
+        gc.collect()
+    finally:
+        loop.set_exception_handler(None)
+
+    assert result == {"object_name": "glass jar", "bin_type": "blue bin"}
+    assert unretrieved == []
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guesses', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bins_for_objects', new_callable=AsyncMock)
+async def test_classify_objects_dedupes_and_merges(mock_bulk_lookup, mock_guesses):
+    """Test that duplicate names are resolved once and results keep input order."""
+    from model.garbage_model import classify_objects
+
+    mock_bulk_lookup.return_value = {"glass jar": "blue bin", "mystery": "None", "broken": "None"}
+    mock_guesses.return_value = ({"mystery": "garbage bin"}, {"broken": "No guess returned for this item"})
+
+    results = await classify_objects(["glass jar", "mystery", "glass jar", "broken"])
+
+    mock_bulk_lookup.assert_awaited_once_with(["glass jar", "mystery", "broken"])
+    mock_guesses.assert_awaited_once_with(["mystery", "broken"])
+    assert results == [
+        {"object_name": "glass jar", "bin_type": "blue bin"},
+        {"object_name": "mystery", "bin_type": "garbage bin"},
+        {"object_name": "glass jar", "bin_type": "blue bin"},
+        {"object_name": "broken", "error": "No guess returned for this item"},
+    ]
+
+
+@pytest.mark.unit
+@patch('model.garbage_model.agenerate_guesses', new_callable=AsyncMock)
+@patch('model.garbage_model.aretrieve_bins_for_objects', new_callable=AsyncMock)
+async def test_classify_objects_lookup_failure_guesses_everything(mock_bulk_lookup, mock_guesses):
+    """Test that a failed bulk lookup sends every name to the guess stage."""
+    from model.garbage_model import classify_objects
+
+    mock_bulk_lookup.side_effect = RuntimeError("neo4j down")
+    mock_guesses.return_value = ({"a": "blue bin", "b": "green bin"}, {})
+
+    results = await classify_objects(["a", "b"])
+
+    mock_guesses.assert_awaited_once_with(["a", "b"])
+    assert [result["bin_type"] for result in results] == ["blue bin", "green bin"]
@@ -0,0 +1,170 @@
+"""
+Unit tests for image_cache.py.
+"""
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RESULT = {"object_name": "plastic bottle", "bin_type": "blue bin"}
+
+
+@pytest.mark.unit
+def test_memory_tier_and_lru_eviction():
+    """Test that hits come from the LRU and the least recently used entry is evicted."""
+    from image_cache import ImageResultCache
+
+    cache = ImageResultCache(capacity=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.get("a") == RESULT
+    cache.put("c", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    assert cache.stats()["memory_hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.unit
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that a new cache on the same file answers from disk."""
+    from image_cache import ImageResultCache
+
+    path = str(tmp_path / "images.sqlite3")
+    ImageResultCache(path).put("a", dict(RESULT, extra="dropped"))
+
+    cache = ImageResultCache(path)
+    assert cache.get("a") == RESULT
+    assert cache.get("a") == RESULT
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+@pytest.mark.unit
+def test_entries_expire_in_both_tiers(tmp_path):
+    """Test that results older than the TTL are misses, in memory and on disk."""
+    from image_cache import ImageResultCache
+
+    path = str(tmp_path / "images.sqlite3")
+    cache = ImageResultCache(path, ttl=60)
+    with patch('image_cache.time.time', return_value=1000.0):
+        cache.put("a", RESULT)
+    with patch('image_cache.time.time', return_value=1059.0):
+        assert cache.get("a") == RESULT
+        assert ImageResultCache(path, ttl=60).get("a") == RESULT
+    with patch('image_cache.time.time', return_value=1061.0):
+        assert cache.get("a") is None
+        assert ImageResultCache(path, ttl=60).get("a") is None
+
+
+def _gradient(width=320, height=240):
+    import numpy as np
+    from PIL import Image
+
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    return Image.fromarray(((x * 2 + y) / 3).astype('uint8')).convert("RGB")
+
+
+def _encode(image, format, **options):
+    import io
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.unit
+def test_dhash_survives_resize_and_reencode():
+    """Test that re-encoded and resized copies hash close together and other images do not."""
+    import io
+    from PIL import Image
+    from image_cache import hamming_distance, image_dhash
+
+    photo = _gradient()
+    original = image_dhash(photo)
+    copy = image_dhash(Image.open(io.BytesIO(_encode(photo.resize((160, 120)), "JPEG", quality=60))))
+    other = image_dhash(photo.transpose(0))
+
+    assert original < 1 << 256
+    assert hamming_distance(original, copy) <= 16
+    assert hamming_distance(original, other) > 16
+
+
+def _kiosk_photo(color=None, full=False):
+    from PIL import ImageDraw
+
+    photo = _gradient(640, 480)
+    if color is not None:
+        draw = ImageDraw.Draw(photo)
+        # About 4% of the frame, or an object filling it
+        draw.ellipse((32, 24, 608, 456) if full else (256, 192, 384, 288), fill=color)
+    return photo
+
+
+@pytest.mark.unit
+def test_colour_grid_separates_what_dhash_merges():
+    """Test that different objects on one background are no near-duplicates, but a re-encoded copy is."""
+    import io
+    from PIL import Image
+    from image_cache import NearDuplicateIndex, image_colors, image_dhash
+
+    def signature(photo):
+        return image_dhash(photo), image_colors(photo)
+
+    index = NearDuplicateIndex()
+    index.put(*signature(_kiosk_photo((220, 30, 30))), "red can")
+    index.put(*signature(_kiosk_photo((220, 30, 30), full=True)), "red lid")
+
+    assert index.get(*signature(_kiosk_photo((30, 30, 220)))) is None
+    assert index.get(*signature(_kiosk_photo())) is None
+    assert index.get(*signature(_kiosk_photo((30, 30, 220), full=True))) is None
+    copy = Image.open(io.BytesIO(_encode(_kiosk_photo((220, 30, 30)).resize((320, 240)), "JPEG", quality=50)))
+    assert index.get(*signature(copy)) == "red can"
+
+
+@pytest.mark.unit
+def test_bk_tree_search_matches_linear_scan():
+    """Test that the BK-tree finds exactly what a linear scan finds, closest first."""
+    import random
+    from image_cache import BKTree, hamming_distance
+
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for value in values:
+        tree.add(value, value)
+    assert len(tree) == 500
+
+    for value in values[:50]:
+        query = value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        expected = sorted(hamming_distance(query, v) for v in values if hamming_distance(query, v) <= 24)
+        found = tree.search(query, 24)
+        assert [distance for distance, _ in found] == expected
+        assert all(hamming_distance(query, item) == distance for distance, item in found)
+    assert tree.search(values[0], 0) == [(0, values[0])]
+    assert BKTree().search(1, 64) == []
+
+
+@pytest.mark.unit
+def test_near_duplicate_index_threshold_capacity_and_ttl():
+    """Test matching within the distance, eviction of the oldest entries and expiry."""
+    from image_cache import NearDuplicateIndex
+
+    index = NearDuplicateIndex(max_distance=2, max_color_difference=10, capacity=4, ttl=60)
+    grey, blue = bytes([100] * 3), bytes([100, 100, 200])
+    with patch('image_cache.time.time', return_value=1000.0):
+        index.put(0b1111, grey, "can")
+        assert index.get(0b1100, bytes([105] * 3)) == "can"
+        assert index.get(0b1100, blue) is None
+        assert index.get(0b1000, grey) is None
+        for value in (1 << 20, 1 << 30, 1 << 40, 1 << 50):
+            index.put(value, grey, "other")
+        assert index.get(0b1111, grey) is None
+        assert index.get(1 << 50, grey) == "other"
+        assert index.stats()["entries"] <= 4
+    with patch('image_cache.time.time', return_value=1061.0):
+        assert index.get(1 << 50, grey) is None
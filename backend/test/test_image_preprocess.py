@@ -0,0 +1,126 @@
+"""
+Unit tests for image_preprocess.py.
+"""
+import pytest
+import io
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _photo(width=2000, height=1500, orientation=None, format="JPEG"):
+    from PIL import Image
+
+    image = Image.new("RGB", (width, height), (200, 30, 30))
+    image.paste((30, 30, 200), (0, 0, width // 2, height))
+    buffer = io.BytesIO()
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(buffer, format=format, exif=exif)
+    else:
+        image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+@pytest.mark.unit
+def test_preprocess_downsizes_and_reencodes():
+    """Test that a large photo is shrunk to the target side and re-encoded as JPEG."""
+    from PIL import Image
+    from image_preprocess import preprocess_image
+
+    data = _photo(format="PNG")
+    result = preprocess_image(data, max_side=512, output_format="JPEG", quality=80)
+
+    assert (result["width"], result["height"]) == (512, 384)
+    assert result["content_type"] == "image/jpeg"
+    assert result["extension"] == ".jpg"
+    assert len(result["data"]) < len(data)
+    assert Image.open(io.BytesIO(result["data"])).format == "JPEG"
+    assert isinstance(result["phash"], int)
+
+
+@pytest.mark.unit
+def test_preprocess_applies_exif_orientation():
+    """Test that a photo taken sideways comes out upright."""
+    from image_preprocess import preprocess_image
+
+    # Orientation 6: stored landscape, displayed rotated 90 degrees
+    result = preprocess_image(_photo(orientation=6), max_side=400, output_format="JPEG")
+
+    assert (result["width"], result["height"]) == (300, 400)
+
+
+@pytest.mark.unit
+def test_preprocess_webp_and_small_images():
+    """Test WebP output and that small images are not enlarged."""
+    from image_preprocess import preprocess_image
+
+    result = preprocess_image(_photo(100, 80), max_side=512, output_format="WEBP")
+
+    assert (result["width"], result["height"]) == (100, 80)
+    assert result["content_type"] == "image/webp"
+
+
+@pytest.mark.unit
+def test_preprocess_undecodable_returns_none():
+    """Test that bytes Pillow cannot read are reported, not raised."""
+    from image_preprocess import preprocess_image
+
+    assert preprocess_image(b"not an image") is None
+
+
+@pytest.mark.unit
+def test_detail_policy_sets_target_side():
+    """Test that low detail never sends more than the model looks at."""
+    from image_preprocess import ImagePreprocessor, target_side
+
+    assert target_side("low", 1024) == 512
+    assert target_side("high", 1024) == 1024
+    assert target_side("auto", 1024) == 1024
+    assert ImagePreprocessor(detail="low", max_side=256).max_side == 256
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_preprocessor_inline_and_in_pool():
+    """Test that the preprocessor gives the same result on a thread and in worker processes."""
+    from image_preprocess import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(workers=1, detail="low")
+    data = _photo()
+    inline = await preprocessor.process(data)
+
+    preprocessor.start()
+    try:
+        assert preprocessor.running
+        pooled = await preprocessor.process(data)
+    finally:
+        preprocessor.stop()
+
+    assert pooled == inline
+    assert await preprocessor.process(b"junk") is None
+    stats = preprocessor.stats()
+    assert stats["processed"] == 2
+    assert stats["undecodable"] == 1
+    assert stats["bytes_out"] < stats["bytes_in"]
+
+
+@pytest.mark.unit
+def test_pool_workers_do_not_import_the_server():
+    """Test that pool workers start from a server that imported only image_preprocess."""
+    import langchain_helper  # noqa: F401 - the parent has the whole app loaded
+    from image_preprocess import ImagePreprocessor
+
+    preprocessor = ImagePreprocessor(workers=1)
+    preprocessor.start()
+    try:
+        modules = preprocessor._pool.submit(eval, "sorted(__import__('sys').modules)").result(timeout=60)
+    finally:
+        preprocessor.stop()
+
+    assert "image_preprocess" in modules
+    assert "langchain_helper" not in modules
+    assert "faiss" not in modules
@@ -0,0 +1,89 @@
+"""
+Unit tests for index_factory.py.
+"""
+import pytest
+import numpy as np
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.unit
+def test_resolve_index_spec_by_catalog_size():
+    """Test that auto selection moves from exact search to IVF to IVF with 8-bit codes as the catalog grows."""
+    from index_factory import FLAT_MAX_ITEMS, IVF_FLAT_MAX_ITEMS, resolve_index_spec
+
+    assert resolve_index_spec("auto", FLAT_MAX_ITEMS) == "Flat"
+    assert resolve_index_spec("auto", FLAT_MAX_ITEMS + 1).startswith("IVF")
+    assert resolve_index_spec("auto", FLAT_MAX_ITEMS + 1).endswith(",Flat")
+    assert resolve_index_spec("auto", IVF_FLAT_MAX_ITEMS + 1).startswith("IVF")
+    assert resolve_index_spec("auto", IVF_FLAT_MAX_ITEMS + 1).endswith(",SQ8")
+    assert resolve_index_spec("IVF64,PQ16", 10) == "IVF64,PQ16"
+
+
+@pytest.mark.unit
+def test_ivf_list_count_leaves_enough_training_points():
+    """Test that small catalogs never get more lists than they can train."""
+    from index_factory import TRAINING_POINTS_PER_CENTROID, ivf_list_count
+
+    assert ivf_list_count(10) == 1
+    assert ivf_list_count(1000) * TRAINING_POINTS_PER_CENTROID <= 1000
+    assert ivf_list_count(4_000_000) == 8000
+
+
+@pytest.mark.unit
+def test_create_index_metric():
+    """Test that the configured metric is passed to the factory and unknown metrics fail."""
+    import faiss
+    from index_factory import create_index
+
+    assert create_index("Flat", 8, "l2").metric_type == faiss.METRIC_L2
+    assert create_index("HNSW32", 8, "IP").metric_type == faiss.METRIC_INNER_PRODUCT
+    with pytest.raises(ValueError):
+        create_index("Flat", 8, "cosine")
+
+
+@pytest.mark.unit
+def test_prepare_vectors_normalizes_for_inner_product():
+    """Test that inner-product vectors are unit length and the input is left untouched."""
+    from index_factory import prepare_vectors
+
+    vectors = np.array([[3, 4], [0, 2]], dtype='float32')
+
+    np.testing.assert_allclose(prepare_vectors(vectors, "ip"), [[0.6, 0.8], [0, 1]])
+    np.testing.assert_array_equal(prepare_vectors(vectors, "l2"), vectors)
+    assert vectors[0].tolist() == [3, 4]
+
+
+@pytest.mark.unit
+def test_build_index_trains_and_configures_ivf():
+    """Test that IVF indexes are trained before adding and get the configured nprobe."""
+    import faiss
+    from index_factory import build_index
+
+    vectors = np.random.default_rng(0).random((500, 16)).astype('float32')
+    index = build_index(vectors, "IVF4,Flat")
+
+    assert index.is_trained
+    assert index.ntotal == 500
+    assert faiss.extract_index_ivf(index).nprobe == 4
+    assert index.search(vectors[42:43], 1)[1][0][0] == 42
+
+
+@pytest.mark.unit
+def test_benchmark_index_specs():
+    """Test that the benchmark reports recall against exact search and untrainable specs as errors."""
+    from index_factory import benchmark_index_specs
+
+    vectors = np.random.default_rng(0).random((500, 16)).astype('float32')
+    results = benchmark_index_specs(vectors, ["Flat", "HNSW32", "IVF4,Flat", "IVF1000,Flat"], num_queries=20)
+
+    by_spec = {result["spec"]: result for result in results}
+    assert by_spec["Flat"]["recall_at_k"] == 1.0
+    assert 0 < by_spec["IVF4,Flat"]["recall_at_k"] <= 1.0
+    for spec in ("Flat", "HNSW32", "IVF4,Flat"):
+        assert by_spec[spec]["latency_ms_p95"] >= by_spec[spec]["latency_ms_p50"] > 0
+        assert by_spec[spec]["memory_bytes"] > 0
+    assert "error" in by_spec["IVF1000,Flat"]
@@ -0,0 +1,108 @@
+"""
+Unit tests for index_holder.py.
+"""
+import pytest
+import numpy as np
+import faiss
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def publish(directory, names, dimension=4):
+    from snapshot import write_snapshot
+
+    vectors = np.random.rand(len(names), dimension).astype('float32')
+    index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    return write_snapshot(index, [vectors], names, ["blue bin"] * len(names), "test-model",
+                          directory=str(directory))
+
+
+@pytest.mark.unit
+def test_reload_swaps_to_new_version(tmp_path):
+    """Test that a new version is swapped in while a reader keeps the snapshot it started with."""
+    from index_holder import SnapshotHolder
+    from snapshot import load_snapshot
+
+    publish(tmp_path, ["a", "b"])
+    holder = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, directory=str(tmp_path))
+    in_flight = holder.current
+
+    assert holder.reload() is False
+    publish(tmp_path, ["a", "b", "c"])
+    assert holder.reload() is True
+
+    assert holder.version == "000002"
+    assert list(holder.current.item_names) == ["a", "b", "c"]
+    assert in_flight.version == "000001"
+    assert in_flight.index.search(np.asarray(in_flight.vectors[:1]), 1)[1][0][0] == 0
+    assert holder.stats()["reloads"] == 1
+
+    # An explicit version rolls back
+    assert holder.reload("000001") is True
+    assert holder.stats()["items"] == 2
+
+
+@pytest.mark.unit
+def test_rollback_is_not_undone_by_the_watcher(tmp_path):
+    """Test that an explicit rollback holds until CURRENT names a newer version."""
+    from index_holder import SnapshotHolder
+    from snapshot import load_snapshot
+
+    publish(tmp_path, ["a"])
+    publish(tmp_path, ["a", "b"])
+    holder = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, directory=str(tmp_path))
+
+    assert holder.reload("000001") is True
+    assert holder.reload_if_stale() is False
+    assert holder.reload() is False
+    assert holder.version == "000001"
+
+    publish(tmp_path, ["a", "b", "c"])
+    assert holder.reload_if_stale() is True
+    assert holder.version == "000003"
+
+
+@pytest.mark.unit
+def test_rejected_snapshot_keeps_serving_old_one(tmp_path):
+    """Test that a snapshot failing validation is not swapped in."""
+    from index_holder import SnapshotHolder
+    from snapshot import load_snapshot
+
+    def validate(snapshot):
+        if len(snapshot.item_names) > 2:
+            raise ValueError("too big")
+
+    publish(tmp_path, ["a", "b"])
+    holder = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, validate, directory=str(tmp_path))
+    publish(tmp_path, ["a", "b", "c"])
+
+    with pytest.raises(ValueError):
+        holder.reload()
+    assert holder.reload_if_stale() is False
+    assert holder.version == "000001"
+    assert holder.stats()["last_error"] == "too big"
+
+
+@pytest.mark.unit
+def test_watcher_picks_up_new_version(tmp_path):
+    """Test that the background watcher swaps in a newly published snapshot."""
+    from index_holder import SnapshotHolder
+    from snapshot import load_snapshot
+
+    publish(tmp_path, ["a"])
+    holder = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, directory=str(tmp_path))
+    holder.start_watching(0.01)
+    try:
+        publish(tmp_path, ["a", "b"])
+        deadline = time.time() + 5
+        while holder.version != "000002" and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        holder.stop_watching()
+
+    assert holder.version == "000002"
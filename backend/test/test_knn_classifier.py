@@ -0,0 +1,80 @@
+"""
+Unit tests for knn_classifier.py.
+"""
+import pytest
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.unit
+def test_vote_unanimous_close_neighbours():
+    """Test that agreeing close neighbours produce a confident vote."""
+    from knn_classifier import vote_on_neighbours
+
+    neighbours = [(f"item{i}", "blue bin", 0.1 + i * 0.02) for i in range(5)]
+
+    bin_type, confidence = vote_on_neighbours(neighbours)
+
+    assert bin_type == "blue bin"
+    assert confidence == pytest.approx(1.0)
+
+
+@pytest.mark.unit
+def test_vote_weighted_by_distance():
+    """Test that closer neighbours outweigh farther ones."""
+    from knn_classifier import vote_on_neighbours
+
+    neighbours = [
+        ("item1", "green bin", 0.0),
+        ("item2", "green bin", 0.0),
+        ("item3", "green bin", 0.0),
+        ("item4", "blue bin", 0.25),
+    ]
+
+    bin_type, confidence = vote_on_neighbours(neighbours, min_confidence=0.7)
+
+    assert bin_type == "green bin"
+    assert confidence == pytest.approx(3.0 / (3.0 + 1.0 / 1.25))
+
+
+@pytest.mark.unit
+def test_vote_ambiguous_escalates():
+    """Test that a split vote returns None."""
+    from knn_classifier import vote_on_neighbours
+
+    neighbours = [
+        ("item1", "blue bin", 0.1),
+        ("item2", "garbage bin", 0.1),
+        ("item3", "blue bin", 0.1),
+        ("item4", "garbage bin", 0.1),
+    ]
+
+    assert vote_on_neighbours(neighbours) is None
+
+
+@pytest.mark.unit
+def test_vote_ignores_far_and_unlabelled_neighbours():
+    """Test that distant or unknown neighbours do not count towards the quorum."""
+    from knn_classifier import vote_on_neighbours
+
+    neighbours = [
+        ("item1", "blue bin", 0.1),
+        ("item2", "blue bin", 0.1),
+        ("item3", "blue bin", 0.9),
+        ("item4", "None", 0.1),
+        ("item5", None, 0.1),
+    ]
+
+    assert vote_on_neighbours(neighbours) is None
+    assert vote_on_neighbours(neighbours, min_neighbours=2) == ("blue bin", pytest.approx(1.0))
+
+
+@pytest.mark.unit
+def test_vote_empty():
+    """Test that no neighbours means no vote."""
+    from knn_classifier import vote_on_neighbours
+
+    assert vote_on_neighbours([]) is None
@@ -108,8 +108,8 @@ def test_retrieve_bin_for_object_query_format(mock_driver):
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess(mock_gen_embedding, mock_search, mock_retrieve, mock_client,
                        sample_item_names):
@@ -119,12 +119,9 @@ def test_generate_guess(mock_gen_embedding, mock_search, mock_retrieve, mock_cli
     # Mock embedding generation
     mock_gen_embedding.return_value = [0.1] * 1536
     
-    # Mock similar items search
-    mock_search.return_value = sample_item_names[:5]
-    
-    # Mock bin retrieval for similar items
+    # Mock similar items search, which returns each neighbour with its bin
     bin_types = ["recyclable", "recyclable", "compostable", "recyclable", "garbage"]
-    mock_retrieve.side_effect = bin_types
+    mock_search.return_value = [(name, bin_type, 0.5) for name, bin_type in zip(sample_item_names[:5], bin_types)]
     
     # Mock LLM response
     mock_completion = MagicMock()
@@ -136,12 +133,14 @@ def test_generate_guess(mock_gen_embedding, mock_search, mock_retrieve, mock_cli
     assert result == "recyclable"
     mock_gen_embedding.assert_called_once_with("unknown item")
     mock_search.assert_called_once()
+    # Bins came with the search results, so no database lookup is needed
+    mock_retrieve.assert_not_called()
 
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_uses_top_5_similar_items(mock_gen_embedding, mock_search, 
                                                   mock_retrieve, mock_client,
@@ -150,8 +149,8 @@ def test_generate_guess_uses_top_5_similar_items(mock_gen_embedding, mock_search
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = sample_item_names[:5]
-    mock_retrieve.return_value = "recyclable"
+    # Distant neighbours, so the kNN vote does not short-circuit the LLM
+    mock_search.return_value = [(name, "recyclable", 1.0) for name in sample_item_names[:5]]
     
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
@@ -166,8 +165,8 @@ def test_generate_guess_uses_top_5_similar_items(mock_gen_embedding, mock_search
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_builds_context(mock_gen_embedding, mock_search, 
                                        mock_retrieve, mock_client):
@@ -175,10 +174,8 @@ def test_generate_guess_builds_context(mock_gen_embedding, mock_search,
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = ["item1", "item2", "item3"]
-    
     # Return different bin types for context
-    mock_retrieve.side_effect = ["recyclable", "compostable", "garbage"]
+    mock_search.return_value = [("item1", "recyclable", 0.1), ("item2", "compostable", 0.1), ("item3", "garbage", 0.1)]
     
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
@@ -199,8 +196,8 @@ def test_generate_guess_builds_context(mock_gen_embedding, mock_search,
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_llm_parameters(mock_gen_embedding, mock_search, 
                                        mock_retrieve, mock_client):
@@ -208,8 +205,7 @@ def test_generate_guess_llm_parameters(mock_gen_embedding, mock_search,
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = ["item1"]
-    mock_retrieve.return_value = "recyclable"
+    mock_search.return_value = [("item1", "recyclable", 1.0)]
     
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
@@ -225,8 +221,8 @@ def test_generate_guess_llm_parameters(mock_gen_embedding, mock_search,
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_system_message(mock_gen_embedding, mock_search, 
                                        mock_retrieve, mock_client):
@@ -234,8 +230,7 @@ def test_generate_guess_system_message(mock_gen_embedding, mock_search,
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = ["item1"]
-    mock_retrieve.return_value = "recyclable"
+    mock_search.return_value = [("item1", "recyclable", 1.0)]
     
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
@@ -254,8 +249,8 @@ def test_generate_guess_system_message(mock_gen_embedding, mock_search,
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_different_bin_types(mock_gen_embedding, mock_search, 
                                             mock_retrieve, mock_client):
@@ -264,10 +259,12 @@ def test_generate_guess_different_bin_types(mock_gen_embedding, mock_search,
     
     bin_types = ["recyclable", "compostable", "garbage", "mixed-paper"]
     
-    for expected_bin in bin_types:
-        mock_gen_embedding.return_value = [0.1] * 1536
-        mock_search.return_value = ["item1"]
-        mock_retrieve.return_value = expected_bin
+    for i, expected_bin in enumerate(bin_types):
+        # Distinct embeddings so earlier answers are not reused from the semantic cache
+        embedding = [0.0] * 1536
+        embedding[i] = 1.0
+        mock_gen_embedding.return_value = embedding
+        mock_search.return_value = [("item1", expected_bin, 1.0)]
         
         mock_completion = MagicMock()
         mock_completion.choices = [MagicMock(message=MagicMock(content=expected_bin))]
@@ -341,8 +338,8 @@ def test_module_loads_item_names():
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_extracts_content_from_response(mock_gen_embedding, mock_search,
                                                        mock_retrieve, mock_client):
@@ -350,8 +347,7 @@ def test_generate_guess_extracts_content_from_response(mock_gen_embedding, mock_
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = ["item1"]
-    mock_retrieve.return_value = "recyclable"
+    mock_search.return_value = [("item1", "recyclable", 1.0)]
     
     # Mock a detailed response structure
     mock_message = MagicMock()
@@ -369,8 +365,8 @@ def test_generate_guess_extracts_content_from_response(mock_gen_embedding, mock_
 
 @pytest.mark.unit
 @patch('langchain_helper.client')
-@patch('langchain_helper.retrieve_bin_for_object')
-@patch('langchain_helper.search_similar_items')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
 @patch('langchain_helper.generate_embedding_for_query')
 def test_generate_guess_uses_faiss_index(mock_gen_embedding, mock_search,
                                          mock_retrieve, mock_client):
@@ -378,8 +374,7 @@ def test_generate_guess_uses_faiss_index(mock_gen_embedding, mock_search,
     from langchain_helper import generate_guess
     
     mock_gen_embedding.return_value = [0.1] * 1536
-    mock_search.return_value = ["item1"]
-    mock_retrieve.return_value = "recyclable"
+    mock_search.return_value = [("item1", "recyclable", 1.0)]
     
     mock_completion = MagicMock()
     mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
@@ -416,3 +411,459 @@ def test_retrieve_bin_for_object_special_characters(mock_driver):
     for name in special_names:
         result = retrieve_bin_for_object(name)
         assert result == "recyclable"
+
+
+@pytest.mark.unit
+@patch('langchain_helper.driver')
+def test_retrieve_bin_for_object_uses_loaded_table(mock_driver):
+    """Test that a loaded in-memory table answers without touching Neo4j."""
+    from langchain_helper import retrieve_bin_for_object, bin_table
+
+    bin_table.replace([("plastic bottle", "blue bin")], version=1)
+    try:
+        assert retrieve_bin_for_object("plastic bottle") == "blue bin"
+        assert retrieve_bin_for_object("unknown item") == "None"
+    finally:
+        bin_table._table = None
+
+    mock_driver.session.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('langchain_helper.driver')
+def test_retrieve_bin_for_object_resolves_near_exact_names(mock_driver):
+    """Test that vision-style free text resolves through the normalized index."""
+    from langchain_helper import retrieve_bin_for_object, bin_table
+
+    bin_table.replace([("plastic bottle", "blue bin")], version=1)
+    try:
+        assert retrieve_bin_for_object("Plastic bottles.") == "blue bin"
+    finally:
+        bin_table._table = None
+
+    mock_driver.session.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('langchain_helper.client')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
+@patch('langchain_helper.generate_embedding_for_query')
+def test_generate_guess_fetches_missing_bins_in_one_batch(mock_gen_embedding, mock_search,
+                                                          mock_retrieve, mock_client):
+    """Test that neighbours without a label are resolved with a single batched lookup."""
+    from langchain_helper import generate_guess
+
+    mock_gen_embedding.return_value = [0.1] * 1536
+    mock_search.return_value = [("item1", None, 0.1), ("item2", "garbage", 0.1), ("item3", None, 0.1)]
+    mock_retrieve.return_value = {"item1": "recyclable", "item3": "compostable"}
+
+    mock_completion = MagicMock()
+    mock_completion.choices = [MagicMock(message=MagicMock(content="recyclable"))]
+    mock_client.chat.completions.create.return_value = mock_completion
+
+    generate_guess("test item")
+
+    mock_retrieve.assert_called_once_with(["item1", "item3"])
+    user_message = mock_client.chat.completions.create.call_args[1]['messages'][1]['content']
+    assert "item1 goes into recyclable" in user_message
+    assert "item2 goes into garbage" in user_message
+    assert "item3 goes into compostable" in user_message
+
+
+@pytest.mark.unit
+@patch('langchain_helper.driver')
+def test_retrieve_bins_for_objects_single_query(mock_driver):
+    """Test that several bins are fetched with one UNWIND query."""
+    from langchain_helper import retrieve_bins_for_objects
+
+    mock_session = MagicMock()
+    mock_driver.session.return_value.__enter__.return_value = mock_session
+    mock_session.run.return_value = [
+        {"object_name": "item1", "bin_type": "recyclable"},
+        {"object_name": "item2", "bin_type": None},
+    ]
+
+    bins = retrieve_bins_for_objects(["item1", "item2"])
+
+    assert bins == {"item1": "recyclable", "item2": "None"}
+    mock_session.run.assert_called_once()
+    assert "UNWIND $object_names" in mock_session.run.call_args[0][0]
+
+
+@pytest.mark.unit
+@patch('langchain_helper.driver')
+def test_retrieve_bins_for_objects_uses_loaded_table(mock_driver):
+    """Test that batched lookups are answered by the in-memory table when loaded."""
+    from langchain_helper import retrieve_bins_for_objects, bin_table
+
+    bin_table.replace([("item1", "blue bin")], version=1)
+    try:
+        assert retrieve_bins_for_objects(["item1", "item2"]) == {"item1": "blue bin", "item2": "None"}
+    finally:
+        bin_table._table = None
+
+    mock_driver.session.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('langchain_helper.client')
+@patch('langchain_helper.retrieve_bins_for_objects')
+@patch('langchain_helper.search_similar_items_scored')
+@patch('langchain_helper.generate_embedding_for_query')
+def test_generate_guess_skips_llm_when_neighbours_agree(mock_gen_embedding, mock_search,
+                                                        mock_retrieve, mock_client):
+    """Test that close, agreeing neighbours decide the bin without an LLM call."""
+    from langchain_helper import generate_guess
+
+    mock_gen_embedding.return_value = [0.1] * 1536
+    mock_search.return_value = [(f"item{i}", "blue bin", 0.1) for i in range(5)]
+
+    result = generate_guess("plastic water bottle")
+
+    assert result == "blue bin"
+    mock_client.chat.completions.create.assert_not_called()
+    mock_retrieve.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('langchain_helper.openai.embeddings.create')
+def test_generate_embedding_for_query_uses_cache(mock_create):
+    """Test that repeated names only hit the embeddings API once."""
+    from langchain_helper import generate_embedding_for_query, embedding_cache
+
+    mock_response = MagicMock()
+    mock_response.data = [MagicMock(embedding=[0.1] * 1536)]
+    mock_create.return_value = mock_response
+
+    generate_embedding_for_query("Plastic Bottle")
+    embedding = generate_embedding_for_query("plastic bottle")
+
+    assert len(embedding) == 1536
+    mock_create.assert_called_once()
+    assert embedding_cache.stats()["memory_hits"] == 1
+
+
+@pytest.mark.unit
+@patch('langchain_helper.client')
+@patch('langchain_helper.search_similar_items_scored')
+@patch('langchain_helper.generate_embedding_for_query')
+def test_generate_guess_reuses_semantic_cache(mock_gen_embedding, mock_search, mock_client):
+    """Test that a paraphrased query reuses an earlier LLM guess."""
+    from langchain_helper import generate_guess
+
+    mock_gen_embedding.return_value = [0.1] * 1536
+    mock_search.return_value = [("item1", "blue bin", 1.0)]
+    mock_completion = MagicMock()
+    mock_completion.choices = [MagicMock(message=MagicMock(content="blue bin"))]
+    mock_client.chat.completions.create.return_value = mock_completion
+
+    assert generate_guess("water bottle") == "blue bin"
+    assert generate_guess("bottle of water") == "blue bin"
+
+    mock_client.chat.completions.create.assert_called_once()
+    mock_search.assert_called_once()
+
+
+@pytest.fixture
+def live_write_back():
+    """Pretend the write-behind queue is running and restore module state afterwards."""
+    import langchain_helper
+
+    saved = (langchain_helper.bin_table._table, langchain_helper.index_holder._snapshot)
+    snapshot = langchain_helper.index_holder.current
+    langchain_helper.bin_table.replace([("plastic bottle", "blue bin")], version=1)
+    langchain_helper.index_holder._snapshot = snapshot._replace(
+        index=MagicMock(), item_names=list(snapshot.item_names),
+        item_bins=["blue bin"] * len(snapshot.item_names))
+    with patch.object(type(langchain_helper.write_back), 'running', True), \
+         patch.object(langchain_helper.write_back, 'enqueue') as mock_enqueue:
+        yield langchain_helper, mock_enqueue
+    langchain_helper.bin_table._table, langchain_helper.index_holder._snapshot = saved
+
+
+@pytest.mark.unit
+def test_learn_guess_promotes_guess(live_write_back):
+    """Test that a learned guess becomes an exact hit and is queued for Neo4j."""
+    langchain_helper, mock_enqueue = live_write_back
+
+    langchain_helper.learn_guess("Coffee Pods", [0.1] * 1536, "blue bin", "llm")
+
+    assert langchain_helper.retrieve_bin_for_object("coffee pod") == "blue bin"
+    snapshot = langchain_helper.index_holder.current
+    assert snapshot.item_names[-1] == "coffee pod"
+    assert snapshot.item_bins[-1] == "blue bin"
+    snapshot.index.add.assert_called_once()
+    mock_enqueue.assert_called_once_with("coffee pod", "blue bin", [0.1] * 1536,
+                                         source="llm", confidence=None)
+
+
+@pytest.mark.unit
+def test_learn_guess_gates(live_write_back):
+    """Test that unknown bins and low-confidence votes are not written back."""
+    langchain_helper, mock_enqueue = live_write_back
+
+    langchain_helper.learn_guess("thing", [0.1] * 1536, "I am not sure", "llm")
+    langchain_helper.learn_guess("thing", [0.1] * 1536, "blue bin", "knn", confidence=0.5)
+    langchain_helper.learn_guess("...", [0.1] * 1536, "blue bin", "llm")
+
+    mock_enqueue.assert_not_called()
+    langchain_helper.index_holder.current.index.add.assert_not_called()
+
+
+@pytest.mark.unit
+def test_learn_guess_noop_without_running_queue():
+    """Test that nothing is learned unless the app started the write-behind queue."""
+    import langchain_helper
+
+    with patch.object(langchain_helper.write_back, 'enqueue') as mock_enqueue:
+        langchain_helper.learn_guess("coffee pods", [0.1] * 1536, "blue bin", "llm")
+
+    mock_enqueue.assert_not_called()
+
+
+def make_async_driver(result):
+    """Build a mock async driver whose session.run returns `result`."""
+    from unittest.mock import AsyncMock
+
+    session = MagicMock()
+    session.run = AsyncMock(return_value=result)
+    async_driver = MagicMock()
+    async_driver.session.return_value.__aenter__ = AsyncMock(return_value=session)
+    async_driver.session.return_value.__aexit__ = AsyncMock(return_value=None)
+    return async_driver, session
+
+
+@pytest.mark.unit
+async def test_aretrieve_bin_for_object_uses_async_driver():
+    """Test that the async lookup goes through the shared async driver."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import aretrieve_bin_for_object, BIN_FOR_OBJECT_QUERY
+
+    result = MagicMock()
+    result.single = AsyncMock(return_value={"bin_type": "blue bin"})
+    async_driver, session = make_async_driver(result)
+
+    with patch('langchain_helper.get_async_driver', return_value=async_driver):
+        assert await aretrieve_bin_for_object("glass jar") == "blue bin"
+        result.single = AsyncMock(return_value=None)
+        assert await aretrieve_bin_for_object("unknown") == "None"
+
+    assert session.run.call_args[0][0] == BIN_FOR_OBJECT_QUERY
+
+
+@pytest.mark.unit
+async def test_aretrieve_bin_for_object_without_async_driver():
+    """Test that the async lookup falls back to the sync one off the event loop."""
+    from langchain_helper import aretrieve_bin_for_object
+
+    with patch('langchain_helper.get_async_driver', return_value=None), \
+         patch('langchain_helper.retrieve_bin_for_object', return_value="green bin") as mock_retrieve:
+        assert await aretrieve_bin_for_object("banana peel") == "green bin"
+
+    mock_retrieve.assert_called_once_with("banana peel")
+
+
+@pytest.mark.unit
+async def test_aretrieve_bins_for_objects_uses_async_driver():
+    """Test that the async batched lookup is a single UNWIND query."""
+    from langchain_helper import aretrieve_bins_for_objects
+
+    class Records:
+        def __aiter__(self):
+            self._iter = iter([{"object_name": "item1", "bin_type": "blue bin"}])
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._iter)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    async_driver, session = make_async_driver(Records())
+
+    with patch('langchain_helper.get_async_driver', return_value=async_driver):
+        bins = await aretrieve_bins_for_objects(["item1", "item2"])
+
+    assert bins == {"item1": "blue bin", "item2": "None"}
+    session.run.assert_awaited_once()
+
+
+@pytest.mark.unit
+async def test_agenerate_embedding_for_query_caches():
+    """Test that the async embedding call shares the embedding cache."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_embedding_for_query, generate_embedding_for_query
+
+    mock_response = MagicMock()
+    mock_response.data = [MagicMock(embedding=[0.2] * 1536)]
+
+    with patch('langchain_helper.async_client') as mock_async_client, \
+         patch('langchain_helper.openai.embeddings.create') as mock_sync_create:
+        mock_async_client.embeddings.create = AsyncMock(return_value=mock_response)
+
+        first = await agenerate_embedding_for_query("Glass Jar")
+        second = await agenerate_embedding_for_query("glass jar")
+        third = generate_embedding_for_query("glass jar")
+
+    assert first == second == third
+    mock_async_client.embeddings.create.assert_awaited_once()
+    assert mock_async_client.embeddings.create.call_args[1]['input'] == "glass jar"
+    mock_sync_create.assert_not_called()
+
+
+@pytest.mark.unit
+@patch('langchain_helper.aretrieve_bins_for_objects')
+@patch('langchain_helper.search_batcher.asearch')
+async def test_agenerate_guess_uses_given_embedding(mock_search, mock_retrieve):
+    """Test that the async guess reuses a precomputed embedding and the async LLM client."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_guess
+
+    mock_search.return_value = [[("item1", None, 1.0), ("item2", "garbage bin", 1.0)]]
+    mock_retrieve.side_effect = AsyncMock(return_value={"item1": "blue bin"})
+    mock_completion = MagicMock()
+    mock_completion.choices = [MagicMock(message=MagicMock(content="blue bin"))]
+
+    with patch('langchain_helper.async_client') as mock_async_client, \
+         patch('langchain_helper.agenerate_embedding_for_query') as mock_embed:
+        mock_async_client.chat.completions.create = AsyncMock(return_value=mock_completion)
+
+        result = await agenerate_guess("mystery", [0.3] * 1536)
+
+    assert result == "blue bin"
+    mock_embed.assert_not_called()
+    mock_retrieve.assert_called_once_with(["item1"])
+    messages = mock_async_client.chat.completions.create.call_args[1]['messages']
+    assert "item1 goes into blue bin" in messages[1]['content']
+
+
+@pytest.mark.unit
+@patch('langchain_helper.search_batcher.asearch')
+async def test_agenerate_guess_knn_vote(mock_search):
+    """Test that the async guess also skips the LLM when neighbours agree."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_guess
+
+    mock_search.return_value = [[(f"item{i}", "green bin", 0.05) for i in range(5)]]
+
+    with patch('langchain_helper.async_client') as mock_async_client, \
+         patch('langchain_helper.agenerate_embedding_for_query',
+               new_callable=lambda: AsyncMock(return_value=[0.4] * 1536)):
+        mock_async_client.chat.completions.create = AsyncMock()
+        result = await agenerate_guess("apple core")
+
+    assert result == "green bin"
+    mock_async_client.chat.completions.create.assert_not_called()
+
+
+def embedding_response(count):
+    """Build a list-input embeddings response, deliberately out of order."""
+    data = [MagicMock(index=i, embedding=[float(i + 1)] + [0.0] * 1535) for i in range(count)]
+    return MagicMock(data=list(reversed(data)))
+
+
+@pytest.mark.unit
+async def test_agenerate_embeddings_for_queries_single_call():
+    """Test that cache misses are embedded in one list-input API call."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_embeddings_for_queries, embedding_cache, EMBEDDING_MODEL
+
+    embedding_cache.put("cached item", EMBEDDING_MODEL, [9.0] * 1536)
+
+    with patch('langchain_helper.async_client') as mock_async_client:
+        mock_async_client.embeddings.create = AsyncMock(return_value=embedding_response(2))
+        embeddings = await agenerate_embeddings_for_queries(["Item A", "cached item", "item b"])
+
+    mock_async_client.embeddings.create.assert_awaited_once()
+    assert mock_async_client.embeddings.create.call_args[1]['input'] == ["item a", "item b"]
+    assert [embedding[0] for embedding in embeddings] == [1.0, 9.0, 2.0]
+
+
+@pytest.mark.unit
+@patch('langchain_helper.search_batcher.asearch')
+async def test_agenerate_guesses_single_structured_llm_call(mock_search):
+    """Test that undecided items share one JSON-mode LLM call and missing answers become errors."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_guesses
+
+    mock_search.return_value = [
+        [(f"n{i}", "green bin", 0.05) for i in range(5)],   # neighbours agree
+        [("n1", "blue bin", 1.0), ("n2", "garbage bin", 1.0)],
+        [("n3", "blue bin", 1.0)],
+    ]
+    mock_completion = MagicMock()
+    mock_completion.choices = [MagicMock(message=MagicMock(content='{"cup": "garbage bin"}'))]
+
+    with patch('langchain_helper.async_client') as mock_async_client:
+        mock_async_client.embeddings.create = AsyncMock(return_value=embedding_response(3))
+        mock_async_client.chat.completions.create = AsyncMock(return_value=mock_completion)
+
+        guesses, errors = await agenerate_guesses(["apple", "cup", "widget"])
+
+    assert guesses == {"apple": "green bin", "cup": "garbage bin"}
+    assert errors == {"widget": "No guess returned for this item"}
+    mock_search.assert_called_once()
+    call_kwargs = mock_async_client.chat.completions.create.call_args[1]
+    assert call_kwargs['response_format'] == {"type": "json_object"}
+    assert "Item: cup" in call_kwargs['messages'][1]['content']
+    assert "Item: widget" in call_kwargs['messages'][1]['content']
+    assert "Item: apple" not in call_kwargs['messages'][1]['content']
+
+
+@pytest.mark.unit
+async def test_agenerate_guesses_embedding_failure_reports_every_item():
+    """Test that a failed embeddings call becomes a per-item error."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_guesses
+
+    with patch('langchain_helper.async_client') as mock_async_client:
+        mock_async_client.embeddings.create = AsyncMock(side_effect=Exception("rate limited"))
+        guesses, errors = await agenerate_guesses(["a", "b"])
+
+    assert guesses == {}
+    assert set(errors) == {"a", "b"}
+    assert "rate limited" in errors["a"]
+    assert await agenerate_guesses([]) == ({}, {})
+
+
+@pytest.mark.unit
+@patch('langchain_helper.search_batcher.asearch')
+async def test_agenerate_guesses_search_failure_reports_pending_items(mock_search):
+    """Test that a failed neighbour search becomes a per-item error instead of raising."""
+    from unittest.mock import AsyncMock
+    from langchain_helper import agenerate_guesses
+
+    mock_search.side_effect = RuntimeError("index unavailable")
+
+    with patch('langchain_helper.async_client') as mock_async_client, \
+         patch('langchain_helper.semantic_cache.lookup', return_value=None):
+        mock_async_client.embeddings.create = AsyncMock(return_value=embedding_response(2))
+        guesses, errors = await agenerate_guesses(["a", "b"])
+
+    assert guesses == {}
+    assert set(errors) == {"a", "b"}
+    assert "index unavailable" in errors["b"]
+
+
+@pytest.mark.unit
+def test_seed_bin_table_from_snapshot(monkeypatch):
+    """Test that the bin table can be filled from the snapshot without Neo4j."""
+    import langchain_helper
+    from snapshot import Snapshot
+    from bin_lookup import BinLookupTable
+
+    table = BinLookupTable(MagicMock())
+    monkeypatch.setattr(langchain_helper, "bin_table", table)
+    monkeypatch.setattr(langchain_helper.index_holder, "_snapshot", Snapshot(
+        "000001", {}, None, None, ["Glass Jars", "banana peel", "deleted item"],
+        ["blue bin", "green bin", "None"], ["glass jar", "banana peel", "deleted item"]))
+
+    assert langchain_helper.seed_bin_table_from_snapshot() is True
+    assert table.match("glass jar")[0] == "blue bin"
+    assert table.get("banana peel") == "green bin"
+    assert table.get("deleted item") is None
+    table.driver.session.assert_not_called()
+
+    monkeypatch.setattr(langchain_helper.index_holder, "_snapshot", Snapshot(None, {}, None, None, [], None, None))
+    assert langchain_helper.seed_bin_table_from_snapshot() is False
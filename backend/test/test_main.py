@@ -5,6 +5,7 @@ import pytest
 from unittest.mock import Mock, MagicMock, patch, AsyncMock
 from fastapi import UploadFile, HTTPException
 from fastapi.testclient import TestClient
+import hashlib
 import os
 import sys
 
@@ -16,9 +17,13 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 def test_client():
     """Create a test client for FastAPI app."""
     # Mock dependencies before importing main
+    from image_cache import ImageResultCache, NearDuplicateIndex
+
     with patch('main.s3_client') as mock_s3, \
-         patch('main.openai') as mock_openai, \
-         patch('model.garbage_model.classify_object') as mock_classify:
+         patch('main.async_client') as mock_openai, \
+         patch('main.classify_object', new_callable=AsyncMock) as mock_classify, \
+         patch('main.image_cache', ImageResultCache()), \
+         patch('main.near_duplicates', NearDuplicateIndex()):
         
         # Configure mock classify_object
         mock_classify.return_value = {"object_name": "plastic bottle", "bin_type": "recyclable"}
@@ -26,12 +31,15 @@ def test_client():
         # Configure mock OpenAI
         mock_completion = MagicMock()
         mock_completion.choices = [MagicMock(message=MagicMock(content="plastic bottle"))]
-        mock_openai.chat.completions.create.return_value = mock_completion
-        
-        from main import app
-        client = TestClient(app)
+        mock_openai.chat.completions.create = AsyncMock(return_value=mock_completion)
         
-        yield client, mock_s3, mock_openai, mock_classify
+        import main
+        from upload_queue import UploadQueue
+
+        with patch.object(main, 'upload_queue', UploadQueue(main.archive_to_r2)):
+            client = TestClient(main.app)
+
+            yield client, mock_s3, mock_openai, mock_classify
 
 
 @pytest.mark.unit
@@ -57,35 +65,52 @@ def test_upload_endpoint_success(test_client, tmp_path):
     assert result["bin_type"] == "recyclable"
     
     # Verify mocks were called
-    mock_s3.upload_file.assert_called_once()
+    mock_s3.upload_fileobj.assert_called_once()
     mock_openai.chat.completions.create.assert_called_once()
     mock_classify.assert_called_once_with("plastic bottle")
 
 
 @pytest.mark.unit
-def test_upload_endpoint_creates_images_directory(test_client, tmp_path, monkeypatch):
-    """Test that images directory is created if it doesn't exist."""
+def test_upload_endpoint_stages_nothing_on_disk(test_client, tmp_path, monkeypatch):
+    """Test that an upload below the spill threshold never touches the local disk."""
     client, mock_s3, mock_openai, mock_classify = test_client
     
     # Change to temp directory
     monkeypatch.chdir(tmp_path)
     
-    # Ensure images directory doesn't exist
-    images_dir = tmp_path / "images"
-    if images_dir.exists():
-        images_dir.rmdir()
-    
-    # Create a test file
-    test_file_path = tmp_path / "test.jpg"
-    test_file_path.write_bytes(b"test data")
-    
-    with open(test_file_path, "rb") as f:
-        files = {"file": ("test.jpg", f, "image/jpeg")}
+    # A multi-megabyte photo, which Starlette's form parser would have spooled to disk
+    with patch('upload_stream.tempfile.NamedTemporaryFile') as mock_spill, \
+         patch('starlette.formparsers.SpooledTemporaryFile') as mock_form_spool:
+        files = {"file": ("test.jpg", b"x" * (3 * 1024 * 1024), "image/jpeg")}
         response = client.post("/upload/", files=files)
     
-    # Directory should be created
-    assert images_dir.exists()
     assert response.status_code == 200
+    assert not (tmp_path / "images").exists()
+    mock_spill.assert_not_called()
+    mock_form_spool.assert_not_called()
+
+
+@pytest.mark.unit
+def test_upload_endpoint_requires_file_field(test_client):
+    """Test that a form without the file gets 422."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    response = client.post("/upload/", data={"other": "value"}, files={"picture": ("a.jpg", b"x", "image/jpeg")})
+
+    assert response.status_code == 422
+    mock_openai.chat.completions.create.assert_not_called()
+
+
+@pytest.mark.unit
+def test_upload_endpoint_accepts_raw_image_body(test_client):
+    """Test that an image/* body is taken as the image itself."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    response = client.post("/upload/", content=b"raw image bytes",
+                           headers={"Content-Type": "image/jpeg", "X-Filename": "raw.jpg"})
+
+    assert response.status_code == 200
+    assert mock_s3.upload_fileobj.call_args[0][0].getvalue() == b"raw image bytes"
 
 
 @pytest.mark.unit
@@ -123,10 +148,10 @@ def test_upload_endpoint_s3_upload(test_client, tmp_path):
     
     # Verify S3 upload was called with correct parameters
     assert response.status_code == 200
-    mock_s3.upload_file.assert_called_once()
-    call_args = mock_s3.upload_file.call_args
-    assert "upload_test.jpg" in call_args[0][0]  # file path
-    assert call_args[0][2] == "upload_test.jpg"  # filename
+    mock_s3.upload_fileobj.assert_called_once()
+    call_args = mock_s3.upload_fileobj.call_args
+    assert call_args[0][0].getvalue() == b"test data"  # file contents
+    assert call_args[0][2] == hashlib.sha256(b"test data").hexdigest() + ".jpg"  # content-addressed key
 
 
 @pytest.mark.unit
@@ -137,7 +162,7 @@ def test_upload_endpoint_constructs_correct_image_url(test_client, tmp_path):
     test_file_path = tmp_path / "url_test.jpg"
     test_file_path.write_bytes(b"test")
     
-    with open(test_file_path, "rb") as f:
+    with open(test_file_path, "rb") as f, patch('main.VISION_IMAGE_MODE', "url"):
         files = {"file": ("url_test.jpg", f, "image/jpeg")}
         response = client.post("/upload/", files=files)
     
@@ -149,27 +174,50 @@ def test_upload_endpoint_constructs_correct_image_url(test_client, tmp_path):
     
     # Find the image URL in the content
     image_url_item = next(item for item in content if item["type"] == "image_url")
-    assert "url_test.jpg" in image_url_item["image_url"]["url"]
+    key = hashlib.sha256(b"test").hexdigest() + ".jpg"
+    assert image_url_item["image_url"]["url"].endswith(f"/image-pipeline/{key}")
 
 
 @pytest.mark.unit
-def test_upload_endpoint_file_saved_locally(test_client, tmp_path, monkeypatch):
-    """Test that uploaded file is saved locally."""
+def test_upload_endpoint_spills_large_upload_and_cleans_up(test_client, tmp_path):
+    """Test that an upload past the spill threshold goes through a temporary file that is removed."""
+    import tempfile
+    from PIL import Image
+
     client, mock_s3, mock_openai, mock_classify = test_client
-    
-    monkeypatch.chdir(tmp_path)
-    
-    test_file_path = tmp_path / "local_save.jpg"
-    test_file_path.write_bytes(b"local test data")
-    
-    with open(test_file_path, "rb") as f:
-        files = {"file": ("local_save.jpg", f, "image/jpeg")}
-        response = client.post("/upload/", files=files)
-    
-    # Check file was saved
-    saved_file = tmp_path / "images" / "local_save.jpg"
-    assert saved_file.exists()
+
+    Image.new("RGB", (800, 600), (120, 60, 10)).save(tmp_path / "large.png")
+    spills = []
+    original = tempfile.NamedTemporaryFile
+
+    def spill(**kwargs):
+        spill_file = original(dir=tmp_path, **kwargs)
+        spills.append(spill_file.name)
+        return spill_file
+
+    with patch('main.UPLOAD_SPILL_BYTES', 100), \
+         patch('upload_stream.tempfile.NamedTemporaryFile', side_effect=spill):
+        with open(tmp_path / "large.png", "rb") as f:
+            response = client.post("/upload/", files={"file": ("large.png", f, "image/png")})
+
     assert response.status_code == 200
+    assert len(spills) == 1
+    assert not os.path.exists(spills[0])
+    key = hashlib.sha256((tmp_path / "large.png").read_bytes()).hexdigest() + ".jpg"
+    assert mock_s3.upload_fileobj.call_args[0][2] == key
+
+
+@pytest.mark.unit
+def test_upload_endpoint_rejects_oversized_upload(test_client):
+    """Test that uploads above the maximum size get 413 and reach neither R2 nor the vision model."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    with patch('main.UPLOAD_MAX_BYTES', 1000):
+        response = client.post("/upload/", files={"file": ("huge.jpg", b"x" * 1001, "image/jpeg")})
+
+    assert response.status_code == 413
+    mock_s3.upload_fileobj.assert_not_called()
+    mock_openai.chat.completions.create.assert_not_called()
 
 
 @pytest.mark.unit
@@ -268,3 +316,243 @@ def test_upload_endpoint_returns_classification_result(test_client, tmp_path):
     result = response.json()
     assert result["object_name"] == "banana peel"
     assert result["bin_type"] == "compostable"
+
+
+@pytest.mark.unit
+def test_stats_endpoint_reports_embedding_cache(test_client):
+    """Test that cache hit and miss counters are exposed."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    response = client.get("/stats/")
+
+    assert response.status_code == 200
+    stats = response.json()["embedding_cache"]
+    assert {"memory_hits", "disk_hits", "misses", "hit_rate"} <= set(stats)
+
+
+@pytest.mark.unit
+def test_admin_reload_index(test_client):
+    """Test that the admin endpoint swaps the index and reports the live snapshot."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    with patch('main.index_holder') as mock_holder, patch('main.ADMIN_TOKEN', 'secret'), \
+         patch('main.current_version', return_value="000002"), patch('main.publish_version') as mock_publish:
+        mock_holder.reload.return_value = True
+        mock_holder.stats.return_value = {"version": "000002", "items": 3}
+
+        assert client.post("/admin/reload-index").status_code == 403
+        response = client.post("/admin/reload-index", headers={"X-Admin-Token": "secret"})
+
+        assert response.status_code == 200
+        assert response.json() == {"published": "000002", "reloaded": True, "version": "000002", "items": 3}
+        mock_holder.reload.assert_called_once_with()
+        mock_publish.assert_not_called()
+
+        mock_holder.reload.side_effect = ValueError("wrong embedding model")
+        response = client.post("/admin/reload-index", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 409
+        mock_publish.assert_not_called()
+
+
+@pytest.mark.unit
+def test_admin_rollback_repoints_current(tmp_path, test_client):
+    """Test that a rollback publishes the version through CURRENT, and a rejected one is put back."""
+    import numpy as np
+    import faiss
+    from index_holder import SnapshotHolder
+    from snapshot import current_version, load_snapshot, write_snapshot
+
+    client, mock_s3, mock_openai, mock_classify = test_client
+    for names in (["a"], ["a", "b"]):
+        vectors = np.random.rand(len(names), 4).astype('float32')
+        index = faiss.IndexFlatL2(4)
+        index.add(vectors)
+        write_snapshot(index, [vectors], names, ["blue bin"] * len(names), "test-model", directory=str(tmp_path))
+    holder = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, directory=str(tmp_path))
+    other_worker = SnapshotHolder(load_snapshot(str(tmp_path)), load_snapshot, directory=str(tmp_path))
+
+    with patch('main.index_holder', holder), patch('main.ADMIN_TOKEN', 'secret'):
+        response = client.post("/admin/reload-index?version=000001", headers={"X-Admin-Token": "secret"})
+
+        assert response.status_code == 200
+        assert response.json()["published"] == "000001"
+        assert holder.version == "000001"
+        assert current_version(str(tmp_path)) == "000001"
+        assert other_worker.reload_if_stale() is True
+        assert other_worker.version == "000001"
+
+        assert client.post("/admin/reload-index?version=000009",
+                           headers={"X-Admin-Token": "secret"}).status_code == 404
+
+        def reject(snapshot):
+            raise ValueError("rejected")
+
+        holder._validate = reject
+        response = client.post("/admin/reload-index?version=000002", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 409
+        assert current_version(str(tmp_path)) == "000001"
+        assert holder.version == "000001"
+
+
+@pytest.mark.unit
+def test_admin_reload_index_locked_down(test_client):
+    """Test that the endpoint is off without a token and refuses versions that are not numbers."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    with patch('main.index_holder') as mock_holder:
+        with patch('main.ADMIN_TOKEN', None):
+            assert client.post("/admin/reload-index", headers={"X-Admin-Token": ""}).status_code == 404
+        with patch('main.ADMIN_TOKEN', 'secret'):
+            assert client.post("/admin/reload-index", headers={"X-Admin-Token": "wrong"}).status_code == 403
+            response = client.post("/admin/reload-index", params={"version": "../../etc"},
+                                   headers={"X-Admin-Token": "secret"})
+            assert response.status_code == 422
+
+    mock_holder.reload.assert_not_called()
+
+
+@pytest.mark.unit
+def test_upload_repeat_image_served_from_cache(test_client, tmp_path):
+    """Test that the same photo uploaded twice skips R2, the vision call and classification."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    test_file_path = tmp_path / "kiosk.jpg"
+    test_file_path.write_bytes(b"same photo" * 10000)
+
+    for filename in ("kiosk.jpg", "retry.jpg"):
+        with open(test_file_path, "rb") as f:
+            response = client.post("/upload/", files={"file": (filename, f, "image/jpeg")})
+        assert response.json() == {"object_name": "plastic bottle", "bin_type": "recyclable"}
+
+    mock_s3.upload_fileobj.assert_called_once()
+    mock_openai.chat.completions.create.assert_called_once()
+    mock_classify.assert_called_once()
+    assert client.get("/stats/").json()["image_cache"]["memory_hits"] == 1
+
+
+@pytest.mark.unit
+def test_upload_unknown_bin_not_cached(test_client, tmp_path):
+    """Test that an image that could not be classified is looked at again next time."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+    mock_classify.return_value = {"object_name": "blur", "bin_type": "None"}
+
+    test_file_path = tmp_path / "blur.jpg"
+    test_file_path.write_bytes(b"blurry photo")
+
+    for _ in range(2):
+        with open(test_file_path, "rb") as f:
+            client.post("/upload/", files={"file": ("blur.jpg", f, "image/jpeg")})
+
+    assert mock_classify.call_count == 2
+
+
+@pytest.mark.unit
+def test_upload_near_duplicate_reuses_vision_result(test_client, tmp_path):
+    """Test that a resized, re-encoded shot of the same item skips the vision call but is still archived."""
+    import numpy as np
+    from PIL import Image
+
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    x, y = np.meshgrid(np.linspace(0, 255, 640), np.linspace(0, 255, 480))
+    photo = Image.fromarray(((x + y) / 2).astype('uint8')).convert("RGB")
+    photo.save(tmp_path / "first.png")
+    photo.resize((320, 240)).save(tmp_path / "second.jpg", quality=70)
+
+    for filename in ("first.png", "second.jpg"):
+        with open(tmp_path / filename, "rb") as f:
+            response = client.post("/upload/", files={"file": (filename, f, "image/jpeg")})
+        assert response.json() == {"object_name": "plastic bottle", "bin_type": "recyclable"}
+
+    keys = [call[0][2] for call in mock_s3.upload_fileobj.call_args_list]
+    assert len(keys) == 2 and keys[0] != keys[1]
+    mock_openai.chat.completions.create.assert_called_once()
+    assert mock_classify.call_count == 2
+    mock_classify.assert_called_with("plastic bottle")
+    assert client.get("/stats/").json()["near_duplicates"]["hits"] == 1
+
+
+@pytest.mark.unit
+def test_upload_sends_downsized_jpeg_to_r2_and_vision(test_client, tmp_path):
+    """Test that a large PNG is re-encoded as a small JPEG and sent at the configured detail."""
+    from PIL import Image
+
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    Image.new("RGB", (3000, 2000), (10, 120, 10)).save(tmp_path / "big.png")
+    with open(tmp_path / "big.png", "rb") as f:
+        response = client.post("/upload/", files={"file": ("big.png", f, "image/png")})
+
+    assert response.status_code == 200
+    uploaded_file, _, key = mock_s3.upload_fileobj.call_args[0]
+    assert key == hashlib.sha256((tmp_path / "big.png").read_bytes()).hexdigest() + ".jpg"
+    with Image.open(uploaded_file) as uploaded:
+        assert uploaded.format == "JPEG"
+        assert max(uploaded.size) <= 1024
+
+    content = mock_openai.chat.completions.create.call_args[1]["messages"][0]["content"]
+    image_url = next(item for item in content if item["type"] == "image_url")["image_url"]
+    assert image_url["url"].startswith("data:image/jpeg;base64,")
+    assert image_url["detail"] == "low"
+
+
+@pytest.mark.unit
+def test_upload_inline_image_does_not_wait_for_r2(test_client, tmp_path):
+    """Test that the vision model gets the bytes inline and a failing R2 upload stays queued."""
+    import base64
+
+    client, mock_s3, mock_openai, mock_classify = test_client
+    mock_s3.upload_fileobj.side_effect = ConnectionError("R2 unreachable")
+
+    test_file_path = tmp_path / "inline.jpg"
+    test_file_path.write_bytes(b"inline image bytes")
+    with open(test_file_path, "rb") as f:
+        response = client.post("/upload/", files={"file": ("inline.jpg", f, "image/jpeg")})
+
+    assert response.status_code == 200
+    content = mock_openai.chat.completions.create.call_args[1]["messages"][0]["content"]
+    url = next(item for item in content if item["type"] == "image_url")["image_url"]["url"]
+    assert url == "data:image/jpeg;base64," + base64.b64encode(b"inline image bytes").decode()
+    uploads = client.get("/stats/").json()["uploads"]
+    assert uploads["pending"] == 1
+    assert uploads["retried"] == 1
+
+
+@pytest.mark.unit
+def test_upload_same_filename_different_images_get_different_keys(test_client):
+    """Test that two users uploading "photo.jpg" do not overwrite each other's object in R2."""
+    client, mock_s3, mock_openai, mock_classify = test_client
+
+    with patch('main.VISION_IMAGE_MODE', "url"):
+        for data in (b"first user's photo", b"second user's photo"):
+            client.post("/upload/", files={"file": ("photo.jpg", data, "image/jpeg")})
+
+    keys = [call[0][2] for call in mock_s3.upload_fileobj.call_args_list]
+    urls = [call[1]["messages"][0]["content"][1]["image_url"]["url"]
+            for call in mock_openai.chat.completions.create.call_args_list]
+    assert len(set(keys)) == 2
+    assert all(url.endswith(key) for url, key in zip(urls, keys))
+
+
+@pytest.mark.unit
+def test_upload_keeps_event_loop_free_during_vision_call(test_client):
+    """Test that the vision call is awaited and R2 work runs off the event loop thread."""
+    import threading
+
+    client, mock_s3, mock_openai, mock_classify = test_client
+    loop_threads, upload_threads = [], []
+    mock_s3.upload_fileobj.side_effect = lambda *args: upload_threads.append(threading.current_thread())
+
+    async def classify(result):
+        loop_threads.append(threading.current_thread())
+        return {"object_name": result, "bin_type": "recyclable"}
+
+    mock_classify.side_effect = classify
+
+    for mode in ("url", "inline"):
+        with patch('main.VISION_IMAGE_MODE', mode):
+            client.post("/upload/", files={"file": (f"{mode}.jpg", mode.encode(), "image/jpeg")})
+
+    assert mock_openai.chat.completions.create.await_count == 2
+    assert len(upload_threads) == len(loop_threads) == 2
+    assert all(upload is not loop for upload, loop in zip(upload_threads, loop_threads))
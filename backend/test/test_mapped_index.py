@@ -0,0 +1,106 @@
+"""
+Unit tests for mapped_index.py.
+"""
+import pytest
+import numpy as np
+import faiss
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def mapped_vectors(tmp_path):
+    vectors = np.random.rand(50, 16).astype('float32')
+    np.save(tmp_path / "vectors.npy", vectors)
+    return vectors, np.load(tmp_path / "vectors.npy", mmap_mode='r')
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("metric, flat_index", [
+    (faiss.METRIC_L2, faiss.IndexFlatL2),
+    (faiss.METRIC_INNER_PRODUCT, faiss.IndexFlatIP),
+])
+def test_search_matches_faiss_flat_index(mapped_vectors, metric, flat_index):
+    """Test that searching the mapped vectors gives the same neighbours as a FAISS flat index."""
+    from mapped_index import MappedFlatIndex
+
+    vectors, mapped = mapped_vectors
+    reference = flat_index(16)
+    reference.add(vectors)
+    queries = np.random.rand(4, 16).astype('float32')
+
+    distances, indices = MappedFlatIndex(mapped, metric).search(queries, 5)
+    expected_distances, expected_indices = reference.search(queries, 5)
+
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+
+@pytest.mark.unit
+def test_added_vectors_are_searched_with_mapped_rows(mapped_vectors):
+    """Test that runtime additions get ids after the mapped rows and merge into results."""
+    from mapped_index import MappedFlatIndex
+
+    vectors, mapped = mapped_vectors
+    index = MappedFlatIndex(mapped)
+    learned = np.full((1, 16), 5.0, dtype='float32')
+
+    index.add(learned)
+    distances, indices = index.search(np.vstack([learned, vectors[3:4]]), 3)
+
+    assert index.ntotal == 51
+    assert indices[0][0] == 50
+    assert distances[0][0] == pytest.approx(0.0)
+    assert indices[1][0] == 3
+    assert list(distances[1]) == sorted(distances[1])
+
+
+@pytest.mark.unit
+def test_mapped_index_with_fewer_rows_than_k(tmp_path):
+    """Test that missing neighbours come back as -1 like a FAISS index."""
+    from mapped_index import MappedFlatIndex
+
+    index = MappedFlatIndex(np.empty((0, 4), dtype='float32'))
+    index.add(np.eye(4, dtype='float32')[:2])
+
+    distances, indices = index.search(np.eye(4, dtype='float32')[:1], 3)
+
+    assert list(indices[0]) == [0, 1, -1]
+
+
+@pytest.mark.unit
+def test_mapped_column(tmp_path):
+    """Test that a mapped string column reads like a list and appends privately."""
+    from mapped_index import MappedColumn
+
+    np.save(tmp_path / "names.npy", np.array(["glass jar", "banana peel"]))
+    column = MappedColumn(np.load(tmp_path / "names.npy", mmap_mode='r'))
+
+    column.append("learned item")
+
+    assert len(column) == 3
+    assert column[np.int64(1)] == "banana peel"
+    assert column[-1] == "learned item"
+    assert column == ["glass jar", "banana peel", "learned item"]
+    assert isinstance(column[0], str)
+    assert len(np.load(tmp_path / "names.npy")) == 2
+
+
+@pytest.mark.unit
+def test_mapped_index_returns_item_ids():
+    """Test that rows are reported by item id and learned vectors keep the ids they are given."""
+    from mapped_index import MappedFlatIndex
+
+    vectors = np.eye(3, dtype='float32')
+    index = MappedFlatIndex(vectors, ids=np.array([0, 4, 7]))
+
+    assert index.search(vectors[1:2], 1)[1].tolist() == [[4]]
+    index.add_with_ids(np.array([[0, 0, 2]], dtype='float32'), [9])
+    index.add(np.array([[0, 3, 0]], dtype='float32'))
+
+    assert index.ntotal == 5
+    assert index.search(np.array([[0, 0, 2]], dtype='float32'), 2)[1].tolist() == [[9, 7]]
+    assert index.search(np.array([[0, 3, 0]], dtype='float32'), 1)[1].tolist() == [[10]]
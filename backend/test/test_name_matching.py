@@ -0,0 +1,71 @@
+"""
+Unit tests for name_matching.py.
+"""
+import pytest
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("raw, expected", [
+    ("Plastic bottle.", "plastic bottle"),
+    ("  Banana   peels ", "banana peel"),
+    ("BATTERIES", "battery"),
+    ("cardboard boxes", "cardboard box"),
+    ("drinking glasses", "drinking glass"),
+    ("asbestos", "asbestos"),
+    ("café napkins", "cafe napkin"),
+    ("item_with-dashes", "item with dash"),
+    ("", ""),
+])
+def test_normalize_name(raw, expected):
+    """Test case, punctuation, whitespace, accent and plural folding."""
+    from name_matching import normalize_name
+
+    assert normalize_name(raw) == expected
+
+
+@pytest.mark.unit
+def test_normalize_name_none():
+    """Test that None normalizes to an empty string."""
+    from name_matching import normalize_name
+
+    assert normalize_name(None) == ""
+
+
+@pytest.mark.unit
+def test_trigram_index_exact_scores_one():
+    """Test that an identical name scores 1.0."""
+    from name_matching import TrigramIndex
+
+    index = TrigramIndex(["plastic bottle", "glass jar"])
+
+    assert len(index) == 2
+    assert index.best_match("glass jar") == ("glass jar", 1.0)
+
+
+@pytest.mark.unit
+def test_trigram_index_tolerates_typos():
+    """Test that a misspelled name still finds its closest item."""
+    from name_matching import TrigramIndex
+
+    index = TrigramIndex(["plastic bottle", "glass jar", "banana peel"])
+
+    name, score = index.best_match("plastik bottle")
+
+    assert name == "plastic bottle"
+    assert 0.6 < score < 1.0
+
+
+@pytest.mark.unit
+def test_trigram_index_threshold():
+    """Test that matches below the threshold are rejected."""
+    from name_matching import TrigramIndex
+
+    index = TrigramIndex(["plastic bottle"])
+
+    assert index.best_match("banana", threshold=0.5) is None
+    assert TrigramIndex().best_match("anything") is None
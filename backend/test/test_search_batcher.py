@@ -0,0 +1,130 @@
+"""
+Unit tests for search_batcher.py.
+"""
+import pytest
+import numpy as np
+import os
+import sys
+from collections import namedtuple
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FakeSnapshot = namedtuple("FakeSnapshot", ["index", "item_names", "item_bins"])
+
+
+class FakeSearch:
+    """Answer each query with its first component, and remember the batch sizes."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, queries, index, item_names, item_bins, top_k):
+        self.calls.append((index, len(queries), top_k))
+        return [[(f"{index}:{int(query[0])}", None, float(rank)) for rank in range(top_k)] for query in queries]
+
+
+@pytest.mark.unit
+def test_inline_search_without_dispatcher():
+    """Test that searches run on the caller's thread until the dispatcher is started."""
+    from search_batcher import SearchBatcher
+
+    search = FakeSearch()
+    batcher = SearchBatcher(search, add=None)
+
+    results = batcher.search(FakeSnapshot("a", None, None), [[1, 0], [2, 0]], top_k=2)
+
+    assert results == [[("a:1", None, 0.0), ("a:1", None, 1.0)],
+                       [("a:2", None, 0.0), ("a:2", None, 1.0)]]
+    assert search.calls == [("a", 2, 2)]
+
+
+@pytest.mark.unit
+def test_concurrent_queries_share_one_search():
+    """Test that queued queries are searched together and each caller gets its own rows."""
+    from search_batcher import SearchBatcher
+
+    search = FakeSearch()
+    batcher = SearchBatcher(search, add=None, max_wait_ms=200)
+    snapshot = FakeSnapshot("a", None, None)
+    batcher.start()
+    try:
+        futures = [batcher.submit(snapshot, [[i, 0]], top_k=1 + i % 3) for i in range(10)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.stop()
+
+    assert search.calls == [("a", 10, 3)]
+    for i, rows in enumerate(results):
+        assert len(rows) == 1
+        assert len(rows[0]) == 1 + i % 3
+        assert rows[0][0][0] == f"a:{i}"
+    assert batcher.stats()["largest_batch"] == 10
+
+
+@pytest.mark.unit
+def test_batches_are_split_by_snapshot_and_size():
+    """Test that requests on different snapshots never share a search and batches are capped."""
+    from search_batcher import SearchBatcher
+
+    search = FakeSearch()
+    batcher = SearchBatcher(search, add=None, max_batch_size=4, max_wait_ms=200)
+    old, new = FakeSnapshot("old", None, None), FakeSnapshot("new", None, None)
+    batcher.start()
+    try:
+        futures = [batcher.submit(old if i < 2 else new, [[i, 0]], top_k=1) for i in range(6)]
+        results = [future.result(timeout=5)[0][0][0] for future in futures]
+    finally:
+        batcher.stop()
+
+    assert results == ["old:0", "old:1", "new:2", "new:3", "new:4", "new:5"]
+    assert sorted(size for _, size, _ in search.calls) == [2, 2, 2]
+    assert [index for index, _, _ in search.calls].count("old") == 1
+
+
+@pytest.mark.unit
+def test_adds_are_applied_before_later_searches():
+    """Test that a learned vector is added on the dispatcher before searches queued after it."""
+    from search_batcher import SearchBatcher
+
+    events = []
+
+    def search(queries, index, item_names, item_bins, top_k):
+        events.append("search")
+        return [[] for _ in queries]
+
+    batcher = SearchBatcher(search, add=lambda index, vectors, ids: events.append(("add", ids)),
+                            max_wait_ms=200)
+    snapshot = FakeSnapshot("a", None, None)
+    batcher.start()
+    try:
+        first = batcher.submit(snapshot, [[0.0]])
+        batcher.add("a", [[1.0]], ids=[7])
+        second = batcher.submit(snapshot, [[0.0]])
+        first.result(timeout=5)
+        second.result(timeout=5)
+    finally:
+        batcher.stop()
+
+    assert events == ["search", ("add", [7]), "search"]
+
+
+@pytest.mark.unit
+async def test_asearch_and_errors():
+    """Test that async callers await their rows and search errors reach every caller in the batch."""
+    from search_batcher import SearchBatcher
+
+    batcher = SearchBatcher(FakeSearch(), add=None)
+    batcher.start()
+    try:
+        assert (await batcher.asearch(FakeSnapshot("a", None, None), [np.array([3.0, 0.0])], top_k=1)) == [
+            [("a:3", None, 0.0)]]
+
+        def broken(*args):
+            raise RuntimeError("index gone")
+
+        batcher._search = broken
+        with pytest.raises(RuntimeError):
+            await batcher.asearch(FakeSnapshot("a", None, None), [[1.0]])
+    finally:
+        batcher.stop()
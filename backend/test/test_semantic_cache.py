@@ -0,0 +1,91 @@
+"""
+Unit tests for semantic_cache.py.
+"""
+import pytest
+import numpy as np
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.unit
+def test_lookup_hits_nearby_query():
+    """Test that a close embedding returns the cached bin."""
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(max_distance=0.05)
+    cache.add(unit(1.0, 0.0, 0.0), "blue bin", "water bottle")
+
+    bin_type, name, distance = cache.lookup(unit(1.0, 0.1, 0.0))
+
+    assert bin_type == "blue bin"
+    assert name == "water bottle"
+    assert distance < 0.05
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.unit
+def test_lookup_misses_distant_query():
+    """Test that embeddings outside the threshold are misses."""
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(max_distance=0.05)
+    assert cache.lookup(unit(1.0, 0.0)) is None
+
+    cache.add(unit(1.0, 0.0), "blue bin")
+
+    assert cache.lookup(unit(0.0, 1.0)) is None
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.mark.unit
+def test_eviction_is_least_recently_used():
+    """Test that the cache stays bounded and evicts the stalest entry."""
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(max_entries=2, max_distance=0.01)
+    cache.add(unit(1.0, 0.0, 0.0), "blue bin")
+    cache.add(unit(0.0, 1.0, 0.0), "green bin")
+    cache.lookup(unit(1.0, 0.0, 0.0))
+    cache.add(unit(0.0, 0.0, 1.0), "garbage bin")
+
+    assert len(cache) == 2
+    assert cache.lookup(unit(0.0, 1.0, 0.0)) is None
+    assert cache.lookup(unit(1.0, 0.0, 0.0))[0] == "blue bin"
+    assert cache.lookup(unit(0.0, 0.0, 1.0))[0] == "garbage bin"
+
+
+@pytest.mark.unit
+def test_version_change_invalidates():
+    """Test that a new dataset version drops cached guesses."""
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache()
+    cache.add(unit(1.0, 0.0), "blue bin", version=1)
+
+    assert cache.lookup(unit(1.0, 0.0), version=1)[0] == "blue bin"
+    assert cache.lookup(unit(1.0, 0.0), version=2) is None
+    assert cache.stats()["version"] == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.unit
+def test_clear():
+    """Test that clear empties the cache and resets counters."""
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache()
+    cache.add(unit(1.0, 0.0), "blue bin")
+    cache.lookup(unit(1.0, 0.0))
+
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == 0
@@ -0,0 +1,204 @@
+"""
+Unit tests for snapshot.py.
+"""
+import pytest
+import numpy as np
+import faiss
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_bundle(count=6, dimension=8):
+    vectors = np.random.rand(count, dimension).astype('float32')
+    index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    names = [f"Item {i}s" for i in range(count)]
+    bins = ["blue bin" if i % 2 else "green bin" for i in range(count)]
+    return index, vectors, names, bins
+
+
+@pytest.mark.unit
+def test_write_and_load_round_trip(tmp_path):
+    """Test that a snapshot reloads with every row aligned and the metadata recorded."""
+    from name_matching import normalize_name
+    from snapshot import write_snapshot, load_snapshot
+
+    index, vectors, names, bins = make_bundle()
+
+    # Vectors may arrive in chunks, e.g. one per vector store shard
+    version = write_snapshot(index, [vectors[:4], vectors[4:]], names, bins, "test-model",
+                             dataset_version=3, directory=str(tmp_path))
+    snapshot = load_snapshot(str(tmp_path))
+
+    assert snapshot.version == version == "000001"
+    assert snapshot.item_names == names
+    assert snapshot.item_bins == bins
+    assert snapshot.normalized_names == [normalize_name(name) for name in names]
+    assert snapshot.index.ntotal == len(names)
+    np.testing.assert_array_equal(snapshot.vectors, vectors)
+    assert snapshot.manifest["embedding_model"] == "test-model"
+    assert snapshot.manifest["dimension"] == 8
+    assert snapshot.manifest["dataset_version"] == 3
+
+
+@pytest.mark.unit
+def test_current_advances_and_old_versions_are_pruned(tmp_path):
+    """Test that each write publishes a new version and only the newest few are kept."""
+    from snapshot import write_snapshot, current_version, list_versions
+
+    index, vectors, names, bins = make_bundle()
+    for _ in range(4):
+        write_snapshot(index, [vectors], names, bins, "test-model", directory=str(tmp_path), keep=2)
+
+    assert current_version(str(tmp_path)) == "000004"
+    assert list_versions(str(tmp_path)) == ["000003", "000004"]
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".staging")]
+
+
+@pytest.mark.unit
+def test_load_snapshot_without_bundle_returns_none(tmp_path):
+    """Test that a missing snapshot directory is not an error."""
+    from snapshot import load_snapshot
+
+    assert load_snapshot(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.unit
+def test_corrupt_file_is_rejected(tmp_path):
+    """Test that a file that no longer matches its checksum fails to load."""
+    from snapshot import write_snapshot, load_snapshot
+
+    index, vectors, names, bins = make_bundle()
+    version = write_snapshot(index, [vectors], names, bins, "test-model", directory=str(tmp_path))
+    np.save(tmp_path / version / "bins.npy", np.array(["garbage bin"] * len(names)))
+
+    with pytest.raises(ValueError, match="bins.npy"):
+        load_snapshot(str(tmp_path))
+    assert load_snapshot(str(tmp_path), verify=False).item_bins == ["garbage bin"] * len(names)
+
+
+@pytest.mark.unit
+def test_misaligned_rows_are_not_written(tmp_path):
+    """Test that names, bins and index rows must line up before anything is published."""
+    from snapshot import write_snapshot, current_version
+
+    index, vectors, names, bins = make_bundle()
+    directory = str(tmp_path / "snapshots")
+
+    with pytest.raises(ValueError):
+        write_snapshot(index, [vectors], names, bins[:-1], "test-model", directory=directory)
+    with pytest.raises(ValueError):
+        write_snapshot(index, [vectors[:3]], names, bins, "test-model", directory=directory)
+
+    assert current_version(directory) is None
+    assert os.listdir(directory) == []
+
+
+@pytest.mark.unit
+def test_mmap_load_searches_mapped_vectors(tmp_path):
+    """Test that a flat snapshot loads without reading index.faiss and searches the same."""
+    from mapped_index import MappedColumn, MappedFlatIndex
+    from snapshot import write_snapshot, load_snapshot
+
+    index, vectors, names, bins = make_bundle()
+    write_snapshot(index, [vectors], names, bins, "test-model", directory=str(tmp_path))
+
+    snapshot = load_snapshot(str(tmp_path), mmap=True)
+
+    assert isinstance(snapshot.index, MappedFlatIndex)
+    assert isinstance(snapshot.item_names, MappedColumn)
+    assert isinstance(snapshot.vectors, np.memmap)
+    np.testing.assert_array_equal(snapshot.index.search(vectors[2:3], 3)[1], index.search(vectors[2:3], 3)[1])
+
+    private = load_snapshot(str(tmp_path), mmap=False)
+    assert isinstance(private.index, faiss.IndexFlatL2)
+    assert private.item_names == names
+
+
+@pytest.mark.unit
+def test_checksums_are_verified_once(tmp_path):
+    """Test that later loads of a verified bundle do not hash every file again."""
+    from unittest.mock import patch
+    import snapshot
+    from snapshot import write_snapshot, load_snapshot
+
+    index, vectors, names, bins = make_bundle()
+    write_snapshot(index, [vectors], names, bins, "test-model", directory=str(tmp_path))
+
+    load_snapshot(str(tmp_path))
+    with patch.object(snapshot, "_sha256", wraps=snapshot._sha256) as mock_sha256:
+        load_snapshot(str(tmp_path))
+
+    mock_sha256.assert_not_called()
+
+
+@pytest.mark.unit
+def test_index_spec_and_metric_round_trip(tmp_path):
+    """Test that flat inner-product snapshots are mapped with their metric and others read from index.faiss."""
+    from index_factory import build_index
+    from mapped_index import MappedFlatIndex
+    from snapshot import write_snapshot, load_snapshot
+
+    _, vectors, names, bins = make_bundle(count=40)
+    flat = build_index(vectors, "Flat", "ip")
+    write_snapshot(flat, [vectors], names, bins, "test-model", directory=str(tmp_path), index_spec="Flat")
+    snapshot = load_snapshot(str(tmp_path))
+
+    assert isinstance(snapshot.index, MappedFlatIndex)
+    assert snapshot.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert snapshot.manifest["index_spec"] == "Flat"
+
+    hnsw = build_index(vectors, "HNSW32", "l2")
+    write_snapshot(hnsw, [vectors], names, bins, "test-model", directory=str(tmp_path), index_spec="HNSW32")
+    snapshot = load_snapshot(str(tmp_path))
+
+    assert snapshot.manifest["index_type"] == "IndexIDMap2"
+    assert snapshot.manifest["base_index_type"] == "IndexHNSWFlat"
+    assert snapshot.index.ntotal == 40
+    assert snapshot.index.search(vectors[5:6], 1)[1][0][0] == 5
+
+
+@pytest.mark.unit
+def test_ivf_snapshot_is_memory_mapped(tmp_path):
+    """Test that IVF snapshots keep their inverted lists mapped and take learned vectors in a private overflow."""
+    from index_factory import build_index, configure_search
+    from mapped_index import MappedIVFIndex
+    from snapshot import write_snapshot, load_snapshot
+
+    _, vectors, names, bins = make_bundle(count=400)
+    write_snapshot(build_index(vectors, "IVF4,Flat"), [vectors], names, bins, "test-model",
+                   directory=str(tmp_path), index_spec="IVF4,Flat")
+    snapshot = load_snapshot(str(tmp_path))
+    configure_search(snapshot.index, nprobe=4)
+
+    assert isinstance(snapshot.index, MappedIVFIndex)
+    invlists = faiss.downcast_InvertedLists(faiss.extract_index_ivf(snapshot.index.index).invlists)
+    assert isinstance(invlists, faiss.OnDiskInvertedLists)
+    assert snapshot.index.search(vectors[5:6], 1)[1][0][0] == 5
+
+    learned = np.full((1, 8), 3.0, dtype='float32')
+    snapshot.index.add_with_ids(learned, [400])
+
+    assert snapshot.index.ntotal == 401
+    assert snapshot.index.search(learned, 1)[1][0][0] == 400
+    assert load_snapshot(str(tmp_path), mmap=False).index.ntotal == 400
+
+
+@pytest.mark.unit
+def test_publish_version_repoints_current(tmp_path):
+    """Test that an existing version can be published again and unknown ones are refused."""
+    from snapshot import current_version, publish_version, write_snapshot
+
+    for _ in range(2):
+        index, vectors, names, bins = make_bundle()
+        write_snapshot(index, [vectors], names, bins, "test-model", directory=str(tmp_path))
+
+    assert publish_version("000001", str(tmp_path)) == "000001"
+    assert current_version(str(tmp_path)) == "000001"
+    with pytest.raises(FileNotFoundError):
+        publish_version("000007", str(tmp_path))
+    assert current_version(str(tmp_path)) == "000001"
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("CURRENT.tmp")]
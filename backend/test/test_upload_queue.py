@@ -0,0 +1,123 @@
+"""
+Unit tests for upload_queue.py.
+"""
+import pytest
+from unittest.mock import Mock, patch
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.unit
+def test_put_uploads_inline_when_not_started():
+    """Test that without a worker the upload happens on the caller's thread."""
+    from upload_queue import UploadQueue
+
+    upload = Mock()
+    queue = UploadQueue(upload)
+    queue.put(b"image bytes", "a.jpg")
+
+    upload.assert_called_once_with(b"image bytes", "a.jpg")
+    assert queue.stats() == {"uploaded": 1, "retried": 0, "failed": 0, "pending": 0, "failed_jobs": 0}
+
+
+@pytest.mark.unit
+def test_worker_retries_with_backoff_until_upload_succeeds():
+    """Test that a failing upload is retried by the worker and then removed."""
+    from upload_queue import UploadQueue
+
+    upload = Mock(side_effect=[ConnectionError("down"), ConnectionError("down"), None])
+    queue = UploadQueue(upload, retry_base=0.01)
+    queue.start()
+    try:
+        queue.put(b"image bytes", "a.jpg")
+        _wait_for(lambda: queue.uploaded == 1)
+    finally:
+        queue.stop()
+
+    assert upload.call_count == 3
+    assert queue.stats()["retried"] == 2
+    assert queue.stats()["pending"] == 0
+
+
+@pytest.mark.unit
+def test_gives_up_after_max_attempts():
+    """Test that a job that keeps failing is marked failed and not retried again."""
+    from upload_queue import UploadQueue
+
+    upload = Mock(side_effect=ConnectionError("down"))
+    queue = UploadQueue(upload, max_attempts=2, retry_base=0.01)
+    queue.start()
+    try:
+        queue.put(b"image bytes", "a.jpg")
+        _wait_for(lambda: queue.failed == 1)
+        time.sleep(0.05)
+    finally:
+        queue.stop()
+
+    assert upload.call_count == 2
+    assert queue.stats()["failed_jobs"] == 1
+    assert queue.stats()["pending"] == 0
+
+
+@pytest.mark.unit
+def test_queued_jobs_survive_restart(tmp_path):
+    """Test that a job left over by a stopped process is uploaded by the next one."""
+    from upload_queue import UploadQueue
+
+    path = str(tmp_path / "uploads.sqlite3")
+    UploadQueue(Mock(side_effect=ConnectionError("down")), path).put(b"image bytes", "a.jpg")
+
+    upload = Mock()
+    queue = UploadQueue(upload, path, retry_base=0.01)
+    assert queue.stats()["pending"] == 1
+    with patch('upload_queue.time.time', return_value=time.time() + 10):
+        queue.start()
+        try:
+            _wait_for(lambda: queue.uploaded == 1)
+        finally:
+            queue.stop()
+
+    upload.assert_called_once_with(b"image bytes", "a.jpg")
+
+
+@pytest.mark.unit
+def test_database_is_opened_on_start_not_on_creation(tmp_path):
+    """Test that creating the queue (at import time) leaves no file behind until it is started."""
+    from upload_queue import UploadQueue
+
+    path = tmp_path / "uploads.sqlite3"
+    queue = UploadQueue(Mock(), str(path))
+    assert not path.exists()
+
+    queue.start()
+    try:
+        assert path.exists()
+    finally:
+        queue.stop()
+
+
+@pytest.mark.unit
+def test_failed_jobs_drop_their_bytes_and_are_capped(tmp_path):
+    """Test that given-up jobs keep no image data and only the newest few are kept."""
+    from upload_queue import UploadQueue
+
+    queue = UploadQueue(Mock(side_effect=ConnectionError("down")), str(tmp_path / "uploads.sqlite3"),
+                        max_attempts=1, max_failed=2)
+    for index in range(5):
+        queue.put(b"x" * 10000, f"{index}.jpg")
+
+    rows = queue._db.execute("SELECT key, length(data), last_error FROM upload_jobs ORDER BY id").fetchall()
+    assert rows == [("3.jpg", 0, "down"), ("4.jpg", 0, "down")]
+    assert queue.stats()["failed"] == 5
+    assert queue.stats()["failed_jobs"] == 2
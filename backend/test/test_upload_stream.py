@@ -0,0 +1,114 @@
+"""
+Unit tests for upload_stream.py.
+"""
+import pytest
+import hashlib
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOUNDARY = "kioskboundary"
+
+
+class _Request:
+    """Just enough of a Starlette request: headers and a body arriving in chunks."""
+
+    def __init__(self, body, content_type, chunk_size=256, headers=None):
+        self.headers = {"content-type": content_type, **(headers or {})}
+        self.read = 0
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def stream(self):
+        for start in range(0, len(self._body), self._chunk_size):
+            self.read = start + self._chunk_size
+            yield self._body[start:start + self._chunk_size]
+
+
+def _form(data, field="file", filename="photo.jpg"):
+    body = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="note"\r\n\r\n'
+        "hello\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return _Request(body, f"multipart/form-data; boundary={BOUNDARY}")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_small_upload_stays_in_memory():
+    """Test that the file part is hashed and kept in memory under the spill threshold."""
+    from upload_stream import read_request_upload
+
+    data = b"photo\r\n--not-a-boundary" * 20
+    upload, filename, content_type = await read_request_upload(_form(data), "file", 10000, 1000)
+
+    assert (filename, content_type) == ("photo.jpg", "image/jpeg")
+    assert not upload.spilled
+    assert upload.size == len(data)
+    assert upload.hexdigest == hashlib.sha256(data).hexdigest()
+    assert upload.read() == upload.source() == data
+    upload.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_large_upload_spills_to_temporary_file():
+    """Test that an upload past the threshold moves to a file that close() removes."""
+    from upload_stream import read_request_upload
+
+    data = os.urandom(5000)
+    upload, _, _ = await read_request_upload(_form(data), "file", 10000, 1000)
+
+    assert upload.spilled
+    assert upload.source() == upload.path
+    assert upload.read() == data
+    assert upload.hexdigest == hashlib.sha256(data).hexdigest()
+    upload.close()
+    assert not os.path.exists(upload.path)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_oversized_upload_stops_reading_and_cleans_up(monkeypatch):
+    """Test that reading stops once the file passes the maximum size and the spill file is removed."""
+    import tempfile
+    from upload_stream import UploadTooLarge, read_request_upload
+
+    spills = []
+    original = tempfile.NamedTemporaryFile
+
+    def spill(**kwargs):
+        spill_file = original(**kwargs)
+        spills.append(spill_file.name)
+        return spill_file
+
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", spill)
+    request = _form(b"x" * 100000)
+    with pytest.raises(UploadTooLarge):
+        await read_request_upload(request, "file", 2000, 1000)
+
+    assert request.read < 3000
+    assert len(spills) == 1
+    assert not os.path.exists(spills[0])
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_raw_body_and_missing_file():
+    """Test raw image bodies, and that a form without the field is refused."""
+    from upload_stream import read_request_upload
+
+    raw = _Request(b"raw bytes", "image/png", headers={"x-filename": "raw.png"})
+    upload, filename, content_type = await read_request_upload(raw, "file", 10000, 1000)
+    assert (upload.read(), filename, content_type) == (b"raw bytes", "raw.png", "image/png")
+
+    with pytest.raises(ValueError):
+        await read_request_upload(_form(b"data", field="picture"), "file", 10000, 1000)
+    with pytest.raises(ValueError):
+        await read_request_upload(_Request(b"{}", "application/json"), "file", 10000, 1000)
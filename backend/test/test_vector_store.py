@@ -0,0 +1,163 @@
+"""
+Unit tests for vector_store.py.
+"""
+import pytest
+import numpy as np
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.unit
+def test_put_many_assigns_stable_ids(tmp_path):
+    """Test that ids are assigned in insertion order and reused on overwrite."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path), shard_size=2)
+
+    assert store.put_many(["a", "b", "c"], np.eye(3)) == [0, 1, 2]
+    assert store.put_many(["b", "d"], [[0, 0, 5], [0, 0, 7]]) == [1, 3]
+
+    assert len(store) == 4
+    assert store.ids_for(["d", "missing"]) == [3, None]
+    assert store.get("b").tolist() == [0, 0, 5]
+    assert store.get("a").tolist() == [1, 0, 0]
+    assert store.get("missing") is None
+
+
+@pytest.mark.unit
+def test_store_is_sharded_and_reopens(tmp_path):
+    """Test that vectors are split into shard files and survive reopening."""
+    from vector_store import VectorStore
+
+    vectors = np.random.rand(5, 4).astype('float32')
+    VectorStore(str(tmp_path), shard_size=2).put_many([f"item{i}" for i in range(5)], vectors)
+
+    assert sorted(f for f in os.listdir(tmp_path) if f.startswith("shard_")) == [
+        "shard_00000.npy", "shard_00001.npy", "shard_00002.npy"
+    ]
+    reopened = VectorStore(str(tmp_path), shard_size=1000)
+    assert reopened.shard_size == 2
+    shards = list(reopened.iter_shards())
+    assert [ids.tolist() for ids, _, _ in shards] == [[0, 1], [2, 3], [4]]
+    np.testing.assert_array_equal(np.concatenate([shard for _, _, shard in shards]), vectors)
+
+
+@pytest.mark.unit
+def test_writers_see_each_others_items(tmp_path):
+    """Test that a second store on the same directory never reuses an id."""
+    from vector_store import VectorStore
+
+    first = VectorStore(str(tmp_path))
+    second = VectorStore(str(tmp_path))
+
+    first.put_many(["a"], [[1.0, 0.0]])
+    assert second.put_many(["b"], [[0.0, 1.0]]) == [1]
+    assert first.put_many(["c"], [[1.0, 1.0]]) == [2]
+    assert VectorStore(str(tmp_path)).names == ["a", "b", "c"]
+
+
+@pytest.mark.unit
+def test_dimension_mismatch_raises(tmp_path):
+    """Test that vectors of a different dimension are rejected."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path))
+    store.put_many(["a"], [[1.0, 0.0]])
+
+    with pytest.raises(ValueError):
+        store.put_many(["b"], [[1.0, 0.0, 0.0]])
+
+
+@pytest.mark.unit
+def test_sample_is_evenly_spaced_across_shards(tmp_path):
+    """Test that training samples are spread over every shard."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path), shard_size=3)
+    store.put_many([f"item{i}" for i in range(10)], np.arange(10).reshape(10, 1))
+
+    assert store.sample(4).ravel().tolist() == [0, 3, 6, 9]
+    assert len(store.sample(100)) == 10
+
+
+@pytest.mark.unit
+def test_delete_keeps_ids_and_records_changes(tmp_path):
+    """Test that deletes hide items, re-adding reuses the id, and every write is in the change feed."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path), shard_size=2)
+    store.put_many(["a", "b", "c"], np.eye(3))
+
+    assert store.delete(["b", "missing"]) == [1]
+    assert len(store) == 2
+    assert store.get("b") is None
+    assert store.ids_for(["a", "b"]) == [0, None]
+    assert [ids.tolist() for ids, _, _ in store.iter_shards()] == [[0], [2]]
+    assert VectorStore(str(tmp_path)).live_ids.tolist() == [0, 2]
+
+    assert store.put_many(["b"], [[0, 0, 9]]) == [1]
+    assert store.get("b").tolist() == [0, 0, 9]
+    assert store.changes_since(0) == [(1, "upsert", [0, 1, 2]), (2, "delete", [1]), (3, "upsert", [1])]
+    assert store.changes_since(2) == [(3, "upsert", [1])]
+
+
+@pytest.mark.unit
+def test_truncate_changes(tmp_path):
+    """Test that truncated changes are dropped and cannot be replayed."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path))
+    for i in range(3):
+        store.put_many([f"item{i}"], [[float(i)]])
+
+    store.truncate_changes(2)
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.changes_since(2) == [(3, "upsert", [2])]
+    with pytest.raises(ValueError):
+        reopened.changes_since(1)
+    reopened.put_many(["item3"], [[3.0]])
+    assert reopened.current_sequence() == 4
+
+
+@pytest.mark.unit
+def test_put_writes_in_place_and_appends_names(tmp_path):
+    """Test that a one-item put touches one row and one name instead of rewriting shard and names."""
+    from unittest.mock import patch
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path), shard_size=1024)
+    store.put_many([f"item{i}" for i in range(500)], np.random.rand(500, 8))
+    shard_inode = os.stat(tmp_path / "shard_00000.npy").st_ino
+    names_size = os.path.getsize(tmp_path / "names.jsonl")
+
+    with patch.object(VectorStore, '_save_array') as save_array:
+        store.put_many(["new item"], [np.ones(8)])
+        store.put_many(["item3"], [np.zeros(8)])
+
+    save_array.assert_not_called()
+    assert os.stat(tmp_path / "shard_00000.npy").st_ino == shard_inode
+    assert os.path.getsize(tmp_path / "names.jsonl") == names_size + len('"new item"\n')
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.names[-1] == "new item"
+    assert reopened.get("new item").tolist() == [1.0] * 8
+    assert reopened.get("item3").tolist() == [0.0] * 8
+
+
+@pytest.mark.unit
+def test_uncommitted_names_are_ignored_and_overwritten(tmp_path):
+    """Test that names a crashed writer appended past the manifest are neither read nor kept."""
+    from vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path))
+    store.put_many(["a"], [[1.0, 0.0]])
+    with open(tmp_path / "names.jsonl", "a") as file:
+        file.write('"ghost"\n"torn')
+
+    assert VectorStore(str(tmp_path)).names == ["a"]
+    assert store.put_many(["b"], [[0.0, 1.0]]) == [1]
+    assert VectorStore(str(tmp_path)).names == ["a", "b"]
+    assert (tmp_path / "names.jsonl").read_text() == '"a"\n"b"\n'
@@ -0,0 +1,144 @@
+"""
+Unit tests for write_back.py.
+"""
+import pytest
+from unittest.mock import MagicMock
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_driver():
+    mock_driver = MagicMock()
+    mock_session = MagicMock()
+    mock_driver.session.return_value.__enter__.return_value = mock_session
+    mock_tx = MagicMock()
+    mock_session.execute_write.side_effect = lambda work: work(mock_tx)
+    return mock_driver, mock_session, mock_tx
+
+
+@pytest.mark.unit
+def test_flush_writes_batches_with_unwind():
+    """Test that queued rows are written in batches of batch_size."""
+    from write_back import WriteBehindQueue, WRITE_PROVISIONAL_ITEMS_QUERY
+
+    driver, session, tx = make_driver()
+    queue = WriteBehindQueue(driver, batch_size=2)
+    for i in range(3):
+        queue.enqueue(f"item{i}", "blue bin", [0.1, 0.2], confidence=0.95)
+
+    queue.flush()
+
+    assert tx.run.call_count == 2
+    first_batch = tx.run.call_args_list[0][1]["rows"]
+    assert [row["name"] for row in first_batch] == ["item0", "item1"]
+    assert first_batch[0] == {
+        "name": "item0", "bin_type": "blue bin", "source": "llm", "confidence": 0.95,
+    }
+    assert tx.run.call_args_list[0][0][0] == WRITE_PROVISIONAL_ITEMS_QUERY
+    assert queue.stats() == {"queued": 0, "written": 3, "failed": 0}
+
+
+@pytest.mark.unit
+def test_query_marks_items_provisional():
+    """Test that learned items carry a provenance flag and never touch curated edges."""
+    from write_back import WRITE_PROVISIONAL_ITEMS_QUERY
+
+    assert "ON CREATE SET" in WRITE_PROVISIONAL_ITEMS_QUERY
+    assert "i.provisional = true" in WRITE_PROVISIONAL_ITEMS_QUERY
+    assert "WHERE i.provisional = true" in WRITE_PROVISIONAL_ITEMS_QUERY
+    # An item that already has a bin never gets a second one
+    assert "NOT (i)-[:SHOULD_GO_IN]->(:Bin)" in WRITE_PROVISIONAL_ITEMS_QUERY
+    assert "embedding" not in WRITE_PROVISIONAL_ITEMS_QUERY
+
+
+@pytest.mark.unit
+def test_vectors_go_to_vector_store(isolated_vector_store):
+    """Test that only the items the graph write kept as provisional get their vectors stored."""
+    from write_back import WriteBehindQueue
+
+    driver, session, tx = make_driver()
+    # "curated" already existed as a catalog item, so the query does not return it
+    tx.run.return_value = [{"name": "learned"}]
+    queue = WriteBehindQueue(driver, vector_store=isolated_vector_store)
+    queue.enqueue("learned", "blue bin", [0.1, 0.2])
+    queue.enqueue("curated", "blue bin", [0.3, 0.4])
+
+    queue.flush()
+
+    assert isolated_vector_store.names == ["learned"]
+    assert isolated_vector_store.get("learned").tolist() == pytest.approx([0.1, 0.2])
+
+
+@pytest.mark.unit
+def test_two_guesses_for_one_name_write_one_bin(isolated_vector_store):
+    """Test that two rows for the same name with different bins send only the first one."""
+    from write_back import WriteBehindQueue
+
+    driver, session, tx = make_driver()
+    tx.run.return_value = [{"name": "coffee cup"}]
+    queue = WriteBehindQueue(driver, vector_store=isolated_vector_store)
+    queue.enqueue("coffee cup", "black bin", [0.1, 0.2])
+    queue.enqueue("coffee cup", "blue bin", [0.3, 0.4])
+
+    queue.flush()
+
+    rows = tx.run.call_args[1]["rows"]
+    assert [(row["name"], row["bin_type"]) for row in rows] == [("coffee cup", "black bin")]
+    assert isolated_vector_store.get("coffee cup").tolist() == pytest.approx([0.1, 0.2])
+    assert queue.stats()["written"] == 2
+
+
+@pytest.mark.unit
+def test_failed_write_is_counted():
+    """Test that a failing batch is dropped and counted instead of raising."""
+    from write_back import WriteBehindQueue
+
+    driver, session, tx = make_driver()
+    session.execute_write.side_effect = Exception("neo4j down")
+    queue = WriteBehindQueue(driver)
+    queue.enqueue("item", "blue bin", [0.1])
+
+    queue.flush()
+
+    assert queue.stats()["failed"] == 1
+
+
+@pytest.mark.unit
+def test_worker_thread_writes_and_stops():
+    """Test that the background worker drains the queue and stop() flushes."""
+    from write_back import WriteBehindQueue
+
+    driver, session, tx = make_driver()
+    queue = WriteBehindQueue(driver, flush_interval=0.01)
+    queue.start()
+    assert queue.running
+    queue.start()  # no second thread
+
+    queue.enqueue("item", "blue bin", [0.1])
+    queue.stop()
+
+    assert not queue.running
+    assert queue.stats()["written"] == 1
+
+
+@pytest.mark.unit
+def test_store_is_looked_up_when_the_batch_is_written(isolated_vector_store):
+    """Test that a store getter is resolved per batch, so the app's queue uses the test's store."""
+    from unittest.mock import Mock
+    from langchain_helper import write_back
+    from write_back import WriteBehindQueue
+
+    driver, session, tx = make_driver()
+    tx.run.return_value = [{"name": "learned"}]
+    getter = Mock(return_value=isolated_vector_store)
+    queue = WriteBehindQueue(driver, vector_store=getter)
+    getter.assert_not_called()
+
+    queue.enqueue("learned", "blue bin", [0.1, 0.2])
+    queue.flush()
+
+    assert isolated_vector_store.names == ["learned"]
+    assert write_back.vector_store() is isolated_vector_store
@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+import time
+
+
+class UploadQueue:
+    """
+    Durable queue of objects to copy to object storage off the request path.
+
+    Jobs are (object key, bytes) rows in a SQLite file, so uploads that were
+    queued but not finished survive a restart, and a row is deleted as soon
+    as its object is stored. A daemon thread uploads jobs in order with
+    `upload(data, key)`; a failed upload is retried with exponential backoff
+    (`retry_base` seconds, doubling up to `retry_max`) and given up after
+    `max_attempts`. A job that is given up on loses its bytes and keeps only
+    its key and last error, and just the newest `max_failed` of those are
+    kept, so an object-store outage cannot grow the file without bound.
+    Until start() is called, put() uploads on the caller's thread and leaves
+    failures queued for the worker. The SQLite file is opened by start(), or
+    by the first put(), not when the queue is created.
+    """
+
+    def __init__(self, upload, path=None, max_attempts=8, retry_base=2.0, retry_max=300.0, max_failed=1000):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_failed = max_failed
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.uploaded = 0
+        self.retried = 0
+        self.failed = 0
+        self._upload = upload
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = None
+
+    def open(self):
+        """
+        Open the job table, creating it if needed. Returns the connection.
+        """
+        with self._lock:
+            return self._connection()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def put(self, data, key):
+        """
+        Queue `data` for upload as `key`. Returns without waiting for the upload
+        while the worker is running.
+        """
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO upload_jobs (key, data, next_attempt_at) VALUES (?, ?, ?)", (key, data, time.time())
+            )
+            self._db.commit()
+            job = (cursor.lastrowid, data, key, 0)
+        if self.running:
+            self._wake.set()
+        else:
+            self._attempt(job)
+
+    def start(self):
+        if self.running:
+            return
+        self.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the worker. Jobs not uploaded yet stay queued for the next start.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            pending, failed_jobs = self._connection().execute(
+                "SELECT COALESCE(SUM(failed = 0), 0), COALESCE(SUM(failed), 0) FROM upload_jobs"
+            ).fetchone()
+        return {
+            "uploaded": self.uploaded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "pending": pending,
+            "failed_jobs": failed_jobs,
+        }
+
+    def _connection(self):
+        # Callers hold self._lock
+        if self._db is None:
+            self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS upload_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+            self._db.commit()
+        return self._db
+
+    def _run(self):
+        while not self._stop.is_set():
+            job, wait = self._next_due()
+            if job is None:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            self._attempt(job)
+
+    def _next_due(self):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, data, key, attempts, next_attempt_at FROM upload_jobs "
+                "WHERE failed = 0 ORDER BY next_attempt_at, id LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None, None
+        if row[4] > now:
+            return None, row[4] - now
+        return row[:4], None
+
+    def _attempt(self, job):
+        job_id, data, key, attempts = job
+        try:
+            self._upload(data, key)
+        except Exception as e:
+            attempts += 1
+            failed = attempts >= self.max_attempts
+            delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+            with self._lock:
+                self._db.execute(
+                    "UPDATE upload_jobs SET attempts = ?, next_attempt_at = ?, failed = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + delay, int(failed), str(e), job_id),
+                )
+                if failed:
+                    self._db.execute("UPDATE upload_jobs SET data = X'' WHERE id = ?", (job_id,))
+                    self._db.execute(
+                        "DELETE FROM upload_jobs WHERE failed = 1 AND id NOT IN "
+                        "(SELECT id FROM upload_jobs WHERE failed = 1 ORDER BY id DESC LIMIT ?)",
+                        (self.max_failed,),
+                    )
+                self._db.commit()
+            if failed:
+                self.failed += 1
+                print(f"Giving up on uploading {key} after {attempts} attempts: {e}")
+            else:
+                self.retried += 1
+                print(f"Upload of {key} failed, retrying in {delay:.0f} s: {e}")
+            return False
+        with self._lock:
+            self._db.execute("DELETE FROM upload_jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+        self.uploaded += 1
+        return True
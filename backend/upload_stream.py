@@ -0,0 +1,168 @@
+import hashlib
+import os
+import tempfile
+from contextlib import aclosing
+
+import multipart
+from multipart.multipart import parse_options_header
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBuffer:
+    """
+    An upload read in chunks: its sha256 and size, and its bytes, kept in
+    memory until they pass `spill_bytes` and in an anonymous temporary file
+    after that. Nothing is written under a client-supplied name, so
+    concurrent uploads of "image.jpg" cannot collide.
+    """
+
+    def __init__(self, max_bytes, spill_bytes):
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.size = 0
+        self.path = None
+        self._digest = hashlib.sha256()
+        self._chunks = []
+        self._spill = None
+
+    @property
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    @property
+    def spilled(self):
+        return self.path is not None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload is larger than {self.max_bytes} bytes")
+        self._digest.update(chunk)
+        if self._spill is None and self.size > self.spill_bytes:
+            self._spill = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+            self.path = self._spill.name
+            self._spill.writelines(self._chunks)
+            self._chunks = []
+        if self._spill is not None:
+            self._spill.write(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def finish(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def source(self):
+        """
+        The bytes, or the path of the spill file, for readers that accept either.
+        """
+        return self.path if self.spilled else self.read()
+
+    def read(self):
+        if not self.spilled:
+            return b"".join(self._chunks)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            os.unlink(self.path)
+            self._spill = None
+        self._chunks = []
+
+
+class _FilePart:
+    """
+    Multipart callbacks that send the data of the first part named `field`
+    straight into an UploadBuffer and skip every other part.
+    """
+
+    def __init__(self, field, buffer):
+        self.field = field.encode()
+        self.buffer = buffer
+        self.found = False
+        self.filename = None
+        self.content_type = None
+        self._in_field = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if not self.found and options.get(b"name") == self.field:
+            self.found = self._in_field = True
+            self.filename = options.get(b"filename", b"").decode("utf-8", errors="replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _on_part_data(self, data, start, end):
+        if self._in_field:
+            self.buffer.write(data[start:end])
+
+    def _on_part_end(self):
+        self._in_field = False
+
+
+async def read_request_upload(request, field, max_bytes, spill_bytes):
+    """
+    Stream the file in form field `field` of a multipart/form-data request
+    (or a raw image/* body) into an UploadBuffer as the body arrives.
+    Returns (buffer, filename, content_type). Raises UploadTooLarge as soon as
+    more than `max_bytes` of file data have arrived, and ValueError for a
+    body without the file.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    buffer = UploadBuffer(max_bytes, spill_bytes)
+    try:
+        if content_type == b"multipart/form-data":
+            if b"boundary" not in options:
+                raise ValueError("Missing boundary in multipart body")
+            part = _FilePart(field, buffer)
+            parser = multipart.MultipartParser(options[b"boundary"], part.callbacks())
+            async with aclosing(request.stream()) as body:
+                async for chunk in body:
+                    parser.write(chunk)
+            parser.finalize()
+            if not part.found:
+                raise ValueError(f"No '{field}' file in the upload")
+            filename, part_type = part.filename, part.content_type
+        elif content_type.startswith(b"image/"):
+            async with aclosing(request.stream()) as body:
+                async for chunk in body:
+                    buffer.write(chunk)
+            filename, part_type = request.headers.get("x-filename", ""), content_type.decode("latin-1")
+        else:
+            raise ValueError("Expected a multipart/form-data or image/* body")
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.finish()
+    return buffer, filename, part_type
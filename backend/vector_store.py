@@ -0,0 +1,361 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms only get the in-process lock
+    fcntl = None
+
+# Embeddings live here instead of on Neo4j Item nodes
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vector_store")
+VECTOR_STORE_SHARD_SIZE = int(os.getenv("VECTOR_STORE_SHARD_SIZE", "65536"))
+
+_store = None
+
+
+class VectorStore:
+    """
+    Columnar on-disk embedding store keyed by item id.
+
+    Vectors are kept in float32 .npy shards of `shard_size` rows, and
+    names.jsonl maps each id to its item name, one line per id. Ids are
+    assigned on first write and never reused, so an item's id (and its id in
+    the index) is stable; deleted items keep their id and get it back if they
+    are written again.
+
+    A write only touches what it changes: rows are written in place through a
+    memory map of their shard (a new shard is created at full size, sparse on
+    disk) and new names are appended. The manifest, replaced atomically last,
+    says how many ids and how many bytes of names.jsonl are committed, so
+    readers never see a half-written item. Writers hold an exclusive file
+    lock, so the ingest script and a running server can write to the same store.
+
+    Every write is also appended to changes.jsonl with an increasing sequence
+    number, so the index can be updated with just the items that changed.
+    """
+
+    def __init__(self, directory, shard_size=VECTOR_STORE_SHARD_SIZE):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.dimension = None
+        self.sequence = 0
+        self.truncated_through = 0
+        self._names = []
+        # Bytes of names.jsonl read so far
+        self._names_bytes = 0
+        self._ids = {}
+        self._deleted = set()
+        self._deleted_sequence = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._reload()
+
+    def __len__(self):
+        return len(self._names) - len(self._deleted)
+
+    @property
+    def names(self):
+        """
+        Item name of every id ever assigned, deleted ones included.
+        """
+        return list(self._names)
+
+    @property
+    def live_ids(self):
+        return np.array([item_id for item_id in range(len(self._names)) if item_id not in self._deleted],
+                        dtype='int64')
+
+    def ids_for(self, names):
+        """
+        Return the id of each name, or None for names that have no vector.
+        """
+        return [None if self._ids.get(name) in self._deleted else self._ids.get(name) for name in names]
+
+    def get(self, name):
+        item_id = self.ids_for([name])[0]
+        if item_id is None:
+            return None
+        shard = self._read_shard(item_id // self.shard_size)
+        return np.array(shard[item_id % self.shard_size])
+
+    def get_many(self, ids):
+        """
+        Return the vectors of `ids`, in order, as one float32 matrix.
+        """
+        ids = np.asarray(ids, dtype='int64')
+        vectors = np.empty((len(ids), self.dimension or 0), dtype='float32')
+        for shard_number in np.unique(ids // self.shard_size):
+            in_shard = ids // self.shard_size == shard_number
+            vectors[in_shard] = self._read_shard(shard_number)[ids[in_shard] % self.shard_size]
+        return vectors
+
+    def put_many(self, names, vectors):
+        """
+        Insert or overwrite the vectors for `names`. Returns their ids.
+        """
+        if not len(names):
+            return []
+        vectors = np.asarray(vectors, dtype='float32').reshape(len(names), -1)
+        with self._lock, self._file_lock():
+            # Another process may have appended since we last looked
+            self._reload()
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dim vectors, got {vectors.shape[1]}")
+
+            ids = []
+            new_names = []
+            for name in names:
+                item_id = self._ids.get(name)
+                if item_id is None:
+                    item_id = len(self._names)
+                    self._names.append(name)
+                    self._ids[name] = item_id
+                    new_names.append(name)
+                ids.append(item_id)
+            ids = np.array(ids)
+            undeleted = self._deleted.intersection(ids.tolist())
+
+            # Rows first, then names, then the manifest: a reader never sees
+            # a name whose row has not been written yet
+            for shard_number in np.unique(ids // self.shard_size):
+                in_shard = ids // self.shard_size == shard_number
+                shard = self._writable_shard(shard_number)
+                shard[ids[in_shard] % self.shard_size] = vectors[in_shard]
+                shard.flush()
+                del shard
+            if new_names:
+                self._append_names(new_names)
+            if undeleted:
+                self._deleted -= undeleted
+                self._save_array(self._path("deleted.npy"), np.array(sorted(self._deleted), dtype='int64'))
+            self._record_change("upsert", ids.tolist())
+        return ids.tolist()
+
+    def delete(self, names):
+        """
+        Delete the vectors of `names`. Returns the ids that were deleted.
+        """
+        with self._lock, self._file_lock():
+            self._reload()
+            ids = sorted({item_id for item_id in self.ids_for(names) if item_id is not None})
+            if ids:
+                self._deleted.update(ids)
+                self._save_array(self._path("deleted.npy"), np.array(sorted(self._deleted), dtype='int64'))
+                self._record_change("delete", ids)
+        return ids
+
+    def current_sequence(self):
+        """
+        Sequence number of the latest change written by any process.
+        """
+        self._reload()
+        return self.sequence
+
+    def changes_since(self, sequence):
+        """
+        Return the (sequence, op, ids) changes made after `sequence`, oldest first.
+        Raises ValueError if some of them have already been truncated away.
+        """
+        self._reload()
+        if sequence < self.truncated_through:
+            raise ValueError(f"Changes up to {self.truncated_through} were truncated; "
+                             f"cannot replay from {sequence}")
+        return [change for change in self._read_changes() if change[0] > sequence]
+
+    def truncate_changes(self, through):
+        """
+        Drop changes up to and including sequence `through`, once the index no longer needs them.
+        """
+        with self._lock, self._file_lock():
+            self._reload()
+            through = min(through, self.sequence)
+            if through <= self.truncated_through:
+                return
+            tmp_path = self._path("changes.jsonl.tmp")
+            with open(tmp_path, 'w') as file:
+                for change in self._read_changes():
+                    if change[0] > through:
+                        file.write(json.dumps(change) + "\n")
+            os.replace(tmp_path, self._path("changes.jsonl"))
+            self.truncated_through = through
+            self._save_manifest()
+
+    def sample(self, count):
+        """
+        Return `count` evenly spaced vectors, e.g. to train an index without loading the whole store.
+        """
+        self._reload()
+        live_ids = self.live_ids
+        if not len(live_ids):
+            return np.empty((0, self.dimension or 0), dtype='float32')
+        positions = np.unique(np.linspace(0, len(live_ids) - 1, min(count, len(live_ids))).astype('int64'))
+        return self.get_many(live_ids[positions])
+
+    def iter_shards(self):
+        """
+        Yield (ids, item names, vectors) of the live items in each shard, in id order.
+        Vectors are memory-mapped, so iterating costs one shard of page cache at a time.
+        """
+        self._reload()
+        names = self._names
+        for shard_number in range((len(names) + self.shard_size - 1) // self.shard_size):
+            first_id = shard_number * self.shard_size
+            ids = np.arange(first_id, min(first_id + self.shard_size, len(names)), dtype='int64')
+            vectors = self._read_shard(shard_number)[:len(ids)]
+            live = np.array([item_id not in self._deleted for item_id in ids.tolist()], dtype=bool)
+            if not live.all():
+                ids, vectors = ids[live], vectors[live]
+            if len(ids):
+                yield ids, [names[item_id] for item_id in ids.tolist()], vectors
+
+    def _reload(self):
+        manifest_path = self._path("manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        self.dimension = manifest["dimension"]
+        self.shard_size = manifest["shard_size"]
+        sequence = manifest.get("sequence", 0)
+        self.truncated_through = manifest.get("truncated_through", 0)
+        self._read_names(manifest["names_bytes"])
+        if sequence != self._deleted_sequence:
+            # Every delete or undelete is a change, so the set only moves with the sequence
+            deleted_path = self._path("deleted.npy")
+            self._deleted = set(np.load(deleted_path).tolist()) if os.path.exists(deleted_path) else set()
+            self._deleted_sequence = sequence
+        self.sequence = sequence
+
+    def _read_names(self, committed_bytes):
+        # names.jsonl only grows, so read just the lines committed since last time
+        if committed_bytes < self._names_bytes:
+            self._names, self._ids, self._names_bytes = [], {}, 0
+        if committed_bytes == self._names_bytes:
+            return
+        with open(self._path("names.jsonl"), 'rb') as file:
+            file.seek(self._names_bytes)
+            data = file.read(committed_bytes - self._names_bytes)
+        for line in data.splitlines():
+            name = json.loads(line)
+            self._ids[name] = len(self._names)
+            self._names.append(name)
+        self._names_bytes = committed_bytes
+
+    def _append_names(self, new_names):
+        with open(self._path("names.jsonl"), 'a+b') as file:
+            # Drop whatever a crashed writer appended without committing it
+            file.truncate(self._names_bytes)
+            file.write("".join(json.dumps(name) + "\n" for name in new_names).encode())
+            file.flush()
+            os.fsync(file.fileno())
+            self._names_bytes = file.tell()
+
+    def _record_change(self, op, ids):
+        # The change goes to the feed before the manifest moves the sequence on;
+        # after a crash in between, the feed's last entry still holds the latest number
+        self.sequence = max(self.sequence, self._last_change_sequence()) + 1
+        with open(self._path("changes.jsonl"), 'a') as file:
+            file.write(json.dumps([self.sequence, op, ids]) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self._save_manifest()
+        self._deleted_sequence = self.sequence
+
+    def _last_change_sequence(self):
+        path = self._path("changes.jsonl")
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            # The last line is usually short; read the whole feed only if it is not
+            for tail in (4096, size):
+                file.seek(max(size - tail, 0))
+                for line in reversed(file.read().splitlines()):
+                    try:
+                        return json.loads(line)[0]
+                    except (ValueError, IndexError, TypeError):
+                        continue
+        return 0
+
+    def _read_changes(self):
+        path = self._path("changes.jsonl")
+        if not os.path.exists(path):
+            return []
+        changes = []
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    sequence, op, ids = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crashed writer
+                    continue
+                changes.append((sequence, op, ids))
+        return changes
+
+    def _save_manifest(self):
+        tmp_path = self._path("manifest.json.tmp")
+        with open(tmp_path, 'w') as file:
+            json.dump({"dimension": self.dimension, "shard_size": self.shard_size,
+                       "count": len(self._names), "names_bytes": self._names_bytes,
+                       "sequence": self.sequence, "truncated_through": self.truncated_through}, file)
+        os.replace(tmp_path, self._path("manifest.json"))
+
+    def _read_shard(self, shard_number):
+        path = self._shard_path(shard_number)
+        if not os.path.exists(path):
+            return np.zeros((0, self.dimension or 0), dtype='float32')
+        return np.load(path, mmap_mode='r')
+
+    def _writable_shard(self, shard_number):
+        path = self._shard_path(shard_number)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r+')
+        return np.lib.format.open_memmap(path, mode='w+', dtype='float32', shape=(self.shard_size, self.dimension))
+
+    def _save_array(self, path, array):
+        # Readers holding a memory map of the old file keep a consistent view
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+
+    def _shard_path(self, shard_number):
+        return self._path(f"shard_{shard_number:05d}.npy")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _file_lock(self):
+        return _FileLock(self._path(".lock"))
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def get_vector_store():
+    """
+    Return the process-wide vector store, opening it on first use.
+    """
+    global _store
+    if _store is None:
+        _store = VectorStore(VECTOR_STORE_PATH)
+    return _store
@@ -0,0 +1,122 @@
+import queue
+import threading
+
+# Only provisional items without a bin get a bin edge, so a learned guess never
+# adds a second bin to a curated item, nor to a provisional one another worker
+# (or an earlier batch) already placed. Rows carry distinct names; see _write.
+# The names returned are the provisional items whose vectors should be stored.
+WRITE_PROVISIONAL_ITEMS_QUERY = """
+UNWIND $rows AS row
+MERGE (i:Item {name: row.name})
+ON CREATE SET i.provisional = true,
+              i.source = row.source,
+              i.confidence = row.confidence,
+              i.created_at = timestamp()
+WITH i, row
+WHERE i.provisional = true AND NOT (i)-[:SHOULD_GO_IN]->(:Bin)
+MERGE (b:Bin {type: row.bin_type})
+MERGE (i)-[:SHOULD_GO_IN]->(b)
+RETURN DISTINCT i.name AS name
+"""
+
+
+class WriteBehindQueue:
+    """
+    Persists learned (item, bin, embedding) rows to Neo4j off the request path.
+
+    Rows are queued by request handlers and written by a daemon thread in
+    batches of up to `batch_size`, or whatever has arrived after
+    `flush_interval` seconds, using a single UNWIND transaction per batch.
+    Embeddings of the provisional items go to `vector_store` when one is given;
+    pass a function returning the store to look it up when each batch is written.
+    """
+
+    def __init__(self, driver, vector_store=None, batch_size=50, flush_interval=2.0):
+        self.driver = driver
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(self, name, bin_type, embedding, source="llm", confidence=None):
+        self._queue.put({
+            "name": name,
+            "bin_type": bin_type,
+            "embedding": [float(x) for x in embedding],
+            "source": source,
+            "confidence": confidence,
+        })
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="write-back", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the worker after flushing whatever is still queued.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "failed": self.failed}
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def _drain(self, block):
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        # The first guess for a name wins; the bin check in the query cannot see
+        # edges created by other rows of the same UNWIND once Cypher plans it eagerly
+        first = {}
+        for row in batch:
+            first.setdefault(row["name"], row)
+        rows = [{key: value for key, value in row.items() if key != "embedding"} for row in first.values()]
+        try:
+            with self.driver.session() as session:
+                names = session.execute_write(
+                    lambda tx: [record["name"] for record in tx.run(WRITE_PROVISIONAL_ITEMS_QUERY, rows=rows)]
+                )
+            store = self.vector_store() if callable(self.vector_store) else self.vector_store
+            if store is not None and names:
+                embeddings = {name: row["embedding"] for name, row in first.items()}
+                store.put_many(names, [embeddings[name] for name in names])
+            self.written += len(batch)
+        except Exception as e:
+            # Learned rows are an optimisation; losing a batch only costs a future LLM call
+            self.failed += len(batch)
+            print(f"Write-back of {len(batch)} items failed: {e}")